@@ -2,6 +2,9 @@
 from flask import Flask, jsonify
 from flask_jwt_extended import JWTManager
 from flask_cors import CORS
+from db.pool import pool_stats
+from db.repository import cache_stats, get_repository
+from utils.password_hasher import get_hasher, hasher_stats
 import os
 import threading
 import webbrowser
@@ -29,15 +32,39 @@ from routes.files import files_bp  # ensure this is the blueprint name used in r
 app.register_blueprint(auth_bp, url_prefix="/auth")
 app.register_blueprint(files_bp, url_prefix="/files")
 
+# Fork the password-hashing workers while this is still the only thread
+get_hasher().start()
+
+
+@app.teardown_appcontext
+def release_db_connection(exc):
+    # Each request runs on a fresh thread; pass its SQLite connection on
+    get_repository().release_connection()
+
+
 @app.route("/health")
 def health():
     return jsonify({
         "status": "ok",
         "message": "CloudFileStorage API running",
-        "upload_folder": app.config["UPLOAD_FOLDER"]
+        "upload_folder": app.config["UPLOAD_FOLDER"],
+        "mysql_pool": pool_stats(),
+        "metadata_cache": cache_stats(),
+        "password_hashing": hasher_stats()
     }), 200
 
 
+@app.cli.command("compact-changes")
+def compact_changes():
+    """Compact file change logs that have grown (flask --app app compact-changes; run from cron)."""
+    from config import CHANGE_LOG_COMPACT_MIN_ROWS
+    from routes.files import repo, _tombstone_cutoff
+    cutoff = _tombstone_cutoff()
+    for user_id, log_rows, _ in repo.change_log_users(CHANGE_LOG_COMPACT_MIN_ROWS, cutoff):
+        result = repo.compact_changes(user_id, cutoff)
+        print(f"user {user_id}: {log_rows} -> {log_rows - result['dropped']} rows, floor {result['floor_seq']}")
+
+
 def open_browser():
     # optional: open test page or health
     import time
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+benchmarks/bench_login.py
+Login storm: many clients verifying passwords at once, while a probe
+measures how long ordinary requests take meanwhile.
+
+    python benchmarks/bench_login.py --clients 64 --logins 256
+    python benchmarks/bench_login.py --url http://127.0.0.1:5000 \\
+        --email a@b.c --password secret --clients 200 --logins 2000
+
+Without --url it drives utils/password_hasher.py directly: first inline
+(hashing on the caller's threads, as login used to), then through the
+process pool. The probe is a small pure-Python task standing in for an
+upload handler. With --url it POSTs /auth/login on a running server and
+probes GET /health.
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def storm(login, clients, logins, probe):
+    """Run `logins` calls of login() from `clients` threads; probe() meanwhile."""
+    results = {}
+    latencies = []
+    probe_latencies = []
+    lock = threading.Lock()
+    remaining = [logins]
+    done = threading.Event()
+
+    def client():
+        while True:
+            with lock:
+                if remaining[0] == 0:
+                    return
+                remaining[0] -= 1
+            started = time.perf_counter()
+            outcome = login()
+            elapsed = time.perf_counter() - started
+            with lock:
+                results[outcome] = results.get(outcome, 0) + 1
+                latencies.append(elapsed)
+
+    def prober():
+        while not done.is_set():
+            started = time.perf_counter()
+            probe()
+            probe_latencies.append(time.perf_counter() - started)
+            time.sleep(0.01)
+
+    probe_thread = threading.Thread(target=prober)
+    probe_thread.start()
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    done.set()
+    probe_thread.join()
+    return elapsed, results, latencies, probe_latencies
+
+
+def report(label, elapsed, results, latencies, probe_latencies):
+    ok = results.get("ok", 0)
+    print(f"{label:>8}: {ok / elapsed:8.1f} logins/sec  outcomes {results}")
+    print(f"{'':>10}login  p50 {percentile(latencies, 0.5) * 1000:8.1f} ms   "
+          f"p99 {percentile(latencies, 0.99) * 1000:8.1f} ms")
+    print(f"{'':>10}probe  p50 {percentile(probe_latencies, 0.5) * 1000:8.1f} ms   "
+          f"p99 {percentile(probe_latencies, 0.99) * 1000:8.1f} ms  ({len(probe_latencies)} samples)")
+
+
+# ---------------- In-process ----------------
+def run_local(args):
+    from config import PASSWORD_HASH_CONFIG
+    from utils.password_hasher import PasswordHasher, HashingBusyError
+
+    method = args.method or PASSWORD_HASH_CONFIG["method"]
+    stored = PasswordHasher(method, workers=0).hash("correct horse")
+
+    def probe():
+        # ~1 ms of pure-Python work, like parsing a request
+        sum(i * i for i in range(20000))
+
+    for label, workers in (("inline", 0), ("pool", args.workers or PASSWORD_HASH_CONFIG["workers"])):
+        max_pending = args.clients if workers == 0 else PASSWORD_HASH_CONFIG["max_pending"]
+        hasher = PasswordHasher(method, workers=workers, max_pending=max_pending,
+                                queue_timeout=PASSWORD_HASH_CONFIG["queue_timeout"])
+        hasher.verify(stored, "correct horse")   # start the workers outside the timing
+
+        def login():
+            try:
+                return "ok" if hasher.verify(stored, "correct horse")[0] else "rejected"
+            except HashingBusyError:
+                return "busy"
+
+        report(f"{label}[{workers}]", *storm(login, args.clients, args.logins, probe))
+        hasher.close()
+
+
+# ---------------- Against a running server ----------------
+def run_http(args):
+    body = json.dumps({"email": args.email, "password": args.password}).encode()
+
+    def login():
+        req = urllib.request.Request(f"{args.url}/auth/login", data=body,
+                                     headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(req, timeout=60) as r:
+                r.read()
+                return "ok"
+        except urllib.error.HTTPError as e:
+            return str(e.code)
+        except Exception as e:
+            return type(e).__name__
+
+    def probe():
+        try:
+            with urllib.request.urlopen(f"{args.url}/health", timeout=60) as r:
+                r.read()
+        except Exception:
+            pass
+
+    report("http", *storm(login, args.clients, args.logins, probe))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Login throughput benchmark")
+    parser.add_argument("--clients", type=int, default=32, help="concurrent logins")
+    parser.add_argument("--logins", type=int, default=128, help="total logins")
+    parser.add_argument("--workers", type=int, default=None, help="hashing processes (default: config)")
+    parser.add_argument("--method", default=None, help="werkzeug hash method (default: config)")
+    parser.add_argument("--url", default=None, help="benchmark a running server instead")
+    parser.add_argument("--email")
+    parser.add_argument("--password")
+    args = parser.parse_args()
+
+    if args.url:
+        if not args.email or not args.password:
+            parser.error("--url needs --email and --password of an existing user")
+        run_http(args)
+    else:
+        run_local(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+benchmarks/bench_repository.py
+Runs the same metadata workload against each FileRepository backend
+(db/repository.py): uploads, point lookups, paged listings, deletes.
+
+    python benchmarks/bench_repository.py --users 20 --files 200 --threads 8
+    python benchmarks/bench_repository.py --backends mysql   # MYSQL_* env
+    python benchmarks/bench_repository.py --backends sqlite,sqlite-cached
+
+Backends that can't be reached are reported and skipped. The MySQL run
+uses a scratch database (MYSQL_BENCH_DB, default cloud_storage_bench) so
+it never touches real rows.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+# ---------------- Workload ----------------
+def workload(repo, user_ids, files_per_user, run_id):
+    """Per user: insert files, 3 lookups each, page through, delete half."""
+    timings = {"insert": 0.0, "get": 0.0, "list": 0.0, "delete": 0.0}
+    for user_id in user_ids:
+        keys = [f"user_{user_id}/{run_id}-{i}.txt" for i in range(files_per_user)]
+
+        started = time.perf_counter()
+        for i, key in enumerate(keys):
+            repo.save_file_record(user_id, key.split("/", 1)[1], key, i, 1700000000 + i)
+        timings["insert"] += time.perf_counter() - started
+
+        started = time.perf_counter()
+        for key in keys:
+            for _ in range(3):
+                repo.get_file_record(key)
+        timings["get"] += time.perf_counter() - started
+
+        started = time.perf_counter()
+        after = None
+        while True:
+            _, after = repo.list_user_files_page(user_id, 50, after=after)
+            if after is None:
+                break
+        timings["list"] += time.perf_counter() - started
+
+        started = time.perf_counter()
+        for key in keys[::2]:
+            repo.delete_file_record(key)
+        repo.delete_file_records(keys[1::2])
+        timings["delete"] += time.perf_counter() - started
+    return timings
+
+
+def run(label, repo, users, files_per_user, threads):
+    run_id = f"{label}-{int(time.time())}"
+    chunks = [list(range(t, users, threads)) for t in range(threads)]
+    results = [None] * threads
+
+    def worker(t):
+        results[t] = workload(repo, chunks[t], files_per_user, run_id)
+
+    pool = [threading.Thread(target=worker, args=(t,)) for t in range(threads)]
+    started = time.perf_counter()
+    for th in pool:
+        th.start()
+    for th in pool:
+        th.join()
+    elapsed = time.perf_counter() - started
+
+    if any(r is None for r in results):
+        print(f"{label:>8}: a worker failed, see traceback above")
+        return None
+
+    files = users * files_per_user
+    ops = files * 5  # insert + 3 gets + delete per file (pages excluded)
+    print(f"{label:>8}: {ops} ops in {elapsed:.2f}s -> {ops / elapsed:,.0f} ops/sec")
+    for phase in ("insert", "get", "list", "delete"):
+        spent = sum(r[phase] for r in results)
+        print(f"{'':>10}{phase:<7} {spent / files * 1e6:8.1f} us/file (summed over threads)")
+    stats = getattr(getattr(repo, "cache", None), "stats", None)
+    if stats:
+        s = stats()
+        print(f"{'':>10}cache   {s['hits']} hits / {s['misses']} misses ({s['hit_ratio']:.1%})")
+    return ops / elapsed
+
+
+# ---------------- Backends ----------------
+_sqlite_dir = None
+
+
+def _sqlite_scratch():
+    # database.py creates cloudfiles.db in the cwd on import, so every
+    # SQLite run shares one scratch dir
+    global _sqlite_dir
+    if _sqlite_dir is None:
+        _sqlite_dir = tempfile.mkdtemp()
+        os.chdir(_sqlite_dir)
+
+
+def sqlite_repository():
+    _sqlite_scratch()
+    from db.repository import create_repository
+    return create_repository("sqlite")
+
+
+def sqlite_cached_repository():
+    _sqlite_scratch()
+    from config import METADATA_CACHE_TTL
+    from db.repository import create_repository
+    return create_repository("sqlite", cache_size=100000, cache_ttl=METADATA_CACHE_TTL)
+
+
+def mysql_repository():
+    import mysql.connector
+    from config import MYSQL_CONFIG, MYSQL_POOL_CONFIG
+    from db.pool import ConnectionPool
+    from db.mysql_repository import MySQLFileRepository
+
+    args = {k: v for k, v in MYSQL_CONFIG.items() if v is not None}
+    bench_db = os.getenv("MYSQL_BENCH_DB", "cloud_storage_bench")
+    server_args = {k: v for k, v in args.items() if k != "database"}
+    conn = mysql.connector.connect(**server_args)
+    conn.cursor().execute(f"CREATE DATABASE IF NOT EXISTS `{bench_db}`")
+    conn.close()
+
+    args["database"] = bench_db
+    return MySQLFileRepository(ConnectionPool(args, **MYSQL_POOL_CONFIG))
+
+
+BACKENDS = {"sqlite": sqlite_repository, "sqlite-cached": sqlite_cached_repository,
+            "mysql": mysql_repository}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="File metadata backend benchmark")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--files", type=int, default=200, help="files per user")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--backends", default="sqlite,mysql")
+    args = parser.parse_args()
+
+    for name in args.backends.split(","):
+        try:
+            repo = BACKENDS[name]()
+        except Exception as e:
+            print(f"{name:>8}: skipped ({e})")
+            continue
+        run(name, repo, args.users, args.files, args.threads)
+
+
+if __name__ == "__main__":
+    main()
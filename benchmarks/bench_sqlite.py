@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+benchmarks/bench_sqlite.py
+Micro-benchmark: connect-per-call SQLite (the old database.py behaviour,
+rollback journal) vs the pooled per-thread WAL connections in database.py,
+with and without group commit.
+
+    python benchmarks/bench_sqlite.py --ops 5000 --threads 4
+    SQLITE_SYNCHRONOUS=FULL python benchmarks/bench_sqlite.py --threads 32
+
+Group commit pays off when every commit is fsynced (synchronous=FULL, as
+its writer always uses) and many threads write at once.
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+# ---------------- Old behaviour: connect / execute / close ----------------
+def legacy_init(path):
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=DELETE")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS files (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            filename TEXT NOT NULL,
+            s3_key TEXT NOT NULL UNIQUE,
+            size INTEGER NOT NULL,
+            uploaded_at TEXT NOT NULL
+        )
+    """)
+    conn.commit()
+    conn.close()
+
+
+def legacy_save(path, user_id, filename, s3_key, size, uploaded_at):
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute("""
+        INSERT INTO files (user_id, filename, s3_key, size, uploaded_at)
+        VALUES (?, ?, ?, ?, ?)
+    """, (user_id, filename, s3_key, size, uploaded_at))
+    conn.commit()
+    conn.close()
+
+
+def legacy_get(path, s3_key):
+    conn = sqlite3.connect(path, timeout=30)
+    row = conn.execute("""
+        SELECT filename, user_id, size, uploaded_at
+        FROM files
+        WHERE s3_key = ?
+    """, (s3_key,)).fetchone()
+    conn.close()
+    return row
+
+
+# ---------------- Runner ----------------
+def run(label, save, get, ops, threads):
+    """Each op is one insert plus three point lookups (a typical mix)."""
+    per_thread = ops // threads
+
+    def worker(t):
+        for i in range(per_thread):
+            key = f"user_{t}/{label}-{i}"
+            save(t, f"{label}-{i}", key, i, "01 Jan 2025 00:00")
+            for _ in range(3):
+                get(key)
+
+    pool = [threading.Thread(target=worker, args=(t,)) for t in range(threads)]
+    started = time.perf_counter()
+    for th in pool:
+        th.start()
+    for th in pool:
+        th.join()
+    elapsed = time.perf_counter() - started
+
+    total = per_thread * threads
+    print(f"{label:>10}: {total} ops in {elapsed:.2f}s -> {total / elapsed:,.0f} ops/sec")
+    return total / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SQLite connection strategy benchmark")
+    parser.add_argument("--ops", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=4)
+    args = parser.parse_args()
+
+    # database.py creates cloudfiles.db on import; keep it out of the repo
+    tmp = tempfile.mkdtemp()
+    os.chdir(tmp)
+    import database
+
+    legacy_path = os.path.join(tmp, "legacy.db")
+    legacy_init(legacy_path)
+
+    legacy = run(
+        "legacy",
+        lambda *a: legacy_save(legacy_path, *a),
+        lambda k: legacy_get(legacy_path, k),
+        args.ops, args.threads,
+    )
+    pooled = run(
+        "pooled",
+        lambda u, f, k, s, t: database.save_file_record(u, f, k, s, t),
+        database.get_file_record,
+        args.ops, args.threads,
+    )
+    database.GROUP_COMMIT = True
+    grouped = run(
+        "grouped",
+        lambda u, f, k, s, t: database.save_file_record(u, f, k, s, t),
+        database.get_file_record,
+        args.ops, args.threads,
+    )
+    writer = database._group_writer
+    print(f"speedup: pooled {pooled / legacy:.1f}x, grouped {grouped / legacy:.1f}x "
+          f"({writer.writes / max(writer.commits, 1):.1f} rows/commit)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,7 @@
 # client/cli_app.py
 import argparse
 import os
+import time
 import requests
 from utils import BASE_URL, save_token, load_token, clear_token, get_auth_headers
 
@@ -30,11 +31,24 @@ def upload(path):
         res = requests.post(f"{BASE_URL}/files/upload", files={"file": f}, headers=get_auth_headers())
     print(res.status_code, res.json())
 
+def format_timestamp(value):
+    if isinstance(value, (int, float)):
+        return time.strftime("%d %b %Y %H:%M", time.localtime(value))
+    return value or ""
+
 def list_files():
-    res = requests.get(f"{BASE_URL}/files/list", headers=get_auth_headers())
-    if res.ok:
+    files = []
+    params = {}
+    while True:
+        res = requests.get(f"{BASE_URL}/files/list", headers=get_auth_headers(), params=params)
+        if not res.ok:
+            break
         data = res.json()
-        files = data.get("files", [])
+        files.extend(data.get("files", []))
+        if not data.get("next_cursor"):
+            break
+        params = {"cursor": data["next_cursor"]}
+    if res.ok:
         if not files:
             print("No files uploaded yet.")
             return
@@ -42,7 +56,7 @@ def list_files():
         print("-" * 80)
         for f in files:
             size_kb = f.get("size", 0) / 1024
-            print(f"{f.get('filename', ''):40} {size_kb:10.2f} {f.get('uploaded_at', '')}")
+            print(f"{f.get('filename', ''):40} {size_kb:10.2f} {format_timestamp(f.get('uploaded_at'))}")
     else:
         print("❌", res.status_code, res.json())
 
@@ -11,6 +11,7 @@ import sys
 import requests
 import getpass
 import json
+import time
 
 BASE_URL = "http://127.0.0.1:5000"
 TOKEN_PATH = os.path.join(os.path.dirname(__file__), ".token")
@@ -45,6 +46,13 @@ def auth_headers():
     return {"Authorization": f"Bearer {token}"}
 
 
+def format_timestamp(value) -> str:
+    """uploaded_at is epoch seconds (older servers sent a display string)."""
+    if isinstance(value, (int, float)):
+        return time.strftime("%d %b %Y %H:%M", time.localtime(value))
+    return value or ""
+
+
 # ---------------- API calls ----------------
 def api_login(email: str, password: str) -> bool:
     try:
@@ -69,7 +77,7 @@ def api_login(email: str, password: str) -> bool:
     return True
 
 
-def api_upload(filepath: str):
+def api_upload(filepath: str, folder: str | None = None):
     if not os.path.exists(filepath):
         print("❌ File not found:", filepath)
         return
@@ -80,7 +88,8 @@ def api_upload(filepath: str):
     try:
         with open(filepath, "rb") as f:
             files = {"file": (os.path.basename(filepath), f)}
-            r = requests.post(f"{BASE_URL}/files/upload", headers=headers, files=files)
+            params = {"folder": folder} if folder else {}
+            r = requests.post(f"{BASE_URL}/files/upload", headers=headers, files=files, params=params)
     except Exception as e:
         print("Network error:", e)
         return
@@ -97,36 +106,73 @@ def api_upload(filepath: str):
             print("❌ Upload failed:", r.status_code, r.text)
 
 
-def api_list():
+def api_list(query: str | None = None, mode: str = "substring"):
     headers = auth_headers()
     if not headers:
         print("❌ Not logged in.")
         return
-    try:
-        r = requests.get(f"{BASE_URL}/files/list", headers=headers)
-    except Exception as e:
-        print("Network error:", e)
-        return
-    if not r.ok:
+    # With a query the server does the filtering (/files/search)
+    url = f"{BASE_URL}/files/search" if query else f"{BASE_URL}/files/list"
+    base_params = {"q": query, "mode": mode} if query else {}
+    # The listing is paginated; follow next_cursor until the last page
+    files = []
+    params = dict(base_params)
+    while True:
         try:
-            print("❌ List failed:", r.json())
-        except Exception:
-            print("❌ List failed:", r.status_code, r.text)
-        return
-    files = r.json().get("files", [])
+            r = requests.get(url, headers=headers, params=params)
+        except Exception as e:
+            print("Network error:", e)
+            return
+        if not r.ok:
+            try:
+                print("❌ List failed:", r.json())
+            except Exception:
+                print("❌ List failed:", r.status_code, r.text)
+            return
+        data = r.json()
+        files.extend(data.get("files", []))
+        if not data.get("next_cursor"):
+            break
+        params = dict(base_params, cursor=data["next_cursor"])
     if not files:
-        print("No files uploaded yet.")
+        print("No matching files." if query else "No files uploaded yet.")
         return
     print("📁 Files in your account:")
     for i, f in enumerate(files, 1):
         fname = f.get("filename")
         s3 = f.get("s3_key")
         size = f.get("size")
-        uploaded = f.get("uploaded_at")
+        uploaded = format_timestamp(f.get("uploaded_at"))
         size_text = f"{size} bytes" if size is not None else "Unknown size"
         print(f" {i}. {fname} | Size: {size_text} | Uploaded: {uploaded} | S3 Key: {s3}")
 
 
+def api_stream_download(s3_key: str, out_path: str | None = None):
+    """Download through the API instead of S3 (for networks that can't reach S3)."""
+    headers = auth_headers()
+    if not headers:
+        print("❌ Not logged in.")
+        return
+    try:
+        r = requests.get(f"{BASE_URL}/files/download/stream", headers=headers,
+                         params={"s3_key": s3_key}, stream=True)
+    except Exception as e:
+        print("Network error:", e)
+        return
+    if not r.ok:
+        try:
+            print("❌ Download failed:", r.json())
+        except Exception:
+            print("❌ Download failed:", r.status_code, r.text)
+        return
+    out = out_path or os.path.basename(s3_key)
+    with open(out, "wb") as fd:
+        for chunk in r.iter_content(65536):
+            if chunk:
+                fd.write(chunk)
+    print("⬇️ Downloaded to", out)
+
+
 def api_get_presigned_and_download(s3_key: str, out_path: str | None = None):
     headers = auth_headers()
     if not headers:
@@ -143,13 +189,18 @@ def api_get_presigned_and_download(s3_key: str, out_path: str | None = None):
         except Exception:
             print("❌ Failed:", r.status_code, r.text)
         return
-    presigned = r.json().get("presigned_url")
-    if not presigned:
+    data = r.json()
+    presigned = data.get("presigned_url")
+    stream_url = data.get("stream_url")
+    if not presigned and not stream_url:
         print("❌ No presigned URL returned.")
         return
-    # download from presigned URL
+    # download from presigned URL (or through the API for encrypted files)
     try:
-        r2 = requests.get(presigned, stream=True)
+        if presigned:
+            r2 = requests.get(presigned, stream=True)
+        else:
+            r2 = requests.get(f"{BASE_URL}{stream_url}", headers=headers, stream=True)
     except Exception as e:
         print("Network error while downloading:", e)
         return
@@ -183,6 +234,102 @@ def api_delete(s3_key: str):
             print("❌ Delete failed:", r.status_code, r.text)
 
 
+def api_usage():
+    headers = auth_headers()
+    if not headers:
+        print("❌ Not logged in.")
+        return
+    try:
+        r = requests.get(f"{BASE_URL}/files/usage", headers=headers)
+    except Exception as e:
+        print("Network error:", e)
+        return
+    if not r.ok:
+        try:
+            print("❌ Usage failed:", r.json())
+        except Exception:
+            print("❌ Usage failed:", r.status_code, r.text)
+        return
+    data = r.json()
+    quota_bytes = data.get("quota_bytes")
+    quota_files = data.get("quota_files")
+    print(f"📊 Files: {data.get('file_count')}" + (f" / {quota_files}" if quota_files else ""))
+    print(f"   Bytes: {data.get('total_bytes')}" + (f" / {quota_bytes}" if quota_bytes else ""))
+
+
+# ---------------- Folders ----------------
+def api_mkdir(path: str):
+    headers = auth_headers()
+    if not headers:
+        print("❌ Not logged in.")
+        return
+    try:
+        r = requests.post(f"{BASE_URL}/files/folders", headers=headers, json={"path": path, "parents": True})
+    except Exception as e:
+        print("Network error:", e)
+        return
+    if r.ok:
+        print("✅ Folder ready:", r.json().get("path"))
+    else:
+        try:
+            print("❌ mkdir failed:", r.json())
+        except Exception:
+            print("❌ mkdir failed:", r.status_code, r.text)
+
+
+def api_ls(path: str = ""):
+    headers = auth_headers()
+    if not headers:
+        print("❌ Not logged in.")
+        return
+    folders, files = [], []
+    params = {"path": path}
+    while True:
+        try:
+            r = requests.get(f"{BASE_URL}/files/folders", headers=headers, params=params)
+        except Exception as e:
+            print("Network error:", e)
+            return
+        if not r.ok:
+            try:
+                print("❌ ls failed:", r.json())
+            except Exception:
+                print("❌ ls failed:", r.status_code, r.text)
+            return
+        data = r.json()
+        folders.extend(data.get("folders", []))
+        files.extend(data.get("files", []))
+        if not data.get("next_cursor"):
+            break
+        params = {"path": path, "cursor": data["next_cursor"]}
+    print(f"📂 /{path.strip('/')}")
+    for d in folders:
+        print(f"  {d['name']}/")
+    for f in files:
+        print(f"  {f['filename']} | {f['size']} bytes | {format_timestamp(f['uploaded_at'])} | {f['s3_key']}")
+
+
+def api_move(to: str, path: str | None = None, s3_key: str | None = None):
+    headers = auth_headers()
+    if not headers:
+        print("❌ Not logged in.")
+        return
+    body = {"to": to, "s3_key": s3_key} if s3_key else {"to": to, "path": path}
+    try:
+        r = requests.post(f"{BASE_URL}/files/move", headers=headers, json=body)
+    except Exception as e:
+        print("Network error:", e)
+        return
+    if r.ok:
+        data = r.json()
+        print("✅", data.get("message"), data.get("s3_key") or data.get("path"))
+    else:
+        try:
+            print("❌ Move failed:", r.json())
+        except Exception:
+            print("❌ Move failed:", r.status_code, r.text)
+
+
 # ---------------- Interactive Menu ----------------
 def interactive_menu():
     print("🔐 Welcome to SecureCloud CLI")
@@ -235,12 +382,32 @@ def main():
 
     p_upload = sub.add_parser("upload")
     p_upload.add_argument("--file", required=True)
+    p_upload.add_argument("--folder", required=False, help="destination folder path, e.g. docs/2024")
 
     sub.add_parser("list")
+    sub.add_parser("usage")
+
+    p_search = sub.add_parser("search")
+    p_search.add_argument("query")
+    p_search.add_argument("--mode", choices=["substring", "prefix", "token"], default="substring")
+
+    p_mkdir = sub.add_parser("mkdir")
+    p_mkdir.add_argument("path")
+
+    p_ls = sub.add_parser("ls")
+    p_ls.add_argument("path", nargs="?", default="")
+
+    p_mv = sub.add_parser("mv")
+    src = p_mv.add_mutually_exclusive_group(required=True)
+    src.add_argument("--path", help="folder to move")
+    src.add_argument("--s3_key", help="file to move")
+    p_mv.add_argument("--to", required=True, help="destination path including the new name")
 
     p_download = sub.add_parser("download")
     p_download.add_argument("--s3_key", required=True)
     p_download.add_argument("--out", required=False)
+    p_download.add_argument("--via-api", action="store_true",
+                            help="stream through the API instead of fetching from S3")
 
     p_delete = sub.add_parser("delete")
     p_delete.add_argument("--s3_key", required=True)
@@ -257,11 +424,24 @@ def main():
         clear_token()
         print("Logged out.")
     elif args.cmd == "upload":
-        api_upload(args.file)
+        api_upload(args.file, args.folder)
     elif args.cmd == "list":
         api_list()
+    elif args.cmd == "usage":
+        api_usage()
+    elif args.cmd == "search":
+        api_list(args.query, args.mode)
+    elif args.cmd == "mkdir":
+        api_mkdir(args.path)
+    elif args.cmd == "ls":
+        api_ls(args.path)
+    elif args.cmd == "mv":
+        api_move(args.to, path=args.path, s3_key=args.s3_key)
     elif args.cmd == "download":
-        api_get_presigned_and_download(args.s3_key, args.out)
+        if args.via_api:
+            api_stream_download(args.s3_key, args.out)
+        else:
+            api_get_presigned_and_download(args.s3_key, args.out)
     elif args.cmd == "delete":
         api_delete(args.s3_key)
     else:
@@ -8,6 +8,7 @@ Self-contained token helpers included.
 import sys
 import os
 import json
+import time
 import requests
 from PyQt5 import QtWidgets, QtCore
 
@@ -43,6 +44,13 @@ def auth_headers():
     return {"Authorization": f"Bearer {token}"}
 
 
+def format_timestamp(value) -> str:
+    """uploaded_at is epoch seconds (older servers sent a display string)."""
+    if isinstance(value, (int, float)):
+        return time.strftime("%d %b %Y %H:%M", time.localtime(value))
+    return value or ""
+
+
 # ---------------- GUI Windows ----------------
 class LoginWindow(QtWidgets.QWidget):
     def __init__(self):
@@ -124,8 +132,13 @@ class DashboardWindow(QtWidgets.QWidget):
         self.logout_btn = QtWidgets.QPushButton("Logout")
         self.logout_btn.clicked.connect(self.logout)
 
+        self.search_input = QtWidgets.QLineEdit()
+        self.search_input.setPlaceholderText("Search filenames...")
+        self.search_input.returnPressed.connect(self.load_files)
+
         toolbar.addWidget(self.upload_btn)
         toolbar.addWidget(self.refresh_btn)
+        toolbar.addWidget(self.search_input)
         toolbar.addStretch()
         toolbar.addWidget(self.logout_btn)
         v.addLayout(toolbar)
@@ -146,6 +159,11 @@ class DashboardWindow(QtWidgets.QWidget):
         action_layout.addStretch()
         v.addLayout(action_layout)
 
+        # Local copy of the listing, kept current from /files/changes
+        self._files = {}
+        self._since = 0
+        self._floor = 0
+
         QtCore.QTimer.singleShot(100, self.load_files)
 
     def ensure_logged(self):
@@ -179,19 +197,75 @@ class DashboardWindow(QtWidgets.QWidget):
     def load_files(self):
         if not self.ensure_logged():
             return
-        try:
-            r = requests.get(f"{BASE_URL}/files/list", headers=auth_headers())
-        except Exception as e:
-            QtWidgets.QMessageBox.critical(self, "Error", f"Network error: {e}")
+        # With a search term the server does the filtering (/files/search)
+        query = self.search_input.text().strip()
+        if not query:
+            if self.sync_files():
+                self.show_files(sorted(self._files.values(), key=lambda f: f.get("uploaded_at") or 0,
+                                       reverse=True))
             return
-        if not r.ok:
+        url = f"{BASE_URL}/files/search"
+        base_params = {"q": query}
+        # The listing is paginated; follow next_cursor until the last page
+        files = []
+        params = dict(base_params)
+        while True:
             try:
-                err = r.json().get("error", "Failed to fetch")
-            except Exception:
-                err = "Failed"
-            QtWidgets.QMessageBox.critical(self, "Error", err)
-            return
-        files = r.json().get("files", [])
+                r = requests.get(url, headers=auth_headers(), params=params)
+            except Exception as e:
+                QtWidgets.QMessageBox.critical(self, "Error", f"Network error: {e}")
+                return
+            if not r.ok:
+                try:
+                    err = r.json().get("error", "Failed to fetch")
+                except Exception:
+                    err = "Failed"
+                QtWidgets.QMessageBox.critical(self, "Error", err)
+                return
+            data = r.json()
+            files.extend(data.get("files", []))
+            if not data.get("next_cursor"):
+                break
+            params = dict(base_params, cursor=data["next_cursor"])
+        self.show_files(files)
+
+    def sync_files(self):
+        """Apply the changes since the last refresh to self._files (delta sync)."""
+        while True:
+            try:
+                r = requests.get(f"{BASE_URL}/files/changes", headers=auth_headers(),
+                                 params={"since": self._since, "floor": self._floor})
+            except Exception as e:
+                QtWidgets.QMessageBox.critical(self, "Error", f"Network error: {e}")
+                return False
+            if r.status_code == 410:
+                # Offline for too long: rebuild from the start of the log
+                self._files, self._since, self._floor = {}, 0, 0
+                continue
+            if not r.ok:
+                try:
+                    err = r.json().get("error", "Failed to fetch")
+                except Exception:
+                    err = "Failed"
+                QtWidgets.QMessageBox.critical(self, "Error", err)
+                return False
+            data = r.json()
+            for c in data.get("changes", []):
+                if c["op"].startswith("folder_"):
+                    # The table is a flat file list; folder entries don't show in it
+                    continue
+                if c["op"] == "delete":
+                    self._files.pop(c["s3_key"], None)
+                    continue
+                if c["op"] == "move":
+                    self._files.pop(c.get("old_s3_key"), None)
+                self._files[c["s3_key"]] = {k: c.get(k) for k in ("filename", "s3_key", "size", "uploaded_at")}
+            self._since = data.get("next_since", self._since)
+            self._floor = data.get("floor_seq", self._floor)
+            if not data.get("has_more"):
+                return True
+
+    def show_files(self, files):
         self.table.setRowCount(0)
         for f in files:
             row = self.table.rowCount()
@@ -199,7 +273,7 @@ class DashboardWindow(QtWidgets.QWidget):
             self.table.setItem(row, 0, QtWidgets.QTableWidgetItem(f.get("filename", "")))
             size_kb = round((f.get("size") or 0) / 1024, 2)
             self.table.setItem(row, 1, QtWidgets.QTableWidgetItem(str(size_kb)))
-            self.table.setItem(row, 2, QtWidgets.QTableWidgetItem(f.get("uploaded_at", "")))
+            self.table.setItem(row, 2, QtWidgets.QTableWidgetItem(format_timestamp(f.get("uploaded_at"))))
             self.table.setItem(row, 3, QtWidgets.QTableWidgetItem(f.get("s3_key", "")))
 
     def get_selected_row(self):
@@ -234,12 +308,17 @@ class DashboardWindow(QtWidgets.QWidget):
                 err = "Failed"
             QtWidgets.QMessageBox.critical(self, "Error", err)
             return
-        presigned = r.json().get("presigned_url")
-        if not presigned:
+        data = r.json()
+        presigned = data.get("presigned_url")
+        stream_url = data.get("stream_url")
+        if not presigned and not stream_url:
             QtWidgets.QMessageBox.critical(self, "Error", "No presigned URL returned.")
             return
         try:
-            r2 = requests.get(presigned, stream=True)
+            if presigned:
+                r2 = requests.get(presigned, stream=True)
+            else:
+                r2 = requests.get(f"{BASE_URL}{stream_url}", headers=auth_headers(), stream=True)
         except Exception as e:
             QtWidgets.QMessageBox.critical(self, "Error", f"Network error: {e}")
             return
@@ -13,6 +13,22 @@ MYSQL_CONFIG = {
     "auth_plugin": "mysql_native_password"
 }
 
+# ---------------- MySQL Connection Pool ----------------
+# Shared by the auth routes and db/db_connection.py (see db/pool.py).
+# Times are in seconds.
+MYSQL_POOL_CONFIG = {
+    "size": int(os.getenv("MYSQL_POOL_SIZE", "10")),
+    "acquire_timeout": float(os.getenv("MYSQL_POOL_TIMEOUT", "5")),
+    "ping_after": float(os.getenv("MYSQL_POOL_PING_AFTER", "30")),
+    "recycle": float(os.getenv("MYSQL_POOL_RECYCLE", "3600")),
+}
+
+# ---------------- File Metadata Backend ----------------
+# "sqlite": local cloudfiles.db, fine for a single API node.
+# "mysql": the shared MySQL database above, needed to run several API
+# nodes behind a load balancer (see db/repository.py).
+METADATA_BACKEND = os.getenv("METADATA_BACKEND", "sqlite").lower()
+
 # ---------------- AWS S3 Configuration ----------------
 AWS_CONFIG = {
     "aws_access_key_id": os.getenv("AWS_ACCESS_KEY_ID"),
@@ -21,6 +37,81 @@ AWS_CONFIG = {
     "bucket_name": os.getenv("AWS_BUCKET_NAME", "securecloud-file-storage-sahil")
 }
 
+# ---------------- S3 Transfer Configuration ----------------
+# Sizes are in MiB. S3 requires parts of at least 5 MiB (except the last)
+# and at most 10,000 parts per upload.
+S3_TRANSFER_CONFIG = {
+    "part_size": int(os.getenv("S3_PART_SIZE_MB", "16")) * 1024 * 1024,
+    "multipart_threshold": int(os.getenv("S3_MULTIPART_THRESHOLD_MB", "16")) * 1024 * 1024,
+    "max_concurrency": int(os.getenv("S3_MAX_CONCURRENCY", "8")),
+    "max_retries": int(os.getenv("S3_PART_RETRIES", "3")),
+}
+
+# ---------------- Encryption at rest ----------------
+# When on, /files/upload stores objects in the chunk-framed AES-GCM format
+# (utils/encryption_helper.py) and the API decrypts them while streaming.
+ENCRYPT_UPLOADS = os.getenv("ENCRYPT_UPLOADS", "false").lower() in ("1", "true", "yes")
+
+# ---------------- Compression ----------------
+# When on, /files/upload compresses content that sniffs as compressible
+# (zstd if installed, else zlib) before it is encrypted and sent to S3.
+COMPRESS_UPLOADS = os.getenv("COMPRESS_UPLOADS", "false").lower() in ("1", "true", "yes")
+
+# ---------------- Per-user quotas ----------------
+# 0 means unlimited. Uploads are rejected up front (413) from the
+# declared Content-Length, before any bytes go to S3.
+USER_QUOTA_BYTES = int(os.getenv("USER_QUOTA_MB", "0")) * 1024 * 1024
+USER_QUOTA_FILES = int(os.getenv("USER_QUOTA_FILES", "0"))
+
+# ---------------- Batch uploads ----------------
+BATCH_UPLOAD_CONCURRENCY = int(os.getenv("BATCH_UPLOAD_CONCURRENCY", "8"))
+MAX_BATCH_FILES = int(os.getenv("MAX_BATCH_FILES", "1000"))
+
+# ---------------- Listing ----------------
+LIST_PAGE_SIZE = int(os.getenv("LIST_PAGE_SIZE", "1000"))
+MAX_LIST_PAGE_SIZE = int(os.getenv("MAX_LIST_PAGE_SIZE", "5000"))
+
+# ---------------- Batch presign ----------------
+MAX_PRESIGN_BATCH = int(os.getenv("MAX_PRESIGN_BATCH", "1000"))
+
+# ---------------- ZIP downloads ----------------
+# How many S3 objects /files/download/zip opens ahead of the one it streams
+ZIP_READAHEAD = int(os.getenv("ZIP_READAHEAD", "4"))
+
+# ---------------- Metadata cache ----------------
+# In-process LRU for file records and listing pages (db/cache.py).
+# Off by default (0 entries). Invalidation only reaches the process that
+# made the write: with several worker processes or API nodes on one
+# database, the others keep serving a deleted or replaced record (and its
+# old blob_key) for up to the TTL. Only enable it for a single process,
+# or where that staleness is acceptable.
+METADATA_CACHE_SIZE = int(os.getenv("METADATA_CACHE_SIZE", "0"))
+METADATA_CACHE_TTL = float(os.getenv("METADATA_CACHE_TTL", "30"))
+
+# ---------------- Change feed ----------------
+CHANGES_PAGE_SIZE = int(os.getenv("CHANGES_PAGE_SIZE", "1000"))
+# `flask compact-changes` (run it from cron) compacts a user's log once
+# this many rows arrived since its last compaction, or a kept delete has
+# aged past CHANGE_TOMBSTONE_DAYS
+CHANGE_LOG_COMPACT_MIN_ROWS = int(os.getenv("CHANGE_LOG_COMPACT_MIN_ROWS", "1000"))
+# How long deletes stay in the log; a client that hasn't synced for
+# longer gets "reset" and re-reads the (compacted) log from seq 0
+CHANGE_TOMBSTONE_DAYS = int(os.getenv("CHANGE_TOMBSTONE_DAYS", "30"))
+
+# ---------------- Password hashing ----------------
+# signup/login hash in a pool of worker processes (utils/password_hasher.py),
+# forked when app.py starts.
+# method is werkzeug's: "scrypt:<N>:<r>:<p>" or "pbkdf2:<hash>:<iterations>";
+# changing it re-hashes each user's password at their next login.
+# At most max_pending hashes are queued or running; past that, requests
+# wait queue_timeout seconds and then get a 503.
+PASSWORD_HASH_CONFIG = {
+    "method": os.getenv("PASSWORD_HASH_METHOD", "scrypt:32768:8:1"),
+    "workers": int(os.getenv("PASSWORD_HASH_WORKERS", str(max(1, (os.cpu_count() or 2) // 2)))),
+    "max_pending": int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64")),
+    "queue_timeout": float(os.getenv("PASSWORD_HASH_QUEUE_TIMEOUT", "2")),
+}
+
 # Debug check
 if __name__ == "__main__":
     print("MySQL Config:", MYSQL_CONFIG)
@@ -1,63 +1,620 @@
 # database.py
 import sqlite3
 import os
+import time
+import threading
+import queue
+import atexit
+from concurrent.futures import Future
+from contextlib import contextmanager
+from db.common import (
+    LIST_COLUMNS, LIST_SORT_COLUMNS, SEARCH_MODES, CHANGE_COLUMNS, change_dict, folder_key, plan_compaction
+)
 
 DB_PATH = "cloudfiles.db"
 
+# Applied to every new connection. WAL lets readers run alongside the
+# single writer; NORMAL sync is safe under WAL (set SQLITE_SYNCHRONOUS=FULL
+# to also survive power loss on the last commits).
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    f"PRAGMA synchronous={os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')}",
+    "PRAGMA cache_size=-65536",       # 64 MiB page cache
+    "PRAGMA mmap_size=268435456",     # 256 MiB memory-mapped reads
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA busy_timeout=5000",
+)
+# Compiled statements kept per connection (sqlite3's statement LRU)
+STATEMENT_CACHE_SIZE = 256
+
+# Group commit: file-row inserts/deletes from all request threads are
+# handed to one writer thread and committed together, paying one fsync
+# per batch instead of one per upload. Callers still block until their
+# batch has committed (with synchronous=FULL) before reporting success.
+GROUP_COMMIT = os.getenv("SQLITE_GROUP_COMMIT", "false").lower() in ("1", "true", "yes")
+GROUP_COMMIT_MAX_ROWS = int(os.getenv("SQLITE_GROUP_COMMIT_MAX_ROWS", "256"))
+GROUP_COMMIT_MAX_DELAY_MS = float(os.getenv("SQLITE_GROUP_COMMIT_MAX_DELAY_MS", "2"))
+
+# Idle connections kept for the next thread once a request ends
+SQLITE_POOL_IDLE = int(os.getenv("SQLITE_POOL_IDLE", "8"))
+
+_local = threading.local()
+_idle = []              # (path, connection)
+_idle_lock = threading.Lock()
+
+
+# ---------------------------------------------------------
+# Connection manager: one connection per thread at a time.
+# The dev server starts a new thread per request, so a thread-local
+# alone would reconnect on every request; release_connection() hands
+# the connection back to a small idle pool when the request ends.
+# ---------------------------------------------------------
+def get_connection():
+    """
+    Return this thread's connection: the one it already holds, else an
+    idle one released by a finished request, else a new one. Reused
+    connections keep their pragmas and compiled statements. They run in
+    autocommit mode; writes go through transaction().
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is not None and _local.path == DB_PATH:
+        return conn
+    if conn is not None:
+        conn.close()
+
+    conn = _take_idle()
+    if conn is None:
+        # Not bound to the opening thread: pooled connections move between
+        # threads, but only one thread holds a connection at a time
+        conn = sqlite3.connect(DB_PATH, timeout=5, isolation_level=None,
+                               cached_statements=STATEMENT_CACHE_SIZE, check_same_thread=False)
+        for pragma in SQLITE_PRAGMAS:
+            conn.execute(pragma)
+
+    _local.conn = conn
+    _local.path = DB_PATH
+    return conn
+
+
+def _take_idle():
+    with _idle_lock:
+        while _idle:
+            path, conn = _idle.pop()
+            if path == DB_PATH:
+                return conn
+            conn.close()
+    return None
+
+
+def release_connection():
+    """
+    Give this thread's connection to the idle pool (called when a request
+    ends). Long-lived threads such as the group-commit writer keep theirs.
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        return
+    _local.conn = None
+    if conn.in_transaction:
+        conn.execute("ROLLBACK")
+    with _idle_lock:
+        if _local.path == DB_PATH and len(_idle) < SQLITE_POOL_IDLE:
+            _idle.append((_local.path, conn))
+            return
+    conn.close()
+
+
+def close_connection():
+    """Close this thread's connection (e.g. on worker shutdown)."""
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        conn.close()
+        _local.conn = None
+
+
+@contextmanager
+def transaction():
+    """
+    Write transaction on this thread's connection. BEGIN IMMEDIATE takes
+    the write lock up front, so concurrent writers queue on busy_timeout
+    instead of failing halfway through.
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        yield cursor
+        cursor.execute("COMMIT")
+    except BaseException:
+        if conn.in_transaction:
+            cursor.execute("ROLLBACK")
+        raise
+
+
+# ---------------------------------------------------------
+# Group-commit writer
+# ---------------------------------------------------------
+class GroupCommitWriter:
+    """
+    Background thread that runs queued write operations in shared
+    transactions. A batch closes after `max_rows` operations or
+    `max_delay` seconds from its first one, whichever comes first. Each
+    operation runs under its own SAVEPOINT, so a failing one (e.g. a
+    duplicate s3_key) is rolled back alone and its error is raised in the
+    submitting thread; the rest of the batch still commits.
+    """
+
+    def __init__(self, max_rows=GROUP_COMMIT_MAX_ROWS, max_delay=GROUP_COMMIT_MAX_DELAY_MS / 1000):
+        self.max_rows = max(max_rows, 1)
+        self.max_delay = max_delay
+        self.commits = 0
+        self.writes = 0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, op):
+        """Run op(cursor) in the next batch; blocks until it has committed."""
+        future = Future()
+        self._ensure_started()
+        self._queue.put((op, future))
+        return future.result()
+
+    def stop(self):
+        """Flush what is queued and stop the writer thread."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join()
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="sqlite-group-commit", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        # Acknowledged means on disk, even with SQLITE_SYNCHRONOUS=NORMAL
+        get_connection().execute("PRAGMA synchronous=FULL")
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    return
+                batch = [item]
+                deadline = time.monotonic() + self.max_delay
+                stopping = False
+                while len(batch) < self.max_rows:
+                    try:
+                        item = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        stopping = True
+                        break
+                    batch.append(item)
+                self._commit(batch)
+                if stopping:
+                    return
+        finally:
+            close_connection()
+
+    def _commit(self, batch):
+        outcomes = []
+        try:
+            with transaction() as cursor:
+                for op, future in batch:
+                    cursor.execute("SAVEPOINT op")
+                    try:
+                        outcomes.append((future, op(cursor), None))
+                        cursor.execute("RELEASE op")
+                    except Exception as e:
+                        cursor.execute("ROLLBACK TO op")
+                        cursor.execute("RELEASE op")
+                        outcomes.append((future, None, e))
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        self.commits += 1
+        self.writes += len(batch)
+        # Only now, after COMMIT, are the callers released
+        for future, result, error in outcomes:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+
+_group_writer = GroupCommitWriter()
+atexit.register(_group_writer.stop)
+
+
+def _write(op):
+    """Run op(cursor) in a write transaction, group-committed when enabled."""
+    if GROUP_COMMIT:
+        return _group_writer.submit(op)
+    with transaction() as cursor:
+        return op(cursor)
+
+
+# ---------------------------------------------------------
+# Add a column to an existing table (lightweight migration)
+# ---------------------------------------------------------
+def _ensure_column(cursor, table, column, ddl):
+    cursor.execute(f"PRAGMA table_info({table})")
+    if column not in [r[1] for r in cursor.fetchall()]:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}")
+
 
 # ---------------------------------------------------------
 # Create table if not exists
 # ---------------------------------------------------------
 def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+    with transaction() as cursor:
+        _create_tables(cursor)
+
+
+FILES_DDL = """
+    CREATE TABLE IF NOT EXISTS {name} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        filename TEXT NOT NULL,
+        s3_key TEXT NOT NULL UNIQUE,
+        size INTEGER NOT NULL,
+        uploaded_at INTEGER NOT NULL,
+        blob_key TEXT,
+        encryption TEXT,
+        codec TEXT,
+        folder_id INTEGER NOT NULL DEFAULT 0
+    )
+"""
+
+
+def _create_tables(cursor):
+    # uploaded_at is epoch seconds
+    cursor.execute(FILES_DDL.format(name="files"))
 
+    # Deduplicated content: files.blob_key points at a shared object
+    # stored under its content hash. NULL means the object lives at s3_key.
+    _ensure_column(cursor, "files", "blob_key", "TEXT")
+    # Stored format of the object; NULL means plaintext
+    _ensure_column(cursor, "files", "encryption", "TEXT")
+    # Compression codec applied before encryption; NULL means none
+    _ensure_column(cursor, "files", "codec", "TEXT")
+    # Containing virtual folder (folders.id); 0 is the user's root
+    _ensure_column(cursor, "files", "folder_id", "INTEGER NOT NULL DEFAULT 0")
+    _migrate_uploaded_at(cursor)
+
+    # Keyset pagination: every listing order is an index range scan
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_files_user_uploaded ON files (user_id, uploaded_at, id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_files_user_filename ON files (user_id, filename, id)")
+    # One name per folder; a directory listing is a range scan on this
+    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_files_user_folder ON files (user_id, folder_id, filename)")
+
+    # Virtual folders: parent_id links (0 = root), no stored paths, so a
+    # move or rename is a single-row update however big the subtree is
     cursor.execute("""
-        CREATE TABLE IF NOT EXISTS files (
+        CREATE TABLE IF NOT EXISTS folders (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             user_id INTEGER NOT NULL,
+            parent_id INTEGER NOT NULL DEFAULT 0,
+            name TEXT NOT NULL,
+            created_at INTEGER NOT NULL,
+            UNIQUE (user_id, parent_id, name)
+        )
+    """)
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS blobs (
+            blob_key TEXT PRIMARY KEY,
+            content_hash TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            ref_count INTEGER NOT NULL
+        )
+    """)
+
+    # Resumable uploads: one row per in-progress S3 multipart upload
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS upload_sessions (
+            upload_id TEXT PRIMARY KEY,
+            user_id INTEGER NOT NULL,
             filename TEXT NOT NULL,
-            s3_key TEXT NOT NULL UNIQUE,
+            s3_key TEXT NOT NULL,
+            s3_upload_id TEXT NOT NULL,
+            part_size INTEGER NOT NULL,
+            created_at TEXT NOT NULL
+        )
+    """)
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS upload_parts (
+            upload_id TEXT NOT NULL,
+            part_number INTEGER NOT NULL,
+            etag TEXT NOT NULL,
             size INTEGER NOT NULL,
-            uploaded_at TEXT NOT NULL
+            PRIMARY KEY (upload_id, part_number)
         )
     """)
+    # One in-progress upload per key: a second session completing after the
+    # first would overwrite its object. Duplicates left by older versions
+    # keep only their newest session.
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_upload_sessions_s3_key'")
+    if cursor.fetchone() is None:
+        cursor.execute("""
+            DELETE FROM upload_sessions
+            WHERE rowid NOT IN (SELECT MAX(rowid) FROM upload_sessions GROUP BY s3_key)
+        """)
+        cursor.execute("DELETE FROM upload_parts WHERE upload_id NOT IN (SELECT upload_id FROM upload_sessions)")
+        cursor.execute("CREATE UNIQUE INDEX idx_upload_sessions_s3_key ON upload_sessions (s3_key)")
 
-    conn.commit()
-    conn.close()
+    # Per-user totals, kept in step with files by every insert/delete so
+    # usage and quota checks are one primary-key read
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'user_usage'")
+    backfill = cursor.fetchone() is None
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS user_usage (
+            user_id INTEGER PRIMARY KEY,
+            file_count INTEGER NOT NULL DEFAULT 0,
+            total_bytes INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    if backfill:
+        cursor.execute("""
+            INSERT INTO user_usage (user_id, file_count, total_bytes)
+            SELECT user_id, COUNT(*), SUM(size) FROM files GROUP BY user_id
+        """)
+
+    _create_change_log(cursor)
+    _create_search_index(cursor)
+
+
+# ---------------------------------------------------------
+# Change log: every create/delete/move of a file or folder, per user
+# ---------------------------------------------------------
+# file_changes is keyed (user_id, seq), so "changes since N" is a range
+# scan that costs the number of changes, not the number of files.
+# change_seq holds each user's last seq (seqs are never reused, even
+# after compaction), the floor below which deletes were compacted away,
+# the log's row count, and what the last compaction left behind (its row
+# count and oldest kept tombstone), so compact-changes skips logs where
+# it would drop nothing.
+def _create_change_log(cursor):
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'file_changes'")
+    backfill = cursor.fetchone() is None
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS file_changes (
+            user_id INTEGER NOT NULL,
+            seq INTEGER NOT NULL,
+            op TEXT NOT NULL,
+            s3_key TEXT NOT NULL,
+            old_s3_key TEXT,
+            filename TEXT,
+            size INTEGER,
+            uploaded_at INTEGER,
+            folder_id INTEGER,
+            changed_at INTEGER NOT NULL,
+            PRIMARY KEY (user_id, seq)
+        ) WITHOUT ROWID
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS change_seq (
+            user_id INTEGER PRIMARY KEY,
+            last_seq INTEGER NOT NULL DEFAULT 0,
+            floor_seq INTEGER NOT NULL DEFAULT 0,
+            log_rows INTEGER NOT NULL DEFAULT 0,
+            compacted_rows INTEGER NOT NULL DEFAULT 0,
+            tombstone_at INTEGER
+        )
+    """)
+    # Compaction bookkeeping added after change_seq first shipped
+    _ensure_column(cursor, "change_seq", "compacted_rows", "INTEGER NOT NULL DEFAULT 0")
+    _ensure_column(cursor, "change_seq", "tombstone_at", "INTEGER")
+    if backfill:
+        # Existing folders, then files, become the log's starting point
+        cursor.execute("""
+            INSERT INTO file_changes (user_id, seq, op, s3_key, filename, size, uploaded_at, folder_id,
+                                      changed_at)
+            SELECT user_id, ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY kind, id), op, s3_key,
+                   filename, size, uploaded_at, folder_id, changed_at
+            FROM (
+                SELECT 0 AS kind, id, user_id, 'folder_create' AS op,
+                       'user_' || user_id || '/d' || id || '/' AS s3_key, name AS filename,
+                       NULL AS size, NULL AS uploaded_at, parent_id AS folder_id, created_at AS changed_at
+                FROM folders
+                UNION ALL
+                SELECT 1, id, user_id, 'create', s3_key, filename, size, uploaded_at, folder_id, uploaded_at
+                FROM files
+            )
+        """)
+        cursor.execute("""
+            INSERT INTO change_seq (user_id, last_seq, floor_seq, log_rows)
+            SELECT user_id, COUNT(*), 0, COUNT(*) FROM file_changes GROUP BY user_id
+        """)
+
+
+def _log_change(cursor, user_id, op, s3_key, old_s3_key=None, filename=None, size=None,
+                uploaded_at=None, folder_id=None):
+    cursor.execute("""
+        INSERT INTO change_seq (user_id, last_seq, log_rows)
+        VALUES (?, 1, 1)
+        ON CONFLICT(user_id) DO UPDATE SET last_seq = last_seq + 1, log_rows = log_rows + 1
+    """, (user_id,))
+    cursor.execute("SELECT last_seq FROM change_seq WHERE user_id = ?", (user_id,))
+    cursor.execute("""
+        INSERT INTO file_changes (user_id, seq, op, s3_key, old_s3_key, filename, size, uploaded_at,
+                                  folder_id, changed_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, (user_id, cursor.fetchone()[0], op, s3_key, old_s3_key, filename, size, uploaded_at, folder_id,
+          int(time.time())))
+
+
+# ---------------------------------------------------------
+# Filename search: FTS5 indexes over files.filename
+# ---------------------------------------------------------
+# files_fts_trigram answers substring queries, files_fts_words whole-word
+# (and word-prefix) queries. Both are external-content tables: they hold
+# only the index, and triggers keep them in step with files inside the
+# same transaction as the insert/delete/rename.
+SEARCH_INDEXES = {
+    "files_fts_trigram": "trigram",
+    "files_fts_words": "unicode61 remove_diacritics 2",
+}
+
+
+def _create_search_index(cursor):
+    for table, tokenizer in SEARCH_INDEXES.items():
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (table,))
+        if cursor.fetchone():
+            continue
+        cursor.execute(f"""
+            CREATE VIRTUAL TABLE {table} USING fts5(
+                filename, content='files', content_rowid='id', tokenize='{tokenizer}'
+            )
+        """)
+        # Index the rows that are already there
+        cursor.execute(f"INSERT INTO {table} ({table}) VALUES ('rebuild')")
+
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_ai AFTER INSERT ON files BEGIN
+                INSERT INTO {table} (rowid, filename) VALUES (new.id, new.filename);
+            END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_ad AFTER DELETE ON files BEGIN
+                INSERT INTO {table} ({table}, rowid, filename) VALUES ('delete', old.id, old.filename);
+            END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_au AFTER UPDATE OF filename ON files BEGIN
+                INSERT INTO {table} ({table}, rowid, filename) VALUES ('delete', old.id, old.filename);
+                INSERT INTO {table} (rowid, filename) VALUES (new.id, new.filename);
+            END
+        """)
+
+
+# ---------------------------------------------------------
+# Migration: uploaded_at "%d %b %Y %H:%M" text -> epoch seconds
+# ---------------------------------------------------------
+def _legacy_timestamp(value):
+    if value is None:
+        return 0
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        pass
+    try:
+        return int(time.mktime(time.strptime(value, "%d %b %Y %H:%M")))
+    except ValueError:
+        return 0
+
+
+def _migrate_uploaded_at(cursor):
+    """SQLite can't change a column's type in place, so rebuild files."""
+    cursor.execute("PRAGMA table_info(files)")
+    columns = {r[1]: r[2].upper() for r in cursor.fetchall()}
+    if columns.get("uploaded_at") != "TEXT":
+        return
+
+    cursor.connection.create_function("legacy_timestamp", 1, _legacy_timestamp)
+    cursor.execute(FILES_DDL.format(name="files_migrated"))
+    cursor.execute("""
+        INSERT INTO files_migrated
+            (id, user_id, filename, s3_key, size, uploaded_at, blob_key, encryption, codec, folder_id)
+        SELECT id, user_id, filename, s3_key, size, legacy_timestamp(uploaded_at),
+               blob_key, encryption, codec, folder_id
+        FROM files
+    """)
+    cursor.execute("DROP TABLE files")
+    cursor.execute("ALTER TABLE files_migrated RENAME TO files")
 
 
 # ---------------------------------------------------------
 # Save a file record
 # ---------------------------------------------------------
-def save_file_record(user_id, filename, s3_key, size, uploaded_at):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+def _insert_file(cursor, user_id, filename, s3_key, size, uploaded_at, blob_key=None,
+                 content_hash=None, encryption=None, codec=None, folder_id=0, blob_acquired=False):
+    cursor.execute("""
+        INSERT INTO files (user_id, filename, s3_key, size, uploaded_at, blob_key, encryption, codec,
+                           folder_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, (user_id, filename, s3_key, size, uploaded_at, blob_key, encryption, codec, folder_id))
+
+    if blob_key and not blob_acquired:
+        cursor.execute("""
+            INSERT INTO blobs (blob_key, content_hash, size, ref_count)
+            VALUES (?, ?, ?, 1)
+            ON CONFLICT(blob_key) DO UPDATE SET ref_count = ref_count + 1
+        """, (blob_key, content_hash, size))
+
+    _add_usage(cursor, user_id, 1, size)
+    _log_change(cursor, user_id, "create", s3_key, filename=filename, size=size,
+                uploaded_at=uploaded_at, folder_id=folder_id)
 
+
+def _add_usage(cursor, user_id, files, size):
     cursor.execute("""
-        INSERT INTO files (user_id, filename, s3_key, size, uploaded_at)
-        VALUES (?, ?, ?, ?, ?)
-    """, (user_id, filename, s3_key, size, uploaded_at))
+        INSERT INTO user_usage (user_id, file_count, total_bytes)
+        VALUES (?, ?, ?)
+        ON CONFLICT(user_id) DO UPDATE SET
+            file_count = file_count + excluded.file_count,
+            total_bytes = total_bytes + excluded.total_bytes
+    """, (user_id, files, size))
+
+
+def save_file_record(user_id, filename, s3_key, size, uploaded_at, blob_key=None, content_hash=None,
+                     encryption=None, codec=None, folder_id=0, blob_acquired=False):
+    """
+    Insert a file row. When `blob_key` is given the row references a
+    deduplicated blob, whose ref_count is bumped in the same transaction
+    (unless `blob_acquired`: the reference was already taken by
+    acquire_blob()).
+    """
+    _write(lambda cursor: _insert_file(cursor, user_id, filename, s3_key, size, uploaded_at,
+                                       blob_key, content_hash, encryption, codec, folder_id,
+                                       blob_acquired))
 
-    conn.commit()
-    conn.close()
+
+def save_file_records(records):
+    """
+    Insert many file rows (dicts of save_file_record's arguments) in one
+    transaction. Each row gets its own savepoint, so one bad row (e.g. a
+    duplicate s3_key) doesn't sink the batch. Returns one error string or
+    None per record, in order.
+    """
+    def insert_all(cursor):
+        errors = []
+        for record in records:
+            cursor.execute("SAVEPOINT row")
+            try:
+                _insert_file(cursor, **record)
+                cursor.execute("RELEASE row")
+                errors.append(None)
+            except sqlite3.IntegrityError as e:
+                cursor.execute("ROLLBACK TO row")
+                cursor.execute("RELEASE row")
+                errors.append(str(e))
+        return errors
+
+    return _write(insert_all)
 
 
 # ---------------------------------------------------------
 # List all files for a user
 # ---------------------------------------------------------
 def list_user_files(user_id):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+    cursor = get_connection().cursor()
 
     cursor.execute("""
         SELECT filename, s3_key, size, uploaded_at
         FROM files
         WHERE user_id = ?
+        ORDER BY uploaded_at, id
     """, (user_id,))
 
     rows = cursor.fetchall()
-    conn.close()
 
     files = []
     for r in rows:
@@ -70,34 +627,750 @@ def list_user_files(user_id):
     return files
 
 
+# ---------------------------------------------------------
+# One page of a user's files (keyset pagination)
+# ---------------------------------------------------------
+def _list_filters(user_id, sort, order, since=None, until=None, name_prefix=None):
+    if sort not in LIST_SORT_COLUMNS:
+        raise ValueError(f"sort must be one of {', '.join(LIST_SORT_COLUMNS)}")
+    if order not in ("asc", "desc"):
+        raise ValueError("order must be asc or desc")
+
+    where = ["user_id = ?"]
+    params = [user_id]
+    if since is not None:
+        where.append("uploaded_at >= ?")
+        params.append(since)
+    if until is not None:
+        where.append("uploaded_at < ?")
+        params.append(until)
+    if name_prefix:
+        where.append("filename >= ? AND filename < ?")
+        params.extend([name_prefix, name_prefix + "\U0010ffff"])
+    return where, params
+
+
+def list_user_files_page(user_id, limit, after=None, sort="uploaded_at", order="desc",
+                         since=None, until=None, name_prefix=None):
+    """
+    Up to `limit` files ordered by (sort, id). `after` is the (sort value,
+    id) of the last row of the previous page; the query seeks straight to
+    it on the (user_id, sort, id) index instead of OFFSET-scanning.
+    Returns (files, last) where `last` is the key to pass as `after` for
+    the next page, or None when there are no more rows.
+    """
+    where, params = _list_filters(user_id, sort, order, since, until, name_prefix)
+    if after is not None:
+        where.append(f"({sort}, id) {'<' if order == 'desc' else '>'} (?, ?)")
+        params.extend(after)
+
+    cursor = get_connection().cursor()
+    cursor.execute(f"""
+        SELECT filename, s3_key, size, uploaded_at, id
+        FROM files
+        WHERE {" AND ".join(where)}
+        ORDER BY {sort} {order}, id {order}
+        LIMIT ?
+    """, params + [limit + 1])
+    rows = cursor.fetchall()
+
+    more = len(rows) > limit
+    rows = rows[:limit]
+    files = [{
+        "filename": r[0],
+        "s3_key": r[1],
+        "size": r[2],
+        "uploaded_at": r[3]
+    } for r in rows]
+
+    last = None
+    if more:
+        r = rows[-1]
+        last = (r[0] if sort == "filename" else r[3], r[4])
+    return files, last
+
+
+# ---------------------------------------------------------
+# Stream all of a user's files as tuples (for large exports)
+# ---------------------------------------------------------
+def iter_user_files(user_id, sort="uploaded_at", order="desc", since=None, until=None,
+                    name_prefix=None, batch_size=500):
+    """
+    Generator over LIST_COLUMNS tuples, fetched `batch_size` rows at a
+    time from one open cursor, so memory doesn't grow with the listing.
+    Filters are validated up front (ValueError) before the first row.
+    """
+    where, params = _list_filters(user_id, sort, order, since, until, name_prefix)
+    cursor = get_connection().cursor()
+    cursor.execute(f"""
+        SELECT {", ".join(LIST_COLUMNS)}
+        FROM files
+        WHERE {" AND ".join(where)}
+        ORDER BY {sort} {order}, id {order}
+    """, params)
+    return _drain_cursor(cursor, batch_size)
+
+
+def _drain_cursor(cursor, batch_size):
+    try:
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield from rows
+    finally:
+        cursor.close()
+
+
+# ---------------------------------------------------------
+# Search a user's files by name
+# ---------------------------------------------------------
+def _fts_phrase(term):
+    return '"' + term.replace('"', '""') + '"'
+
+
+def search_user_files(user_id, query, mode="substring", limit=50, after=None):
+    """
+    Up to `limit` of the user's files whose name matches `query`, ordered
+    by (filename, id) with the same keyset paging as list_user_files_page.
+
+      substring  name contains query (trigram index; queries under 3
+                 characters fall back to a LIKE over the user's rows)
+      prefix     name starts with query (range scan on the filename index)
+      token      every word in query is a word of the name; "rep*"
+                 matches words starting with "rep"
+    """
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"mode must be one of {', '.join(SEARCH_MODES)}")
+    query = query.strip()
+    if not query:
+        raise ValueError("Missing search query")
+
+    where = ["f.user_id = ?"]
+    params = [user_id]
+    if mode == "prefix":
+        where.append("f.filename >= ? AND f.filename < ?")
+        params.extend([query, query + "\U0010ffff"])
+    elif mode == "substring" and len(query) < 3:
+        escaped = query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        where.append("f.filename LIKE ? ESCAPE '\\'")
+        params.append(f"%{escaped}%")
+    elif mode == "substring":
+        where.append("f.id IN (SELECT rowid FROM files_fts_trigram WHERE files_fts_trigram MATCH ?)")
+        params.append(_fts_phrase(query))
+    else:
+        terms = []
+        for word in query.split():
+            if word.endswith("*") and len(word) > 1:
+                terms.append(_fts_phrase(word[:-1]) + "*")
+            else:
+                terms.append(_fts_phrase(word))
+        where.append("f.id IN (SELECT rowid FROM files_fts_words WHERE files_fts_words MATCH ?)")
+        params.append(" AND ".join(terms))
+    if after is not None:
+        where.append("(f.filename, f.id) > (?, ?)")
+        params.extend(after)
+
+    cursor = get_connection().cursor()
+    cursor.execute(f"""
+        SELECT f.filename, f.s3_key, f.size, f.uploaded_at, f.id
+        FROM files f
+        WHERE {" AND ".join(where)}
+        ORDER BY f.filename, f.id
+        LIMIT ?
+    """, params + [limit + 1])
+    rows = cursor.fetchall()
+
+    more = len(rows) > limit
+    rows = rows[:limit]
+    files = [{
+        "filename": r[0],
+        "s3_key": r[1],
+        "size": r[2],
+        "uploaded_at": r[3]
+    } for r in rows]
+    return files, (rows[-1][0], rows[-1][4]) if more else None
+
+
 # ---------------------------------------------------------
 # Get file record by S3 key
 # ---------------------------------------------------------
 def get_file_record(s3_key):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+    cursor = get_connection().cursor()
 
     cursor.execute("""
-        SELECT filename, user_id, size, uploaded_at
+        SELECT filename, user_id, size, uploaded_at, blob_key, encryption, codec
         FROM files
         WHERE s3_key = ?
     """, (s3_key,))
 
     result = cursor.fetchone()
-    conn.close()
     return result
 
 
+# ---------------------------------------------------------
+# Which of these S3 keys already have a record (one query)
+# ---------------------------------------------------------
+def get_existing_s3_keys(s3_keys):
+    s3_keys = list(s3_keys)
+    if not s3_keys:
+        return set()
+
+    cursor = get_connection().cursor()
+
+    found = set()
+    # Stay under SQLite's bound-parameter limit
+    for i in range(0, len(s3_keys), 500):
+        batch = s3_keys[i:i + 500]
+        cursor.execute(f"""
+            SELECT s3_key FROM files
+            WHERE s3_key IN ({",".join("?" * len(batch))})
+        """, batch)
+        found.update(r[0] for r in cursor.fetchall())
+
+    return found
+
+
 # ---------------------------------------------------------
 # Delete record by S3 key
 # ---------------------------------------------------------
 def delete_file_record(s3_key):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+    """
+    Delete the row and drop its blob reference. Returns the blob key whose
+    last reference just went away (the caller deletes it from S3), or None.
+    """
+    def delete(cursor):
+        cursor.execute("SELECT blob_key, user_id, size FROM files WHERE s3_key = ?", (s3_key,))
+        row = cursor.fetchone()
+        if not row:
+            return None
+        cursor.execute("DELETE FROM files WHERE s3_key = ?", (s3_key,))
+        _add_usage(cursor, row[1], -1, -row[2])
+        _log_change(cursor, row[1], "delete", s3_key)
 
-    cursor.execute("DELETE FROM files WHERE s3_key = ?", (s3_key,))
-    conn.commit()
-    conn.close()
+        if row[0]:
+            return _release_blob(cursor, row[0])
+        return None
+
+    return _write(delete)
+
+
+# ---------------------------------------------------------
+# Bulk delete: resolve targets, then drop them in one transaction
+# ---------------------------------------------------------
+def _select_user_files(cursor, columns, user_id, s3_keys=None, prefix=None, limit=-1):
+    """Rows of `columns` for the user's files matching a key list or prefix."""
+    if prefix is not None:
+        # Every key starting with prefix sorts in [prefix, prefix + U+10FFFF)
+        cursor.execute(f"""
+            SELECT {columns} FROM files
+            WHERE user_id = ? AND s3_key >= ? AND s3_key < ?
+            ORDER BY s3_key
+            LIMIT ?
+        """, (user_id, prefix, prefix + "\U0010ffff", limit))
+        return cursor.fetchall()
+
+    rows = []
+    s3_keys = list(s3_keys or [])
+    for i in range(0, len(s3_keys), 500):
+        batch = s3_keys[i:i + 500]
+        cursor.execute(f"""
+            SELECT {columns} FROM files
+            WHERE user_id = ? AND s3_key IN ({",".join("?" * len(batch))})
+        """, [user_id] + batch)
+        rows.extend(cursor.fetchall())
+    return rows
+
+
+def find_user_file_keys(user_id, s3_keys=None, prefix=None):
+    """
+    (s3_key, blob_key) for the user's rows matching an explicit key list
+    or a key prefix. Prefix lookups are a range scan on the s3_key index.
+    """
+    cursor = get_connection().cursor()
+    rows = _select_user_files(cursor, "s3_key, blob_key", user_id, s3_keys, prefix)
+    return rows
+
+
+def get_user_file_records(user_id, s3_keys=None, prefix=None, limit=-1):
+    """
+    Full records (dicts) for the user's files matching a key list or
+    prefix. `limit` caps prefix lookups (-1 means no limit).
+    """
+    cursor = get_connection().cursor()
+    rows = _select_user_files(
+        cursor, "filename, s3_key, size, uploaded_at, blob_key, encryption, codec",
+        user_id, s3_keys, prefix, limit)
+
+    return [{
+        "filename": r[0],
+        "s3_key": r[1],
+        "size": r[2],
+        "uploaded_at": r[3],
+        "blob_key": r[4],
+        "encryption": r[5],
+        "codec": r[6]
+    } for r in rows]
+
+
+def delete_file_records(s3_keys):
+    """
+    Delete many rows and their blob references in one transaction.
+    Returns the blob keys whose last reference went away.
+    """
+    s3_keys = list(s3_keys)
+    if not s3_keys:
+        return []
+
+    def delete_all(cursor):
+        released = {}
+        usage = {}
+        deleted = []
+        for i in range(0, len(s3_keys), 500):
+            batch = s3_keys[i:i + 500]
+            cursor.execute(f"""
+                SELECT blob_key, user_id, size, s3_key FROM files
+                WHERE s3_key IN ({",".join("?" * len(batch))})
+            """, batch)
+            for blob_key, user_id, size, s3_key in cursor.fetchall():
+                if blob_key:
+                    released[blob_key] = released.get(blob_key, 0) + 1
+                files, total = usage.get(user_id, (0, 0))
+                usage[user_id] = (files + 1, total + size)
+                deleted.append((user_id, s3_key))
+
+        cursor.executemany("DELETE FROM files WHERE s3_key = ?", [(k,) for k in s3_keys])
+        for user_id, (files, total) in usage.items():
+            _add_usage(cursor, user_id, -files, -total)
+        for user_id, s3_key in deleted:
+            _log_change(cursor, user_id, "delete", s3_key)
+
+        orphans = []
+        for blob_key, count in released.items():
+            cursor.execute("UPDATE blobs SET ref_count = ref_count - ? WHERE blob_key = ?", (count, blob_key))
+            cursor.execute("DELETE FROM blobs WHERE blob_key = ? AND ref_count <= 0", (blob_key,))
+            if cursor.rowcount:
+                orphans.append(blob_key)
+
+        return orphans
+
+    return _write(delete_all)
+
+
+def _release_blob(cursor, blob_key):
+    cursor.execute("UPDATE blobs SET ref_count = ref_count - 1 WHERE blob_key = ?", (blob_key,))
+    cursor.execute("DELETE FROM blobs WHERE blob_key = ? AND ref_count <= 0", (blob_key,))
+    return blob_key if cursor.rowcount else None
+
+
+# ---------------------------------------------------------
+# Deduplicated blobs
+# ---------------------------------------------------------
+def get_blob(blob_key):
+    cursor = get_connection().cursor()
+
+    cursor.execute("""
+        SELECT blob_key, content_hash, size, ref_count
+        FROM blobs
+        WHERE blob_key = ?
+    """, (blob_key,))
+
+    row = cursor.fetchone()
+
+    if not row:
+        return None
+    return {"blob_key": row[0], "content_hash": row[1], "size": row[2], "ref_count": row[3]}
+
+
+def acquire_blob(blob_key):
+    """
+    Take a reference to an existing blob before its upload is skipped.
+    Done in a write transaction, so a concurrent delete can't drop the
+    last reference (and the S3 object) between this check and the file
+    row's insert. Returns False if there is no such blob; the caller
+    uploads it and lets save_file_record create the row.
+    """
+    def acquire(cursor):
+        cursor.execute("UPDATE blobs SET ref_count = ref_count + 1 WHERE blob_key = ?", (blob_key,))
+        return cursor.rowcount > 0
+
+    return _write(acquire)
+
+
+def release_blob(blob_key):
+    """Give back an acquire_blob() reference; returns the blob key if it was the last one."""
+    return _write(lambda cursor: _release_blob(cursor, blob_key))
+
+
+# ---------------------------------------------------------
+# Virtual folders
+# ---------------------------------------------------------
+def _folder_dict(row):
+    return {"id": row[0], "parent_id": row[1], "name": row[2], "created_at": row[3]}
+
+
+def create_folder(user_id, parent_id, name, created_at):
+    """Insert a folder and return its id (IntegrityError if the name is taken)."""
+    def insert(cursor):
+        cursor.execute("""
+            INSERT INTO folders (user_id, parent_id, name, created_at)
+            VALUES (?, ?, ?, ?)
+        """, (user_id, parent_id, name, created_at))
+        folder_id = cursor.lastrowid
+        _log_change(cursor, user_id, "folder_create", folder_key(user_id, folder_id), filename=name,
+                    folder_id=parent_id)
+        return folder_id
+
+    return _write(insert)
+
+
+def get_folder(user_id, folder_id):
+    cursor = get_connection().cursor()
+
+    cursor.execute("""
+        SELECT id, parent_id, name, created_at
+        FROM folders
+        WHERE user_id = ? AND id = ?
+    """, (user_id, folder_id))
+
+    row = cursor.fetchone()
+    return _folder_dict(row) if row else None
+
+
+def find_folder(user_id, parent_id, name):
+    """The child folder called `name` (one lookup on the unique index)."""
+    cursor = get_connection().cursor()
+
+    cursor.execute("""
+        SELECT id, parent_id, name, created_at
+        FROM folders
+        WHERE user_id = ? AND parent_id = ? AND name = ?
+    """, (user_id, parent_id, name))
+
+    row = cursor.fetchone()
+    return _folder_dict(row) if row else None
+
+
+def list_child_folders(user_id, folder_id):
+    cursor = get_connection().cursor()
+
+    cursor.execute("""
+        SELECT id, parent_id, name, created_at
+        FROM folders
+        WHERE user_id = ? AND parent_id = ?
+        ORDER BY name
+    """, (user_id, folder_id))
+
+    return [_folder_dict(r) for r in cursor.fetchall()]
+
+
+def list_folder_files(user_id, folder_id, limit, after=None):
+    """
+    One page of the files directly in a folder, ordered by (filename,
+    id). Reads only that folder's range of idx_files_user_folder.
+    """
+    where = "user_id = ? AND folder_id = ?"
+    params = [user_id, folder_id]
+    if after is not None:
+        where += " AND (filename, id) > (?, ?)"
+        params.extend(after)
+
+    cursor = get_connection().cursor()
+    cursor.execute(f"""
+        SELECT filename, s3_key, size, uploaded_at, id
+        FROM files
+        WHERE {where}
+        ORDER BY filename, id
+        LIMIT ?
+    """, params + [limit + 1])
+    rows = cursor.fetchall()
+
+    more = len(rows) > limit
+    rows = rows[:limit]
+    files = [{
+        "filename": r[0],
+        "s3_key": r[1],
+        "size": r[2],
+        "uploaded_at": r[3]
+    } for r in rows]
+    return files, (rows[-1][0], rows[-1][4]) if more else None
+
+
+def folder_usage(user_id, folder_id):
+    """Recursive file count, bytes and subfolder count under a folder."""
+    cursor = get_connection().cursor()
+
+    cursor.execute("""
+        WITH RECURSIVE subtree(id) AS (
+            SELECT ?
+            UNION ALL
+            SELECT f.id FROM folders f JOIN subtree s ON f.user_id = ? AND f.parent_id = s.id
+        )
+        SELECT
+            (SELECT COUNT(*) - 1 FROM subtree),
+            COUNT(files.id),
+            COALESCE(SUM(files.size), 0)
+        FROM files
+        WHERE files.user_id = ? AND files.folder_id IN (SELECT id FROM subtree)
+    """, (folder_id, user_id, user_id))
+
+    row = cursor.fetchone()
+    return {"folder_count": row[0], "file_count": row[1], "total_bytes": row[2]}
+
+
+def move_folder(user_id, folder_id, parent_id, name):
+    """
+    Re-parent and/or rename a folder: one UPDATE, whatever the subtree
+    size. Raises ValueError if `parent_id` is the folder or inside it.
+    """
+    def move(cursor):
+        # Walk up from the destination; meeting folder_id means a cycle
+        cursor.execute("""
+            WITH RECURSIVE ancestors(id) AS (
+                SELECT ?
+                UNION ALL
+                SELECT f.parent_id FROM folders f JOIN ancestors a ON f.user_id = ? AND f.id = a.id
+                WHERE f.parent_id != 0
+            )
+            SELECT 1 FROM ancestors WHERE id = ?
+        """, (parent_id, user_id, folder_id))
+        if cursor.fetchone():
+            raise ValueError("Cannot move a folder into itself")
+
+        cursor.execute("""
+            UPDATE folders SET parent_id = ?, name = ?
+            WHERE user_id = ? AND id = ?
+        """, (parent_id, name, user_id, folder_id))
+        if cursor.rowcount:
+            _log_change(cursor, user_id, "folder_move", folder_key(user_id, folder_id), filename=name,
+                        folder_id=parent_id)
+
+    _write(move)
+
+
+def move_file(user_id, s3_key, folder_id, filename, new_s3_key):
+    """
+    Move/rename one file: one UPDATE. A file stored at its own s3_key
+    (not a dedup blob) is first adopted as a single-reference blob, so
+    its bytes stay where they are and a later delete still removes them.
+    """
+    def move(cursor):
+        cursor.execute("SELECT blob_key, size, uploaded_at FROM files WHERE user_id = ? AND s3_key = ?",
+                       (user_id, s3_key))
+        row = cursor.fetchone()
+        if not row:
+            return False
+        blob_key = row[0]
+        if not blob_key and new_s3_key != s3_key:
+            blob_key = s3_key
+            cursor.execute("""
+                INSERT INTO blobs (blob_key, content_hash, size, ref_count)
+                VALUES (?, '', ?, 1)
+            """, (blob_key, row[1]))
+
+        cursor.execute("""
+            UPDATE files SET folder_id = ?, filename = ?, s3_key = ?, blob_key = ?
+            WHERE user_id = ? AND s3_key = ?
+        """, (folder_id, filename, new_s3_key, blob_key, user_id, s3_key))
+        _log_change(cursor, user_id, "move", new_s3_key, old_s3_key=s3_key, filename=filename,
+                    size=row[1], uploaded_at=row[2], folder_id=folder_id)
+        return True
+
+    return _write(move)
+
+
+def delete_folder(user_id, folder_id):
+    """Delete an empty folder. Returns False if it still has children."""
+    def delete(cursor):
+        cursor.execute("""
+            SELECT 1 FROM folders WHERE user_id = ? AND parent_id = ?
+            UNION ALL
+            SELECT 1 FROM files WHERE user_id = ? AND folder_id = ?
+            LIMIT 1
+        """, (user_id, folder_id, user_id, folder_id))
+        if cursor.fetchone():
+            return False
+        cursor.execute("DELETE FROM folders WHERE user_id = ? AND id = ?", (user_id, folder_id))
+        if cursor.rowcount:
+            _log_change(cursor, user_id, "folder_delete", folder_key(user_id, folder_id))
+        return True
+
+    return _write(delete)
+
+
+# ---------------------------------------------------------
+# Per-user usage (O(1): one row per user)
+# ---------------------------------------------------------
+def get_user_usage(user_id):
+    cursor = get_connection().cursor()
+
+    cursor.execute("""
+        SELECT file_count, total_bytes
+        FROM user_usage
+        WHERE user_id = ?
+    """, (user_id,))
+
+    row = cursor.fetchone()
+
+    if not row:
+        return {"file_count": 0, "total_bytes": 0}
+    return {"file_count": row[0], "total_bytes": row[1]}
+
+
+# ---------------------------------------------------------
+# Change feed
+# ---------------------------------------------------------
+def get_changes(user_id, since, limit):
+    """
+    The user's changes after `since`, oldest first: one range read of
+    the (user_id, seq) key. floor_seq is the highest compacted-away
+    delete; a client that last synced below it has to start over.
+    """
+    cursor = get_connection().cursor()
+
+    # One read transaction, so both SELECTs see the same WAL snapshot: a
+    # compaction committing in between would otherwise pair the old
+    # floor_seq with rows it already purged
+    cursor.execute("BEGIN")
+    try:
+        cursor.execute("SELECT last_seq, floor_seq, log_rows FROM change_seq WHERE user_id = ?", (user_id,))
+        state = cursor.fetchone() or (0, 0, 0)
+
+        cursor.execute(f"""
+            SELECT {", ".join(CHANGE_COLUMNS)}
+            FROM file_changes
+            WHERE user_id = ? AND seq > ?
+            ORDER BY seq
+            LIMIT ?
+        """, (user_id, since, limit + 1))
+        rows = cursor.fetchall()
+    finally:
+        cursor.execute("COMMIT")
+
+    return {
+        "changes": [change_dict(r) for r in rows[:limit]],
+        "has_more": len(rows) > limit,
+        "latest_seq": state[0],
+        "floor_seq": state[1],
+        "log_rows": state[2]
+    }
+
+
+def compact_changes(user_id, tombstone_before):
+    """Drop superseded rows and old tombstones (see plan_compaction)."""
+    def compact(cursor):
+        cursor.execute("""
+            SELECT seq, op, s3_key, old_s3_key, changed_at
+            FROM file_changes
+            WHERE user_id = ?
+            ORDER BY seq
+        """, (user_id,))
+        drop, floor, kept_tombstone = plan_compaction(cursor.fetchall(), tombstone_before)
+
+        cursor.executemany("DELETE FROM file_changes WHERE user_id = ? AND seq = ?",
+                           [(user_id, seq) for seq in drop])
+        cursor.execute("""
+            UPDATE change_seq SET floor_seq = MAX(floor_seq, ?), log_rows = log_rows - ?,
+                                  compacted_rows = log_rows - ?, tombstone_at = ?
+            WHERE user_id = ?
+        """, (floor, len(drop), len(drop), kept_tombstone, user_id))
+        cursor.execute("SELECT floor_seq FROM change_seq WHERE user_id = ?", (user_id,))
+        row = cursor.fetchone()
+        return {"dropped": len(drop), "floor_seq": row[0] if row else 0}
+
+    return _write(compact)
+
+
+def change_log_users(min_new_rows=0, tombstone_before=None):
+    """
+    Users worth compacting: more than `min_new_rows` rows logged since
+    their last compaction, or a kept tombstone older than
+    `tombstone_before`.
+    """
+    cursor = get_connection().cursor()
+
+    cursor.execute("""
+        SELECT c.user_id, c.log_rows, COALESCE(u.file_count, 0)
+        FROM change_seq c LEFT JOIN user_usage u ON u.user_id = c.user_id
+        WHERE c.log_rows - c.compacted_rows > ? OR c.tombstone_at < ?
+    """, (min_new_rows, tombstone_before))
+
+    return cursor.fetchall()
+
+
+# ---------------------------------------------------------
+# Resumable upload sessions
+# ---------------------------------------------------------
+def create_upload_session(upload_id, user_id, filename, s3_key, s3_upload_id, part_size, created_at):
+    with transaction() as cursor:
+        cursor.execute("""
+            INSERT INTO upload_sessions
+                (upload_id, user_id, filename, s3_key, s3_upload_id, part_size, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (upload_id, user_id, filename, s3_key, s3_upload_id, part_size, created_at))
+
+
+def get_upload_session(upload_id):
+    return _select_upload_session("upload_id", upload_id)
+
+
+def find_upload_session(s3_key):
+    """The in-progress upload reserving s3_key, or None."""
+    return _select_upload_session("s3_key", s3_key)
+
+
+def _select_upload_session(column, value):
+    cursor = get_connection().cursor()
+
+    cursor.execute(f"""
+        SELECT upload_id, user_id, filename, s3_key, s3_upload_id, part_size, created_at
+        FROM upload_sessions
+        WHERE {column} = ?
+    """, (value,))
+
+    row = cursor.fetchone()
+
+    if not row:
+        return None
+    return {
+        "upload_id": row[0],
+        "user_id": row[1],
+        "filename": row[2],
+        "s3_key": row[3],
+        "s3_upload_id": row[4],
+        "part_size": row[5],
+        "created_at": row[6]
+    }
+
+
+def save_upload_part(upload_id, part_number, etag, size):
+    """Record a received part. Re-sending a part overwrites it (idempotent)."""
+    with transaction() as cursor:
+        cursor.execute("""
+            INSERT OR REPLACE INTO upload_parts (upload_id, part_number, etag, size)
+            VALUES (?, ?, ?, ?)
+        """, (upload_id, part_number, etag, size))
+
+
+def list_upload_parts(upload_id):
+    cursor = get_connection().cursor()
+
+    cursor.execute("""
+        SELECT part_number, etag, size
+        FROM upload_parts
+        WHERE upload_id = ?
+        ORDER BY part_number
+    """, (upload_id,))
+
+    rows = cursor.fetchall()
+
+    return [{"part_number": r[0], "etag": r[1], "size": r[2]} for r in rows]
+
+
+def delete_upload_session(upload_id):
+    with transaction() as cursor:
+        cursor.execute("DELETE FROM upload_parts WHERE upload_id = ?", (upload_id,))
+        cursor.execute("DELETE FROM upload_sessions WHERE upload_id = ?", (upload_id,))
 
 
 # ---------------------------------------------------------
@@ -0,0 +1,287 @@
+# db/cache.py
+import time
+import threading
+from collections import OrderedDict
+from db.repository import FileRepository
+
+
+class MetadataCache:
+    """
+    Size-bounded LRU with a per-entry TTL, plus hit/miss counters.
+
+    Entries can be tagged with a user id so every listing of that user is
+    dropped in one call. Fills are guarded by a write version: a value
+    read from the database is only stored if no invalidation happened
+    while it was being read, so a slow reader can't put back a row that a
+    concurrent upload/delete just made stale.
+    """
+
+    def __init__(self, max_entries=10000, ttl=30.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()   # key -> (expires_at, value, tag)
+        self._tags = {}                 # tag -> set of keys
+        self._lock = threading.Lock()
+        self._version = 0
+
+        self._hits = 0
+        self._misses = 0
+        self._expired = 0
+        self._evictions = 0
+        self._invalidations = 0
+
+    def get(self, key):
+        """(True, value) on a fresh hit, else (False, write version to pass to put())."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self._hits += 1
+                    return True, entry[1]
+                self._remove(key)
+                self._expired += 1
+            self._misses += 1
+            return False, self._version
+
+    def put(self, key, value, version, tag=None):
+        with self._lock:
+            if version != self._version:
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, value, tag)
+            if tag is not None:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self._evictions += 1
+
+    def invalidate(self, keys=(), tags=()):
+        with self._lock:
+            self._version += 1
+            for key in keys:
+                if key in self._entries:
+                    self._remove(key)
+                    self._invalidations += 1
+            for tag in tags:
+                for key in list(self._tags.get(tag, ())):
+                    self._remove(key)
+                    self._invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._version += 1
+            self._entries.clear()
+            self._tags.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_ratio": round(self._hits / lookups, 3) if lookups else 0.0,
+                "expired": self._expired,
+                "evictions": self._evictions,
+                "invalidations": self._invalidations
+            }
+
+    def _remove(self, key):
+        _, _, tag = self._entries.pop(key)
+        if tag is not None:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+
+def _owner(s3_key):
+    # File keys are user_{id}/... (routes/files.py)
+    head = s3_key.split("/", 1)[0]
+    return head[5:] if head.startswith("user_") else None
+
+
+class CachingFileRepository(FileRepository):
+    """
+    Read-through cache in front of another FileRepository.
+
+    Cached: file records by s3_key and listing pages (all files, a
+    folder's files, a folder's subfolders). Every write that goes through
+    this wrapper drops exactly the records it touched and the owner's
+    listings. Misses (None records) are never cached, so an existence
+    check can't be fooled into allowing an overwrite.
+
+    The cache is per process: with several worker processes or API nodes
+    on one database, a write made by another process shows up here only
+    after the TTL, so it is off unless METADATA_CACHE_SIZE is set.
+    """
+
+    def __init__(self, inner, cache):
+        self._inner = inner
+        self.cache = cache
+
+    # ---------------- Read-through helpers ----------------
+    def _cached(self, key, load, tag=None):
+        hit, value = self.cache.get(key)
+        if hit:
+            return value
+        version = value
+        value = load()
+        if value is not None:
+            self.cache.put(key, value, version, tag)
+        return value
+
+    def _listing(self, user_id, key, load):
+        user = str(user_id)
+        return self._cached(("list", user) + key, load, tag=user)
+
+    def _invalidate(self, s3_keys=(), users=()):
+        users = {str(u) for u in users}
+        users.update(u for u in map(_owner, s3_keys) if u is not None)
+        self.cache.invalidate(keys=[("record", k) for k in s3_keys], tags=users)
+
+    # ---------------- Files ----------------
+    def save_file_record(self, user_id, filename, s3_key, *args, **kwargs):
+        try:
+            return self._inner.save_file_record(user_id, filename, s3_key, *args, **kwargs)
+        finally:
+            self._invalidate([s3_key], [user_id])
+
+    def save_file_records(self, records):
+        try:
+            return self._inner.save_file_records(records)
+        finally:
+            self._invalidate([r["s3_key"] for r in records], [r["user_id"] for r in records])
+
+    def list_user_files_page(self, user_id, limit, after=None, sort="uploaded_at", order="desc",
+                             since=None, until=None, name_prefix=None):
+        key = ("files", limit, after, sort, order, since, until, name_prefix)
+        return self._listing(user_id, key, lambda: self._inner.list_user_files_page(
+            user_id, limit, after=after, sort=sort, order=order, since=since, until=until,
+            name_prefix=name_prefix))
+
+    def iter_user_files(self, *args, **kwargs):
+        # Whole-account streams are read once; caching them would flush the LRU
+        return self._inner.iter_user_files(*args, **kwargs)
+
+    def search_user_files(self, *args, **kwargs):
+        return self._inner.search_user_files(*args, **kwargs)
+
+    def get_file_record(self, s3_key):
+        return self._cached(("record", s3_key), lambda: self._inner.get_file_record(s3_key))
+
+    def get_existing_s3_keys(self, s3_keys):
+        return self._inner.get_existing_s3_keys(s3_keys)
+
+    def delete_file_record(self, s3_key):
+        try:
+            return self._inner.delete_file_record(s3_key)
+        finally:
+            self._invalidate([s3_key])
+
+    def find_user_file_keys(self, *args, **kwargs):
+        return self._inner.find_user_file_keys(*args, **kwargs)
+
+    def get_user_file_records(self, *args, **kwargs):
+        return self._inner.get_user_file_records(*args, **kwargs)
+
+    def delete_file_records(self, s3_keys):
+        s3_keys = list(s3_keys)
+        try:
+            return self._inner.delete_file_records(s3_keys)
+        finally:
+            self._invalidate(s3_keys)
+
+    def get_blob(self, blob_key):
+        return self._inner.get_blob(blob_key)
+
+    def acquire_blob(self, blob_key):
+        return self._inner.acquire_blob(blob_key)
+
+    def release_blob(self, blob_key):
+        return self._inner.release_blob(blob_key)
+
+    # ---------------- Folders ----------------
+    def create_folder(self, user_id, *args, **kwargs):
+        try:
+            return self._inner.create_folder(user_id, *args, **kwargs)
+        finally:
+            self._invalidate(users=[user_id])
+
+    def get_folder(self, user_id, folder_id):
+        return self._inner.get_folder(user_id, folder_id)
+
+    def find_folder(self, user_id, parent_id, name):
+        return self._inner.find_folder(user_id, parent_id, name)
+
+    def list_child_folders(self, user_id, folder_id):
+        return self._listing(user_id, ("folders", folder_id),
+                             lambda: self._inner.list_child_folders(user_id, folder_id))
+
+    def list_folder_files(self, user_id, folder_id, limit, after=None):
+        return self._listing(user_id, ("folder_files", folder_id, limit, after),
+                             lambda: self._inner.list_folder_files(user_id, folder_id, limit, after=after))
+
+    def folder_usage(self, user_id, folder_id):
+        return self._inner.folder_usage(user_id, folder_id)
+
+    def move_folder(self, user_id, *args, **kwargs):
+        try:
+            return self._inner.move_folder(user_id, *args, **kwargs)
+        finally:
+            self._invalidate(users=[user_id])
+
+    def move_file(self, user_id, s3_key, folder_id, filename, new_s3_key):
+        try:
+            return self._inner.move_file(user_id, s3_key, folder_id, filename, new_s3_key)
+        finally:
+            self._invalidate([s3_key, new_s3_key], [user_id])
+
+    def delete_folder(self, user_id, folder_id):
+        try:
+            return self._inner.delete_folder(user_id, folder_id)
+        finally:
+            self._invalidate(users=[user_id])
+
+    # ---------------- Usage ----------------
+    def get_user_usage(self, user_id):
+        # Quota checks need the live totals
+        return self._inner.get_user_usage(user_id)
+
+    # ---------------- Change log ----------------
+    def get_changes(self, user_id, since, limit):
+        return self._inner.get_changes(user_id, since, limit)
+
+    def compact_changes(self, user_id, tombstone_before):
+        return self._inner.compact_changes(user_id, tombstone_before)
+
+    def change_log_users(self, min_new_rows=0, tombstone_before=None):
+        return self._inner.change_log_users(min_new_rows, tombstone_before)
+
+    # ---------------- Resumable uploads ----------------
+    def create_upload_session(self, *args, **kwargs):
+        return self._inner.create_upload_session(*args, **kwargs)
+
+    def get_upload_session(self, upload_id):
+        return self._inner.get_upload_session(upload_id)
+
+    def find_upload_session(self, s3_key):
+        return self._inner.find_upload_session(s3_key)
+
+    def save_upload_part(self, *args, **kwargs):
+        return self._inner.save_upload_part(*args, **kwargs)
+
+    def list_upload_parts(self, upload_id):
+        return self._inner.list_upload_parts(upload_id)
+
+    def delete_upload_session(self, upload_id):
+        return self._inner.delete_upload_session(upload_id)
+
+    # ---------------- Connections ----------------
+    def release_connection(self):
+        self._inner.release_connection()
@@ -0,0 +1,60 @@
+# db/common.py
+# Column layouts and pure helpers shared by the repository layer and both
+# backends (database.py, db/mysql_repository.py). Imports nothing from db/.
+
+# Column order of the tuples yielded by iter_user_files()
+LIST_COLUMNS = ("filename", "s3_key", "size", "uploaded_at")
+LIST_SORT_COLUMNS = ("uploaded_at", "filename")
+SEARCH_MODES = ("substring", "prefix", "token")
+# Column order of file_changes rows; see change_dict()
+CHANGE_COLUMNS = ("seq", "op", "s3_key", "old_s3_key", "filename", "size", "uploaded_at", "folder_id",
+                  "changed_at")
+# Folder rows use the folder's key prefix (folder_key()) as s3_key, its
+# name as filename and its parent as folder_id
+CHANGE_OPS = ("create", "delete", "move", "folder_create", "folder_move", "folder_delete")
+DELETE_OPS = ("delete", "folder_delete")
+
+
+def folder_key(user_id, folder_id):
+    """Key prefix of the files in a folder; also the folder's key in the change log."""
+    return f"user_{user_id}/d{folder_id}/"
+
+
+def change_dict(row):
+    """A file_changes row as sent to clients (empty fields left out)."""
+    return {k: v for k, v in zip(CHANGE_COLUMNS, row) if v is not None}
+
+
+def plan_compaction(rows, tombstone_before):
+    """
+    Which change-log rows can go. `rows` are (seq, op, s3_key,
+    old_s3_key, changed_at) in seq order. A client replaying the log
+    from any point only needs the last row that touched each key (a
+    move touches both keys), so every other row is dropped. The last
+    row of a key that no longer exists (a delete, or a move away) is a
+    tombstone: kept until `tombstone_before`, then dropped too, and
+    clients that synced before it must start over from seq 0.
+
+    Returns (seqs to delete, highest purged tombstone seq or 0,
+    changed_at of the oldest tombstone kept or None). Until new rows
+    arrive or that tombstone ages out, compacting again drops nothing.
+    """
+    latest = {}
+    for seq, op, s3_key, old_s3_key, _ in rows:
+        latest[s3_key] = seq
+        if old_s3_key:
+            latest[old_s3_key] = seq
+
+    drop, floor, kept_tombstone = [], 0, None
+    for seq, op, s3_key, old_s3_key, changed_at in rows:
+        if op not in DELETE_OPS and latest[s3_key] == seq:
+            continue
+        tombstone = (op in DELETE_OPS and latest[s3_key] == seq) or (old_s3_key and latest[old_s3_key] == seq)
+        if tombstone and changed_at >= tombstone_before:
+            if kept_tombstone is None or changed_at < kept_tombstone:
+                kept_tombstone = changed_at
+            continue
+        drop.append(seq)
+        if tombstone:
+            floor = seq
+    return drop, floor, kept_tombstone
@@ -1,6 +1,6 @@
 # db/db_connection.py
-import mysql.connector
-from config import MYSQL_CONFIG
+from db.pool import get_pool
 
 def get_db_connection():
-    return mysql.connector.connect(**{k: v for k, v in MYSQL_CONFIG.items() if v is not None})
+    """Borrow a pooled MySQL connection; close() returns it to the pool."""
+    return get_pool().connection()
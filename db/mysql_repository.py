@@ -0,0 +1,952 @@
+# db/mysql_repository.py
+import re
+import time
+import threading
+from contextlib import contextmanager
+import mysql.connector
+from db.pool import get_pool
+from db.common import (
+    LIST_COLUMNS, LIST_SORT_COLUMNS, SEARCH_MODES, CHANGE_COLUMNS, change_dict, folder_key, plan_compaction
+)
+from db.repository import FileRepository, DuplicateKeyError
+
+# s3_key/blob_key use a binary collation: byte-wise comparison keeps keys
+# case-sensitive (like S3) and makes prefix LIKE an index range scan.
+# 700 utf8mb4 chars keeps (user_id, s3_key) under InnoDB's 3072-byte
+# index limit and fits "user_<id>/" plus a 255-char filename. blob_key
+# is as wide: a moved file's old s3_key is adopted as its blob key.
+# Filenames and folder names are binary too, so "A.txt" and "a.txt" are
+# different files, as on SQLite; search runs on filename_ci, a
+# case-insensitive copy, to match SQLite's case-insensitive indexes.
+SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS files (
+        id BIGINT UNSIGNED NOT NULL AUTO_INCREMENT PRIMARY KEY,
+        user_id BIGINT NOT NULL,
+        filename VARCHAR(255) CHARACTER SET utf8mb4 COLLATE utf8mb4_bin NOT NULL,
+        s3_key VARCHAR(700) CHARACTER SET utf8mb4 COLLATE utf8mb4_bin NOT NULL,
+        size BIGINT NOT NULL,
+        uploaded_at BIGINT NOT NULL,
+        blob_key VARCHAR(700) CHARACTER SET utf8mb4 COLLATE utf8mb4_bin NULL,
+        encryption VARCHAR(32) NULL,
+        codec VARCHAR(16) NULL,
+        folder_id BIGINT NOT NULL DEFAULT 0,
+        filename_ci VARCHAR(255) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci
+            GENERATED ALWAYS AS (filename) STORED,
+        UNIQUE KEY uq_files_s3_key (s3_key),
+        UNIQUE KEY uq_files_user_folder (user_id, folder_id, filename),
+        KEY idx_files_user_key (user_id, s3_key),
+        KEY idx_files_user_uploaded (user_id, uploaded_at, id),
+        KEY idx_files_user_filename (user_id, filename, id),
+        FULLTEXT KEY ft_files_filename (filename_ci)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS blobs (
+        blob_key VARCHAR(700) CHARACTER SET utf8mb4 COLLATE utf8mb4_bin NOT NULL PRIMARY KEY,
+        content_hash CHAR(64) CHARACTER SET ascii NOT NULL,
+        size BIGINT NOT NULL,
+        ref_count INT NOT NULL
+    ) ENGINE=InnoDB
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS upload_sessions (
+        upload_id VARCHAR(64) NOT NULL PRIMARY KEY,
+        user_id BIGINT NOT NULL,
+        filename VARCHAR(255) CHARACTER SET utf8mb4 COLLATE utf8mb4_bin NOT NULL,
+        s3_key VARCHAR(700) CHARACTER SET utf8mb4 COLLATE utf8mb4_bin NOT NULL,
+        s3_upload_id VARCHAR(1024) NOT NULL,
+        part_size BIGINT NOT NULL,
+        created_at VARCHAR(32) NOT NULL,
+        UNIQUE KEY uq_upload_sessions_s3_key (s3_key)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS folders (
+        id BIGINT UNSIGNED NOT NULL AUTO_INCREMENT PRIMARY KEY,
+        user_id BIGINT NOT NULL,
+        parent_id BIGINT NOT NULL DEFAULT 0,
+        name VARCHAR(255) CHARACTER SET utf8mb4 COLLATE utf8mb4_bin NOT NULL,
+        created_at BIGINT NOT NULL,
+        UNIQUE KEY uq_folders_user_parent_name (user_id, parent_id, name)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS user_usage (
+        user_id BIGINT NOT NULL PRIMARY KEY,
+        file_count BIGINT NOT NULL DEFAULT 0,
+        total_bytes BIGINT NOT NULL DEFAULT 0
+    ) ENGINE=InnoDB
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS file_changes (
+        user_id BIGINT NOT NULL,
+        seq BIGINT NOT NULL,
+        op VARCHAR(16) NOT NULL,
+        s3_key VARCHAR(700) CHARACTER SET utf8mb4 COLLATE utf8mb4_bin NOT NULL,
+        old_s3_key VARCHAR(700) CHARACTER SET utf8mb4 COLLATE utf8mb4_bin NULL,
+        filename VARCHAR(255) NULL,
+        size BIGINT NULL,
+        uploaded_at BIGINT NULL,
+        folder_id BIGINT NULL,
+        changed_at BIGINT NOT NULL,
+        PRIMARY KEY (user_id, seq)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS change_seq (
+        user_id BIGINT NOT NULL PRIMARY KEY,
+        last_seq BIGINT NOT NULL DEFAULT 0,
+        floor_seq BIGINT NOT NULL DEFAULT 0,
+        log_rows BIGINT NOT NULL DEFAULT 0,
+        compacted_rows BIGINT NOT NULL DEFAULT 0,
+        tombstone_at BIGINT NULL
+    ) ENGINE=InnoDB
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS upload_parts (
+        upload_id VARCHAR(64) NOT NULL,
+        part_number INT NOT NULL,
+        etag VARCHAR(128) NOT NULL,
+        size BIGINT NOT NULL,
+        PRIMARY KEY (upload_id, part_number)
+    ) ENGINE=InnoDB
+    """,
+)
+
+# Rows per IN (...) list
+IN_BATCH = 500
+
+
+def _like_prefix(prefix):
+    """LIKE pattern matching keys that start with `prefix` literally."""
+    return prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+class MySQLFileRepository(FileRepository):
+    """
+    File metadata in the shared MySQL database, over the pooled
+    connections from db/pool.py. Every API node sees the same rows, so
+    the API tier can scale out behind a load balancer. Writes are plain
+    InnoDB transactions; MySQL already group-commits their fsyncs, so
+    the SQLite write-behind writer has no counterpart here.
+    """
+
+    def __init__(self, pool=None):
+        self._pool = pool
+        self._schema_ready = False
+        self._schema_lock = threading.Lock()
+
+    # ---------------------------------------------------------
+    # Connections and transactions
+    # ---------------------------------------------------------
+    def _connection(self):
+        conn = (self._pool or get_pool()).connection()
+        if not self._schema_ready:
+            with self._schema_lock:
+                if not self._schema_ready:
+                    self._create_tables(conn)
+                    self._schema_ready = True
+        return conn
+
+    @staticmethod
+    def _create_tables(conn):
+        cursor = conn.cursor(buffered=True)
+        try:
+            cursor.execute("SHOW TABLES LIKE 'user_usage'")
+            backfill = cursor.fetchone() is None
+            cursor.execute("SHOW TABLES LIKE 'file_changes'")
+            backfill_changes = cursor.fetchone() is None
+            for ddl in SCHEMA:
+                cursor.execute(ddl)
+            MySQLFileRepository._migrate(cursor)
+            if backfill:
+                cursor.execute("""
+                    INSERT INTO user_usage (user_id, file_count, total_bytes)
+                    SELECT user_id, COUNT(*), SUM(size) FROM files GROUP BY user_id
+                """)
+            if backfill_changes:
+                # Existing folders, then files, become the change log's starting point
+                cursor.execute("""
+                    INSERT INTO file_changes (user_id, seq, op, s3_key, filename, size, uploaded_at,
+                                              folder_id, changed_at)
+                    SELECT user_id, ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY kind, id), op,
+                           s3_key, filename, size, uploaded_at, folder_id, changed_at
+                    FROM (
+                        SELECT 0 AS kind, id, user_id, 'folder_create' AS op,
+                               CONCAT('user_', user_id, '/d', id, '/') AS s3_key, name AS filename,
+                               NULL AS size, NULL AS uploaded_at, parent_id AS folder_id,
+                               created_at AS changed_at
+                        FROM folders
+                        UNION ALL
+                        SELECT 1, id, user_id, 'create', s3_key, filename, size, uploaded_at, folder_id,
+                               uploaded_at
+                        FROM files
+                    ) AS existing
+                """)
+                cursor.execute("""
+                    INSERT INTO change_seq (user_id, last_seq, floor_seq, log_rows)
+                    SELECT user_id, COUNT(*), 0, COUNT(*) FROM file_changes GROUP BY user_id
+                """)
+            conn.commit()
+        finally:
+            cursor.close()
+
+    @staticmethod
+    def _migrate(cursor):
+        """Bring tables created by older versions up to SCHEMA."""
+        def column(table, name):
+            cursor.execute("""
+                SELECT CHARACTER_MAXIMUM_LENGTH, COLLATION_NAME FROM information_schema.COLUMNS
+                WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s
+            """, (table, name))
+            return cursor.fetchone()
+
+        # Names were case-insensitive (the table default collation): make
+        # them binary, and move the FULLTEXT index to the case-insensitive copy
+        if column("files", "filename_ci") is None:
+            cursor.execute("ALTER TABLE files DROP INDEX ft_files_filename")
+            cursor.execute("""
+                ALTER TABLE files
+                    MODIFY filename VARCHAR(255) CHARACTER SET utf8mb4 COLLATE utf8mb4_bin NOT NULL,
+                    ADD COLUMN filename_ci VARCHAR(255) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci
+                        GENERATED ALWAYS AS (filename) STORED
+            """)
+            cursor.execute("ALTER TABLE files ADD FULLTEXT KEY ft_files_filename (filename_ci)")
+        for table, name in (("folders", "name"), ("upload_sessions", "filename")):
+            if column(table, name)[1] != "utf8mb4_bin":
+                cursor.execute(f"""
+                    ALTER TABLE {table}
+                        MODIFY {name} VARCHAR(255) CHARACTER SET utf8mb4 COLLATE utf8mb4_bin NOT NULL
+                """)
+
+        # folder_create/folder_move/folder_delete do not fit in VARCHAR(8)
+        if column("file_changes", "op")[0] < 16:
+            cursor.execute("ALTER TABLE file_changes MODIFY op VARCHAR(16) NOT NULL")
+        if column("change_seq", "compacted_rows") is None:
+            cursor.execute("ALTER TABLE change_seq ADD COLUMN compacted_rows BIGINT NOT NULL DEFAULT 0")
+        if column("change_seq", "tombstone_at") is None:
+            cursor.execute("ALTER TABLE change_seq ADD COLUMN tombstone_at BIGINT NULL")
+
+        # One in-progress upload per key; older duplicates keep one session
+        cursor.execute("""
+            SELECT 1 FROM information_schema.STATISTICS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'upload_sessions'
+              AND INDEX_NAME = 'uq_upload_sessions_s3_key'
+        """)
+        if cursor.fetchone() is None:
+            cursor.execute("""
+                DELETE s FROM upload_sessions s
+                JOIN upload_sessions t ON t.s3_key = s.s3_key AND t.upload_id > s.upload_id
+            """)
+            cursor.execute("""
+                DELETE p FROM upload_parts p
+                LEFT JOIN upload_sessions s ON s.upload_id = p.upload_id
+                WHERE s.upload_id IS NULL
+            """)
+            cursor.execute("ALTER TABLE upload_sessions ADD UNIQUE KEY uq_upload_sessions_s3_key (s3_key)")
+
+    # Buffered cursors: results are read in full, so a fetchone() never
+    # leaves unread rows on a connection that goes back to the pool
+    @contextmanager
+    def _read(self):
+        conn = self._connection()
+        cursor = conn.cursor(buffered=True)
+        try:
+            yield cursor
+        finally:
+            cursor.close()
+            conn.close()
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connection()
+        cursor = conn.cursor(buffered=True)
+        try:
+            yield cursor
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+            conn.close()
+
+    # ---------------------------------------------------------
+    # Files
+    # ---------------------------------------------------------
+    @staticmethod
+    def _insert_file(cursor, user_id, filename, s3_key, size, uploaded_at, blob_key=None,
+                     content_hash=None, encryption=None, codec=None, folder_id=0, blob_acquired=False):
+        cursor.execute("""
+            INSERT INTO files (user_id, filename, s3_key, size, uploaded_at, blob_key, encryption, codec,
+                               folder_id)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+        """, (user_id, filename, s3_key, size, uploaded_at, blob_key, encryption, codec, folder_id))
+
+        if blob_key and not blob_acquired:
+            cursor.execute("""
+                INSERT INTO blobs (blob_key, content_hash, size, ref_count)
+                VALUES (%s, %s, %s, 1)
+                ON DUPLICATE KEY UPDATE ref_count = ref_count + 1
+            """, (blob_key, content_hash, size))
+
+        MySQLFileRepository._add_usage(cursor, user_id, 1, size)
+        MySQLFileRepository._log_change(cursor, user_id, "create", s3_key, filename=filename, size=size,
+                                        uploaded_at=uploaded_at, folder_id=folder_id)
+
+    @staticmethod
+    def _add_usage(cursor, user_id, files, size):
+        cursor.execute("""
+            INSERT INTO user_usage (user_id, file_count, total_bytes)
+            VALUES (%s, %s, %s)
+            ON DUPLICATE KEY UPDATE
+                file_count = file_count + VALUES(file_count),
+                total_bytes = total_bytes + VALUES(total_bytes)
+        """, (user_id, files, size))
+
+    @staticmethod
+    def _log_change(cursor, user_id, op, s3_key, old_s3_key=None, filename=None, size=None,
+                    uploaded_at=None, folder_id=None):
+        # The upsert row-locks change_seq until commit, so a user's seqs
+        # become visible in order and without gaps
+        cursor.execute("""
+            INSERT INTO change_seq (user_id, last_seq, log_rows)
+            VALUES (%s, 1, 1)
+            ON DUPLICATE KEY UPDATE last_seq = last_seq + 1, log_rows = log_rows + 1
+        """, (user_id,))
+        cursor.execute("SELECT last_seq FROM change_seq WHERE user_id = %s", (user_id,))
+        cursor.execute("""
+            INSERT INTO file_changes (user_id, seq, op, s3_key, old_s3_key, filename, size, uploaded_at,
+                                      folder_id, changed_at)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        """, (user_id, cursor.fetchone()[0], op, s3_key, old_s3_key, filename, size, uploaded_at,
+              folder_id, int(time.time())))
+
+    def save_file_record(self, user_id, filename, s3_key, size, uploaded_at, blob_key=None,
+                         content_hash=None, encryption=None, codec=None, folder_id=0, blob_acquired=False):
+        try:
+            with self._transaction() as cursor:
+                self._insert_file(cursor, user_id, filename, s3_key, size, uploaded_at, blob_key,
+                                  content_hash, encryption, codec, folder_id, blob_acquired)
+        except mysql.connector.IntegrityError as e:
+            raise DuplicateKeyError(str(e)) from e
+
+    def save_file_records(self, records):
+        errors = []
+        with self._transaction() as cursor:
+            for record in records:
+                cursor.execute("SAVEPOINT row_insert")
+                try:
+                    self._insert_file(cursor, **record)
+                    cursor.execute("RELEASE SAVEPOINT row_insert")
+                    errors.append(None)
+                except mysql.connector.IntegrityError as e:
+                    cursor.execute("ROLLBACK TO SAVEPOINT row_insert")
+                    cursor.execute("RELEASE SAVEPOINT row_insert")
+                    errors.append(str(e))
+        return errors
+
+    @staticmethod
+    def _list_filters(user_id, sort, order, since=None, until=None, name_prefix=None):
+        if sort not in LIST_SORT_COLUMNS:
+            raise ValueError(f"sort must be one of {', '.join(LIST_SORT_COLUMNS)}")
+        if order not in ("asc", "desc"):
+            raise ValueError("order must be asc or desc")
+
+        where = ["user_id = %s"]
+        params = [user_id]
+        if since is not None:
+            where.append("uploaded_at >= %s")
+            params.append(since)
+        if until is not None:
+            where.append("uploaded_at < %s")
+            params.append(until)
+        if name_prefix:
+            where.append("filename LIKE %s")
+            params.append(_like_prefix(name_prefix))
+        return where, params
+
+    def list_user_files_page(self, user_id, limit, after=None, sort="uploaded_at", order="desc",
+                             since=None, until=None, name_prefix=None):
+        where, params = self._list_filters(user_id, sort, order, since, until, name_prefix)
+        if after is not None:
+            # Expanded form of (sort, id) < (?, ?): MySQL only turns this
+            # shape into an index range on (user_id, sort, id)
+            op = "<" if order == "desc" else ">"
+            where.append(f"({sort} {op} %s OR ({sort} = %s AND id {op} %s))")
+            params.extend([after[0], after[0], after[1]])
+
+        with self._read() as cursor:
+            cursor.execute(f"""
+                SELECT filename, s3_key, size, uploaded_at, id
+                FROM files
+                WHERE {" AND ".join(where)}
+                ORDER BY {sort} {order}, id {order}
+                LIMIT %s
+            """, params + [limit + 1])
+            rows = cursor.fetchall()
+
+        more = len(rows) > limit
+        rows = rows[:limit]
+        files = [{
+            "filename": r[0],
+            "s3_key": r[1],
+            "size": r[2],
+            "uploaded_at": r[3]
+        } for r in rows]
+
+        last = None
+        if more:
+            r = rows[-1]
+            last = (r[0] if sort == "filename" else r[3], r[4])
+        return files, last
+
+    def iter_user_files(self, user_id, sort="uploaded_at", order="desc", since=None, until=None,
+                        name_prefix=None, batch_size=500):
+        where, params = self._list_filters(user_id, sort, order, since, until, name_prefix)
+        return self._stream_rows(f"""
+            SELECT {", ".join(LIST_COLUMNS)}
+            FROM files
+            WHERE {" AND ".join(where)}
+            ORDER BY {sort} {order}, id {order}
+        """, params, batch_size)
+
+    def _stream_rows(self, sql, params, batch_size):
+        # Unbuffered cursor: rows arrive from the server as they are read.
+        # The connection goes back to the pool when the generator ends.
+        conn = self._connection()
+        cursor = conn.cursor(buffered=False)
+        try:
+            cursor.execute(sql, params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            try:
+                cursor.close()
+            except mysql.connector.Error:
+                pass
+            conn.close()
+
+    def search_user_files(self, user_id, query, mode="substring", limit=50, after=None):
+        """
+        Same contract as the SQLite search. Token queries use the InnoDB
+        FULLTEXT index in boolean mode (words shorter than
+        innodb_ft_min_token_size are not indexed); substring and prefix
+        queries are LIKE scans bounded to the user's rows by
+        idx_files_user_filename. Substring and token matches ignore case
+        (filename_ci); prefix matches are binary, as on SQLite.
+        """
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"mode must be one of {', '.join(SEARCH_MODES)}")
+        query = query.strip()
+        if not query:
+            raise ValueError("Missing search query")
+
+        where = ["user_id = %s"]
+        params = [user_id]
+        if mode == "prefix":
+            where.append("filename LIKE %s")
+            params.append(_like_prefix(query))
+        elif mode == "substring":
+            where.append("filename_ci LIKE %s")
+            params.append("%" + _like_prefix(query))
+        else:
+            terms = []
+            for word in query.split():
+                words = ["+" + w for w in re.findall(r"\w+", word)]
+                if words and word.endswith("*"):
+                    words[-1] += "*"
+                terms.extend(words)
+            if not terms:
+                raise ValueError("Missing search query")
+            where.append("MATCH(filename_ci) AGAINST (%s IN BOOLEAN MODE)")
+            params.append(" ".join(terms))
+        if after is not None:
+            where.append("(filename > %s OR (filename = %s AND id > %s))")
+            params.extend([after[0], after[0], after[1]])
+
+        with self._read() as cursor:
+            cursor.execute(f"""
+                SELECT filename, s3_key, size, uploaded_at, id
+                FROM files
+                WHERE {" AND ".join(where)}
+                ORDER BY filename, id
+                LIMIT %s
+            """, params + [limit + 1])
+            rows = cursor.fetchall()
+
+        more = len(rows) > limit
+        rows = rows[:limit]
+        files = [{
+            "filename": r[0],
+            "s3_key": r[1],
+            "size": r[2],
+            "uploaded_at": r[3]
+        } for r in rows]
+        return files, (rows[-1][0], rows[-1][4]) if more else None
+
+    def get_file_record(self, s3_key):
+        with self._read() as cursor:
+            cursor.execute("""
+                SELECT filename, user_id, size, uploaded_at, blob_key, encryption, codec
+                FROM files
+                WHERE s3_key = %s
+            """, (s3_key,))
+            return cursor.fetchone()
+
+    def get_existing_s3_keys(self, s3_keys):
+        s3_keys = list(s3_keys)
+        found = set()
+        if not s3_keys:
+            return found
+
+        with self._read() as cursor:
+            for i in range(0, len(s3_keys), IN_BATCH):
+                batch = s3_keys[i:i + IN_BATCH]
+                cursor.execute(f"""
+                    SELECT s3_key FROM files
+                    WHERE s3_key IN ({",".join(["%s"] * len(batch))})
+                """, batch)
+                found.update(r[0] for r in cursor.fetchall())
+        return found
+
+    @staticmethod
+    def _release_blobs(cursor, released):
+        orphans = []
+        for blob_key, count in released.items():
+            cursor.execute("UPDATE blobs SET ref_count = ref_count - %s WHERE blob_key = %s", (count, blob_key))
+            cursor.execute("DELETE FROM blobs WHERE blob_key = %s AND ref_count <= 0", (blob_key,))
+            if cursor.rowcount:
+                orphans.append(blob_key)
+        return orphans
+
+    def delete_file_record(self, s3_key):
+        with self._transaction() as cursor:
+            cursor.execute("SELECT blob_key, user_id, size FROM files WHERE s3_key = %s FOR UPDATE",
+                           (s3_key,))
+            row = cursor.fetchone()
+            if not row:
+                return None
+            cursor.execute("DELETE FROM files WHERE s3_key = %s", (s3_key,))
+            self._add_usage(cursor, row[1], -1, -row[2])
+            self._log_change(cursor, row[1], "delete", s3_key)
+
+            if row[0]:
+                orphans = self._release_blobs(cursor, {row[0]: 1})
+                return orphans[0] if orphans else None
+        return None
+
+    def _select_user_files(self, cursor, columns, user_id, s3_keys=None, prefix=None, limit=-1):
+        if prefix is not None:
+            sql = f"""
+                SELECT {columns} FROM files
+                WHERE user_id = %s AND s3_key LIKE %s
+                ORDER BY s3_key
+            """
+            params = [user_id, _like_prefix(prefix)]
+            if limit >= 0:
+                sql += " LIMIT %s"
+                params.append(limit)
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+        rows = []
+        s3_keys = list(s3_keys or [])
+        for i in range(0, len(s3_keys), IN_BATCH):
+            batch = s3_keys[i:i + IN_BATCH]
+            cursor.execute(f"""
+                SELECT {columns} FROM files
+                WHERE user_id = %s AND s3_key IN ({",".join(["%s"] * len(batch))})
+            """, [user_id] + batch)
+            rows.extend(cursor.fetchall())
+        return rows
+
+    def find_user_file_keys(self, user_id, s3_keys=None, prefix=None):
+        with self._read() as cursor:
+            return self._select_user_files(cursor, "s3_key, blob_key", user_id, s3_keys, prefix)
+
+    def get_user_file_records(self, user_id, s3_keys=None, prefix=None, limit=-1):
+        with self._read() as cursor:
+            rows = self._select_user_files(
+                cursor, "filename, s3_key, size, uploaded_at, blob_key, encryption, codec",
+                user_id, s3_keys, prefix, limit)
+
+        return [{
+            "filename": r[0],
+            "s3_key": r[1],
+            "size": r[2],
+            "uploaded_at": r[3],
+            "blob_key": r[4],
+            "encryption": r[5],
+            "codec": r[6]
+        } for r in rows]
+
+    def delete_file_records(self, s3_keys):
+        s3_keys = list(s3_keys)
+        if not s3_keys:
+            return []
+
+        with self._transaction() as cursor:
+            released = {}
+            usage = {}
+            deleted = []
+            for i in range(0, len(s3_keys), IN_BATCH):
+                batch = s3_keys[i:i + IN_BATCH]
+                placeholders = ",".join(["%s"] * len(batch))
+                cursor.execute(f"""
+                    SELECT blob_key, user_id, size, s3_key FROM files
+                    WHERE s3_key IN ({placeholders})
+                    FOR UPDATE
+                """, batch)
+                for blob_key, user_id, size, s3_key in cursor.fetchall():
+                    if blob_key:
+                        released[blob_key] = released.get(blob_key, 0) + 1
+                    files, total = usage.get(user_id, (0, 0))
+                    usage[user_id] = (files + 1, total + size)
+                    deleted.append((user_id, s3_key))
+                cursor.execute(f"DELETE FROM files WHERE s3_key IN ({placeholders})", batch)
+
+            for user_id, (files, total) in usage.items():
+                self._add_usage(cursor, user_id, -files, -total)
+            for user_id, s3_key in deleted:
+                self._log_change(cursor, user_id, "delete", s3_key)
+            return self._release_blobs(cursor, released)
+
+    def get_blob(self, blob_key):
+        with self._read() as cursor:
+            cursor.execute("""
+                SELECT blob_key, content_hash, size, ref_count
+                FROM blobs
+                WHERE blob_key = %s
+            """, (blob_key,))
+            row = cursor.fetchone()
+
+        if not row:
+            return None
+        return {"blob_key": row[0], "content_hash": row[1], "size": row[2], "ref_count": row[3]}
+
+    def acquire_blob(self, blob_key):
+        with self._transaction() as cursor:
+            cursor.execute("UPDATE blobs SET ref_count = ref_count + 1 WHERE blob_key = %s", (blob_key,))
+            return cursor.rowcount > 0
+
+    def release_blob(self, blob_key):
+        with self._transaction() as cursor:
+            orphans = self._release_blobs(cursor, {blob_key: 1})
+        return orphans[0] if orphans else None
+
+    # ---------------------------------------------------------
+    # Virtual folders
+    # ---------------------------------------------------------
+    @staticmethod
+    def _folder_dict(row):
+        return {"id": row[0], "parent_id": row[1], "name": row[2], "created_at": row[3]}
+
+    def create_folder(self, user_id, parent_id, name, created_at):
+        try:
+            with self._transaction() as cursor:
+                cursor.execute("""
+                    INSERT INTO folders (user_id, parent_id, name, created_at)
+                    VALUES (%s, %s, %s, %s)
+                """, (user_id, parent_id, name, created_at))
+                folder_id = cursor.lastrowid
+                self._log_change(cursor, user_id, "folder_create", folder_key(user_id, folder_id),
+                                 filename=name, folder_id=parent_id)
+                return folder_id
+        except mysql.connector.IntegrityError as e:
+            raise DuplicateKeyError(str(e)) from e
+
+    def get_folder(self, user_id, folder_id):
+        with self._read() as cursor:
+            cursor.execute("""
+                SELECT id, parent_id, name, created_at
+                FROM folders
+                WHERE user_id = %s AND id = %s
+            """, (user_id, folder_id))
+            row = cursor.fetchone()
+        return self._folder_dict(row) if row else None
+
+    def find_folder(self, user_id, parent_id, name):
+        with self._read() as cursor:
+            cursor.execute("""
+                SELECT id, parent_id, name, created_at
+                FROM folders
+                WHERE user_id = %s AND parent_id = %s AND name = %s
+            """, (user_id, parent_id, name))
+            row = cursor.fetchone()
+        return self._folder_dict(row) if row else None
+
+    def list_child_folders(self, user_id, folder_id):
+        with self._read() as cursor:
+            cursor.execute("""
+                SELECT id, parent_id, name, created_at
+                FROM folders
+                WHERE user_id = %s AND parent_id = %s
+                ORDER BY name
+            """, (user_id, folder_id))
+            return [self._folder_dict(r) for r in cursor.fetchall()]
+
+    def list_folder_files(self, user_id, folder_id, limit, after=None):
+        where = "user_id = %s AND folder_id = %s"
+        params = [user_id, folder_id]
+        if after is not None:
+            where += " AND (filename > %s OR (filename = %s AND id > %s))"
+            params.extend([after[0], after[0], after[1]])
+
+        with self._read() as cursor:
+            cursor.execute(f"""
+                SELECT filename, s3_key, size, uploaded_at, id
+                FROM files
+                WHERE {where}
+                ORDER BY filename, id
+                LIMIT %s
+            """, params + [limit + 1])
+            rows = cursor.fetchall()
+
+        more = len(rows) > limit
+        rows = rows[:limit]
+        files = [{
+            "filename": r[0],
+            "s3_key": r[1],
+            "size": r[2],
+            "uploaded_at": r[3]
+        } for r in rows]
+        return files, (rows[-1][0], rows[-1][4]) if more else None
+
+    def folder_usage(self, user_id, folder_id):
+        # Recursive CTEs need MySQL 8.0+
+        with self._read() as cursor:
+            cursor.execute("""
+                WITH RECURSIVE subtree(id) AS (
+                    SELECT CAST(%s AS UNSIGNED)
+                    UNION ALL
+                    SELECT f.id FROM folders f JOIN subtree s ON f.user_id = %s AND f.parent_id = s.id
+                )
+                SELECT
+                    (SELECT COUNT(*) - 1 FROM subtree),
+                    COUNT(files.id),
+                    COALESCE(SUM(files.size), 0)
+                FROM files
+                WHERE files.user_id = %s AND files.folder_id IN (SELECT id FROM subtree)
+            """, (folder_id, user_id, user_id))
+            row = cursor.fetchone()
+        return {"folder_count": int(row[0]), "file_count": int(row[1]), "total_bytes": int(row[2])}
+
+    def move_folder(self, user_id, folder_id, parent_id, name):
+        try:
+            with self._transaction() as cursor:
+                cursor.execute("""
+                    WITH RECURSIVE ancestors(id) AS (
+                        SELECT CAST(%s AS UNSIGNED)
+                        UNION ALL
+                        SELECT f.parent_id FROM folders f JOIN ancestors a ON f.user_id = %s AND f.id = a.id
+                        WHERE f.parent_id != 0
+                    )
+                    SELECT 1 FROM ancestors WHERE id = %s
+                """, (parent_id, user_id, folder_id))
+                if cursor.fetchone():
+                    raise ValueError("Cannot move a folder into itself")
+
+                cursor.execute("""
+                    UPDATE folders SET parent_id = %s, name = %s
+                    WHERE user_id = %s AND id = %s
+                """, (parent_id, name, user_id, folder_id))
+                if cursor.rowcount:
+                    self._log_change(cursor, user_id, "folder_move", folder_key(user_id, folder_id),
+                                     filename=name, folder_id=parent_id)
+        except mysql.connector.IntegrityError as e:
+            raise DuplicateKeyError(str(e)) from e
+
+    def move_file(self, user_id, s3_key, folder_id, filename, new_s3_key):
+        try:
+            with self._transaction() as cursor:
+                cursor.execute("""
+                    SELECT blob_key, size, uploaded_at FROM files
+                    WHERE user_id = %s AND s3_key = %s
+                    FOR UPDATE
+                """, (user_id, s3_key))
+                row = cursor.fetchone()
+                if not row:
+                    return False
+                blob_key = row[0]
+                if not blob_key and new_s3_key != s3_key:
+                    # Adopt the object as a blob so its bytes stay put
+                    blob_key = s3_key
+                    cursor.execute("""
+                        INSERT INTO blobs (blob_key, content_hash, size, ref_count)
+                        VALUES (%s, '', %s, 1)
+                    """, (blob_key, row[1]))
+
+                cursor.execute("""
+                    UPDATE files SET folder_id = %s, filename = %s, s3_key = %s, blob_key = %s
+                    WHERE user_id = %s AND s3_key = %s
+                """, (folder_id, filename, new_s3_key, blob_key, user_id, s3_key))
+                self._log_change(cursor, user_id, "move", new_s3_key, old_s3_key=s3_key, filename=filename,
+                                 size=row[1], uploaded_at=row[2], folder_id=folder_id)
+                return True
+        except mysql.connector.IntegrityError as e:
+            raise DuplicateKeyError(str(e)) from e
+
+    def delete_folder(self, user_id, folder_id):
+        with self._transaction() as cursor:
+            cursor.execute("""
+                SELECT 1 FROM folders WHERE user_id = %s AND parent_id = %s
+                UNION ALL
+                SELECT 1 FROM files WHERE user_id = %s AND folder_id = %s
+                LIMIT 1
+            """, (user_id, folder_id, user_id, folder_id))
+            if cursor.fetchone():
+                return False
+            cursor.execute("DELETE FROM folders WHERE user_id = %s AND id = %s", (user_id, folder_id))
+            if cursor.rowcount:
+                self._log_change(cursor, user_id, "folder_delete", folder_key(user_id, folder_id))
+            return True
+
+    # ---------------------------------------------------------
+    # Usage
+    # ---------------------------------------------------------
+    def get_user_usage(self, user_id):
+        with self._read() as cursor:
+            cursor.execute("""
+                SELECT file_count, total_bytes
+                FROM user_usage
+                WHERE user_id = %s
+            """, (user_id,))
+            row = cursor.fetchone()
+
+        if not row:
+            return {"file_count": 0, "total_bytes": 0}
+        return {"file_count": row[0], "total_bytes": row[1]}
+
+    # ---------------------------------------------------------
+    # Change feed
+    # ---------------------------------------------------------
+    def get_changes(self, user_id, since, limit):
+        with self._read() as cursor:
+            cursor.execute("SELECT last_seq, floor_seq, log_rows FROM change_seq WHERE user_id = %s",
+                           (user_id,))
+            state = cursor.fetchone() or (0, 0, 0)
+            cursor.execute(f"""
+                SELECT {", ".join(CHANGE_COLUMNS)}
+                FROM file_changes
+                WHERE user_id = %s AND seq > %s
+                ORDER BY seq
+                LIMIT %s
+            """, (user_id, since, limit + 1))
+            rows = cursor.fetchall()
+
+        return {
+            "changes": [change_dict(r) for r in rows[:limit]],
+            "has_more": len(rows) > limit,
+            "latest_seq": state[0],
+            "floor_seq": state[1],
+            "log_rows": state[2]
+        }
+
+    def compact_changes(self, user_id, tombstone_before):
+        with self._transaction() as cursor:
+            # Lock the user's seq row: no new changes land mid-compaction
+            cursor.execute("SELECT floor_seq FROM change_seq WHERE user_id = %s FOR UPDATE", (user_id,))
+            if cursor.fetchone() is None:
+                return {"dropped": 0, "floor_seq": 0}
+            cursor.execute("""
+                SELECT seq, op, s3_key, old_s3_key, changed_at
+                FROM file_changes
+                WHERE user_id = %s
+                ORDER BY seq
+            """, (user_id,))
+            drop, floor, kept_tombstone = plan_compaction(cursor.fetchall(), tombstone_before)
+
+            for i in range(0, len(drop), IN_BATCH):
+                batch = drop[i:i + IN_BATCH]
+                cursor.execute(f"""
+                    DELETE FROM file_changes
+                    WHERE user_id = %s AND seq IN ({",".join(["%s"] * len(batch))})
+                """, [user_id] + batch)
+            cursor.execute("""
+                UPDATE change_seq SET floor_seq = GREATEST(floor_seq, %s), log_rows = log_rows - %s,
+                                      compacted_rows = log_rows, tombstone_at = %s
+                WHERE user_id = %s
+            """, (floor, len(drop), kept_tombstone, user_id))
+            cursor.execute("SELECT floor_seq FROM change_seq WHERE user_id = %s", (user_id,))
+            return {"dropped": len(drop), "floor_seq": cursor.fetchone()[0]}
+
+    def change_log_users(self, min_new_rows=0, tombstone_before=None):
+        with self._read() as cursor:
+            cursor.execute("""
+                SELECT c.user_id, c.log_rows, COALESCE(u.file_count, 0)
+                FROM change_seq c LEFT JOIN user_usage u ON u.user_id = c.user_id
+                WHERE c.log_rows - c.compacted_rows > %s OR c.tombstone_at < %s
+            """, (min_new_rows, tombstone_before))
+            return cursor.fetchall()
+
+    # ---------------------------------------------------------
+    # Resumable upload sessions
+    # ---------------------------------------------------------
+    def create_upload_session(self, upload_id, user_id, filename, s3_key, s3_upload_id, part_size,
+                              created_at):
+        try:
+            with self._transaction() as cursor:
+                cursor.execute("""
+                    INSERT INTO upload_sessions
+                        (upload_id, user_id, filename, s3_key, s3_upload_id, part_size, created_at)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s)
+                """, (upload_id, user_id, filename, s3_key, s3_upload_id, part_size, created_at))
+        except mysql.connector.IntegrityError as e:
+            raise DuplicateKeyError(str(e)) from e
+
+    def get_upload_session(self, upload_id):
+        return self._select_upload_session("upload_id", upload_id)
+
+    def find_upload_session(self, s3_key):
+        return self._select_upload_session("s3_key", s3_key)
+
+    def _select_upload_session(self, column, value):
+        with self._read() as cursor:
+            cursor.execute(f"""
+                SELECT upload_id, user_id, filename, s3_key, s3_upload_id, part_size, created_at
+                FROM upload_sessions
+                WHERE {column} = %s
+            """, (value,))
+            row = cursor.fetchone()
+
+        if not row:
+            return None
+        return {
+            "upload_id": row[0],
+            "user_id": row[1],
+            "filename": row[2],
+            "s3_key": row[3],
+            "s3_upload_id": row[4],
+            "part_size": row[5],
+            "created_at": row[6]
+        }
+
+    def save_upload_part(self, upload_id, part_number, etag, size):
+        with self._transaction() as cursor:
+            cursor.execute("""
+                INSERT INTO upload_parts (upload_id, part_number, etag, size)
+                VALUES (%s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE etag = VALUES(etag), size = VALUES(size)
+            """, (upload_id, part_number, etag, size))
+
+    def list_upload_parts(self, upload_id):
+        with self._read() as cursor:
+            cursor.execute("""
+                SELECT part_number, etag, size
+                FROM upload_parts
+                WHERE upload_id = %s
+                ORDER BY part_number
+            """, (upload_id,))
+            rows = cursor.fetchall()
+
+        return [{"part_number": r[0], "etag": r[1], "size": r[2]} for r in rows]
+
+    def delete_upload_session(self, upload_id):
+        with self._transaction() as cursor:
+            cursor.execute("DELETE FROM upload_parts WHERE upload_id = %s", (upload_id,))
+            cursor.execute("DELETE FROM upload_sessions WHERE upload_id = %s", (upload_id,))
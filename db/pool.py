@@ -0,0 +1,234 @@
+# db/pool.py
+import time
+import threading
+import mysql.connector
+from config import MYSQL_CONFIG, MYSQL_POOL_CONFIG
+
+
+class PoolExhaustedError(Exception):
+    """No connection became free within the acquire timeout."""
+
+
+class PooledConnection:
+    """
+    Thin wrapper handed out by the pool. It behaves like the underlying
+    mysql.connector connection, except close() gives it back to the pool
+    instead of tearing down the socket.
+    """
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def close(self):
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            self._pool.release(conn)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ConnectionPool:
+    """
+    Size-bounded MySQL connection pool.
+
+    Connections are opened lazily up to `size`; when all are in use,
+    callers wait up to `acquire_timeout` seconds and then get
+    PoolExhaustedError. Idle connections are pinged (and reconnected)
+    before reuse if they sat longer than `ping_after` seconds, and
+    replaced once older than `recycle` seconds, so a MySQL wait_timeout
+    or a failover never surfaces as a failed login. Returned connections
+    are rolled back, so the next borrower doesn't inherit an open
+    snapshot.
+    """
+
+    def __init__(self, connect_args, size=10, acquire_timeout=5.0, ping_after=30.0, recycle=3600.0):
+        if size < 1:
+            raise ValueError("size must be at least 1")
+        self.connect_args = connect_args
+        self.size = size
+        self.acquire_timeout = acquire_timeout
+        self.ping_after = ping_after
+        self.recycle = recycle
+
+        self._idle = []          # (conn, created_at, returned_at), LIFO
+        self._open = 0
+        self._in_use = 0
+        self._cond = threading.Condition()
+
+        # Counters for sizing the pool (see stats())
+        self._acquires = 0
+        self._waits = 0
+        self._wait_time = 0.0
+        self._max_wait = 0.0
+        self._timeouts = 0
+        self._created = 0
+        self._discarded = 0
+        self._created_at = {}
+
+    # ---------------------------------------------------------
+    # Borrow / return
+    # ---------------------------------------------------------
+    def connection(self):
+        """Borrow a healthy connection; close() it to return it."""
+        started = time.monotonic()
+        deadline = started + self.acquire_timeout
+        waited = False
+
+        with self._cond:
+            while True:
+                if self._idle:
+                    conn, created_at, returned_at = self._idle.pop()
+                    self._in_use += 1
+                    break
+                if self._open < self.size:
+                    conn = None
+                    self._open += 1
+                    self._in_use += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolExhaustedError(
+                        f"No MySQL connection free after {self.acquire_timeout:g}s (pool size {self.size})")
+                waited = True
+                self._cond.wait(remaining)
+
+            waited_for = time.monotonic() - started
+            self._acquires += 1
+            self._wait_time += waited_for
+            self._max_wait = max(self._max_wait, waited_for)
+            if waited:
+                self._waits += 1
+
+        # Network work happens outside the lock
+        try:
+            if conn is None:
+                conn = self._connect()
+            else:
+                conn = self._check(conn, created_at, returned_at)
+        except BaseException:
+            with self._cond:
+                self._open -= 1
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+        return PooledConnection(self, conn)
+
+    def release(self, conn):
+        """Return a connection; broken ones are dropped instead of reused."""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            healthy = conn.is_connected()
+        except mysql.connector.Error:
+            healthy = False
+
+        with self._cond:
+            self._in_use -= 1
+            if healthy:
+                self._idle.append((conn, self._created_at.get(id(conn), time.monotonic()), time.monotonic()))
+            else:
+                self._open -= 1
+                self._discarded += 1
+                self._created_at.pop(id(conn), None)
+            self._cond.notify()
+
+        if not healthy:
+            self._close_quietly(conn)
+
+    def close_all(self):
+        """Close idle connections (e.g. on shutdown)."""
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._open -= len(idle)
+        for conn, _, _ in idle:
+            self._created_at.pop(id(conn), None)
+            self._close_quietly(conn)
+
+    # ---------------------------------------------------------
+    # Stats
+    # ---------------------------------------------------------
+    def stats(self):
+        with self._cond:
+            return {
+                "size": self.size,
+                "open": self._open,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "utilisation": round(self._in_use / self.size, 3),
+                "acquires": self._acquires,
+                "waits": self._waits,
+                "timeouts": self._timeouts,
+                "avg_wait_ms": round(self._wait_time / self._acquires * 1000, 3) if self._acquires else 0.0,
+                "max_wait_ms": round(self._max_wait * 1000, 3),
+                "created": self._created,
+                "discarded": self._discarded
+            }
+
+    # ---------------------------------------------------------
+    # Internals
+    # ---------------------------------------------------------
+    def _connect(self):
+        conn = mysql.connector.connect(**self.connect_args)
+        with self._cond:
+            self._created += 1
+            self._created_at[id(conn)] = time.monotonic()
+        return conn
+
+    def _check(self, conn, created_at, returned_at):
+        now = time.monotonic()
+        if now - created_at > self.recycle:
+            self._replace(conn)
+            return self._connect()
+        if now - returned_at > self.ping_after:
+            try:
+                conn.ping(reconnect=True, attempts=1, delay=0)
+            except mysql.connector.Error:
+                self._replace(conn)
+                return self._connect()
+        return conn
+
+    def _replace(self, conn):
+        with self._cond:
+            self._discarded += 1
+            self._created_at.pop(id(conn), None)
+        self._close_quietly(conn)
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+# ---------------------------------------------------------
+# Shared pool (auth routes and db/db_connection)
+# ---------------------------------------------------------
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    {k: v for k, v in MYSQL_CONFIG.items() if v is not None},
+                    **MYSQL_POOL_CONFIG
+                )
+    return _pool
+
+
+def pool_stats():
+    """Stats of the shared pool, or None if nothing has used it yet."""
+    return _pool.stats() if _pool is not None else None
@@ -0,0 +1,350 @@
+# db/repository.py
+import abc
+import threading
+import sqlite3
+from config import METADATA_BACKEND, METADATA_CACHE_SIZE, METADATA_CACHE_TTL
+# Re-exported: routes import the column layouts from here
+from db.common import (  # noqa: F401
+    LIST_COLUMNS, LIST_SORT_COLUMNS, SEARCH_MODES, CHANGE_COLUMNS, CHANGE_OPS, DELETE_OPS, change_dict,
+    folder_key, plan_compaction
+)
+
+
+class DuplicateKeyError(Exception):
+    """A file record with this s3_key already exists."""
+
+
+class FileRepository(abc.ABC):
+    """
+    Storage interface for file metadata (files, virtual folders, dedup
+    blobs, per-user usage totals, resumable upload sessions). Routes talk to this, never to a database driver,
+    so the backend can be swapped by config:
+
+        METADATA_BACKEND=sqlite  local cloudfiles.db (single API node)
+        METADATA_BACKEND=mysql   shared MySQL (any number of API nodes)
+
+    Return shapes are the same for every backend:
+      get_file_record     -> (filename, user_id, size, uploaded_at,
+                              blob_key, encryption, codec) or None
+      list_user_files_page -> (files, last) with files as dicts
+      iter_user_files     -> iterator of LIST_COLUMNS tuples
+      get_changes         -> {"changes", "has_more", "latest_seq", "floor_seq",
+                              "log_rows"}
+
+    Every create, delete and move of a file also appends a row to the
+    user's change log, in the same transaction, numbered by a per-user
+    sequence (see /files/changes).
+    """
+
+    # ---------------- Files ----------------
+    @abc.abstractmethod
+    def save_file_record(self, user_id, filename, s3_key, size, uploaded_at, blob_key=None,
+                         content_hash=None, encryption=None, codec=None, folder_id=0, blob_acquired=False):
+        """
+        Insert a file row (bumping its blob's ref_count unless `blob_acquired`);
+        DuplicateKeyError if s3_key exists.
+        """
+
+    @abc.abstractmethod
+    def save_file_records(self, records):
+        """Insert many rows in one transaction; returns an error string or None per record."""
+
+    @abc.abstractmethod
+    def list_user_files_page(self, user_id, limit, after=None, sort="uploaded_at", order="desc",
+                             since=None, until=None, name_prefix=None):
+        """One keyset page of a user's files; returns (files, last)."""
+
+    @abc.abstractmethod
+    def iter_user_files(self, user_id, sort="uploaded_at", order="desc", since=None, until=None,
+                        name_prefix=None):
+        """Stream a user's whole listing as LIST_COLUMNS tuples."""
+
+    @abc.abstractmethod
+    def search_user_files(self, user_id, query, mode="substring", limit=50, after=None):
+        """One page of the user's files matching `query` (SEARCH_MODES); returns (files, last)."""
+
+    @abc.abstractmethod
+    def get_file_record(self, s3_key):
+        """The file's record tuple, or None."""
+
+    @abc.abstractmethod
+    def get_existing_s3_keys(self, s3_keys):
+        """The subset of `s3_keys` that already have a record."""
+
+    @abc.abstractmethod
+    def delete_file_record(self, s3_key):
+        """Delete one row; returns the blob key that lost its last reference, or None."""
+
+    @abc.abstractmethod
+    def find_user_file_keys(self, user_id, s3_keys=None, prefix=None):
+        """(s3_key, blob_key) pairs of the user's files matching a key list or prefix."""
+
+    @abc.abstractmethod
+    def get_user_file_records(self, user_id, s3_keys=None, prefix=None, limit=-1):
+        """Full record dicts of the user's files matching a key list or prefix."""
+
+    @abc.abstractmethod
+    def delete_file_records(self, s3_keys):
+        """Delete many rows in one transaction; returns orphaned blob keys."""
+
+    @abc.abstractmethod
+    def get_blob(self, blob_key):
+        """Blob dict (blob_key, content_hash, size, ref_count), or None."""
+
+    @abc.abstractmethod
+    def acquire_blob(self, blob_key):
+        """Bump an existing blob's ref_count in a write transaction; False if there is none."""
+
+    @abc.abstractmethod
+    def release_blob(self, blob_key):
+        """Drop one reference; returns the blob key if it was the last, else None."""
+
+    # ---------------- Folders (folder id 0 is the root) ----------------
+    @abc.abstractmethod
+    def create_folder(self, user_id, parent_id, name, created_at):
+        """New folder's id; DuplicateKeyError if the parent already has that name."""
+
+    @abc.abstractmethod
+    def get_folder(self, user_id, folder_id):
+        """Folder dict (id, parent_id, name, created_at), or None."""
+
+    @abc.abstractmethod
+    def find_folder(self, user_id, parent_id, name):
+        """The named child of `parent_id`, or None."""
+
+    @abc.abstractmethod
+    def list_child_folders(self, user_id, folder_id):
+        """Direct subfolders, by name."""
+
+    @abc.abstractmethod
+    def list_folder_files(self, user_id, folder_id, limit, after=None):
+        """One keyset page of the files directly in a folder; returns (files, last)."""
+
+    @abc.abstractmethod
+    def folder_usage(self, user_id, folder_id):
+        """Recursive {"folder_count", "file_count", "total_bytes"}."""
+
+    @abc.abstractmethod
+    def move_folder(self, user_id, folder_id, parent_id, name):
+        """Re-parent/rename in one write; ValueError on a cycle, DuplicateKeyError on a name clash."""
+
+    @abc.abstractmethod
+    def move_file(self, user_id, s3_key, folder_id, filename, new_s3_key):
+        """Move/rename one file; False if it doesn't exist, DuplicateKeyError on a name clash."""
+
+    @abc.abstractmethod
+    def delete_folder(self, user_id, folder_id):
+        """Delete an empty folder; False if it has children."""
+
+    # ---------------- Usage ----------------
+    @abc.abstractmethod
+    def get_user_usage(self, user_id):
+        """{"file_count", "total_bytes"} from the incrementally kept totals."""
+
+    # ---------------- Change log ----------------
+    @abc.abstractmethod
+    def get_changes(self, user_id, since, limit):
+        """Up to `limit` changes with seq > since, oldest first, plus the log's seq state."""
+
+    @abc.abstractmethod
+    def compact_changes(self, user_id, tombstone_before):
+        """Apply plan_compaction() to one user's log; returns {"dropped", "floor_seq"}."""
+
+    @abc.abstractmethod
+    def change_log_users(self, min_new_rows=0, tombstone_before=None):
+        """
+        (user_id, log_rows, file_count) for users with more than `min_new_rows`
+        rows since their last compaction, or a kept tombstone older than `tombstone_before`.
+        """
+
+    # ---------------- Resumable uploads ----------------
+    @abc.abstractmethod
+    def create_upload_session(self, upload_id, user_id, filename, s3_key, s3_upload_id, part_size,
+                              created_at):
+        pass
+
+    @abc.abstractmethod
+    def get_upload_session(self, upload_id):
+        pass
+
+    @abc.abstractmethod
+    def find_upload_session(self, s3_key):
+        """The in-progress upload reserving s3_key (one per key), or None."""
+
+    @abc.abstractmethod
+    def save_upload_part(self, upload_id, part_number, etag, size):
+        pass
+
+    @abc.abstractmethod
+    def list_upload_parts(self, upload_id):
+        pass
+
+    @abc.abstractmethod
+    def delete_upload_session(self, upload_id):
+        pass
+
+    # ---------------- Connections ----------------
+    def release_connection(self):
+        """Called when a request ends; backends with per-thread connections hand theirs back."""
+
+
+class SQLiteFileRepository(FileRepository):
+    """The local SQLite store in database.py."""
+
+    def __init__(self):
+        import database
+        self._db = database
+
+    def save_file_record(self, *args, **kwargs):
+        try:
+            return self._db.save_file_record(*args, **kwargs)
+        except sqlite3.IntegrityError as e:
+            raise DuplicateKeyError(str(e)) from e
+
+    def save_file_records(self, records):
+        return self._db.save_file_records(records)
+
+    def list_user_files_page(self, *args, **kwargs):
+        return self._db.list_user_files_page(*args, **kwargs)
+
+    def iter_user_files(self, *args, **kwargs):
+        return self._db.iter_user_files(*args, **kwargs)
+
+    def search_user_files(self, *args, **kwargs):
+        return self._db.search_user_files(*args, **kwargs)
+
+    def get_file_record(self, s3_key):
+        return self._db.get_file_record(s3_key)
+
+    def get_existing_s3_keys(self, s3_keys):
+        return self._db.get_existing_s3_keys(s3_keys)
+
+    def delete_file_record(self, s3_key):
+        return self._db.delete_file_record(s3_key)
+
+    def find_user_file_keys(self, *args, **kwargs):
+        return self._db.find_user_file_keys(*args, **kwargs)
+
+    def get_user_file_records(self, *args, **kwargs):
+        return self._db.get_user_file_records(*args, **kwargs)
+
+    def delete_file_records(self, s3_keys):
+        return self._db.delete_file_records(s3_keys)
+
+    def get_blob(self, blob_key):
+        return self._db.get_blob(blob_key)
+
+    def acquire_blob(self, blob_key):
+        return self._db.acquire_blob(blob_key)
+
+    def release_blob(self, blob_key):
+        return self._db.release_blob(blob_key)
+
+    def create_folder(self, *args, **kwargs):
+        try:
+            return self._db.create_folder(*args, **kwargs)
+        except sqlite3.IntegrityError as e:
+            raise DuplicateKeyError(str(e)) from e
+
+    def get_folder(self, user_id, folder_id):
+        return self._db.get_folder(user_id, folder_id)
+
+    def find_folder(self, user_id, parent_id, name):
+        return self._db.find_folder(user_id, parent_id, name)
+
+    def list_child_folders(self, user_id, folder_id):
+        return self._db.list_child_folders(user_id, folder_id)
+
+    def list_folder_files(self, *args, **kwargs):
+        return self._db.list_folder_files(*args, **kwargs)
+
+    def folder_usage(self, user_id, folder_id):
+        return self._db.folder_usage(user_id, folder_id)
+
+    def move_folder(self, *args, **kwargs):
+        try:
+            return self._db.move_folder(*args, **kwargs)
+        except sqlite3.IntegrityError as e:
+            raise DuplicateKeyError(str(e)) from e
+
+    def move_file(self, *args, **kwargs):
+        try:
+            return self._db.move_file(*args, **kwargs)
+        except sqlite3.IntegrityError as e:
+            raise DuplicateKeyError(str(e)) from e
+
+    def delete_folder(self, user_id, folder_id):
+        return self._db.delete_folder(user_id, folder_id)
+
+    def get_user_usage(self, user_id):
+        return self._db.get_user_usage(user_id)
+
+    def get_changes(self, user_id, since, limit):
+        return self._db.get_changes(user_id, since, limit)
+
+    def compact_changes(self, user_id, tombstone_before):
+        return self._db.compact_changes(user_id, tombstone_before)
+
+    def change_log_users(self, min_new_rows=0, tombstone_before=None):
+        return self._db.change_log_users(min_new_rows, tombstone_before)
+
+    def create_upload_session(self, *args, **kwargs):
+        try:
+            return self._db.create_upload_session(*args, **kwargs)
+        except sqlite3.IntegrityError as e:
+            raise DuplicateKeyError(str(e)) from e
+
+    def get_upload_session(self, upload_id):
+        return self._db.get_upload_session(upload_id)
+
+    def find_upload_session(self, s3_key):
+        return self._db.find_upload_session(s3_key)
+
+    def save_upload_part(self, *args, **kwargs):
+        return self._db.save_upload_part(*args, **kwargs)
+
+    def list_upload_parts(self, upload_id):
+        return self._db.list_upload_parts(upload_id)
+
+    def delete_upload_session(self, upload_id):
+        return self._db.delete_upload_session(upload_id)
+
+    def release_connection(self):
+        self._db.release_connection()
+
+
+# ---------------------------------------------------------
+# Backend selection
+# ---------------------------------------------------------
+_repository = None
+_repository_lock = threading.Lock()
+
+
+def create_repository(backend, cache_size=0, cache_ttl=METADATA_CACHE_TTL):
+    if backend == "sqlite":
+        repo = SQLiteFileRepository()
+    elif backend == "mysql":
+        from db.mysql_repository import MySQLFileRepository
+        repo = MySQLFileRepository()
+    else:
+        raise ValueError(f"Unknown METADATA_BACKEND: {backend}")
+    if cache_size > 0:
+        from db.cache import CachingFileRepository, MetadataCache
+        repo = CachingFileRepository(repo, MetadataCache(cache_size, cache_ttl))
+    return repo
+
+
+def get_repository():
+    """The process-wide repository for METADATA_BACKEND."""
+    global _repository
+    if _repository is None:
+        with _repository_lock:
+            if _repository is None:
+                _repository = create_repository(METADATA_BACKEND, METADATA_CACHE_SIZE)
+    return _repository
+
+
+def cache_stats():
+    """Hit/miss counters of the metadata cache, or None if it is off."""
+    cache = getattr(_repository, "cache", None)
+    return cache.stats() if cache is not None else None
@@ -1,16 +1,22 @@
 # routes/auth.py
 from flask import Blueprint, request, jsonify
-from werkzeug.security import generate_password_hash, check_password_hash
 from flask_jwt_extended import create_access_token
 import mysql.connector
-from config import MYSQL_CONFIG
+from db.pool import get_pool, PoolExhaustedError
+from utils.password_hasher import get_hasher, HashingBusyError
 
 auth_bp = Blueprint("auth", __name__)
 
 # ---------------- Helper ----------------
 def get_db_connection():
-    """Create a new MySQL connection."""
-    return mysql.connector.connect(**{k: v for k, v in MYSQL_CONFIG.items() if v is not None})
+    """Borrow a pooled MySQL connection; close() returns it to the pool."""
+    return get_pool().connection()
+
+
+def busy_response():
+    response = jsonify({"error": "Server busy, try again"})
+    response.headers["Retry-After"] = "1"
+    return response, 503
 
 # ---------------- Signup ----------------
 @auth_bp.route("/signup", methods=["POST"])
@@ -23,7 +29,11 @@ def signup():
     if not username or not email or not raw_password:
         return jsonify({"error": "username, email, and password are required"}), 400
 
-    hashed_password = generate_password_hash(raw_password)
+    # Runs in the hashing pool, not on this request thread
+    try:
+        hashed_password = get_hasher().hash(raw_password)
+    except HashingBusyError:
+        return busy_response()
 
     conn = cursor = None
     try:
@@ -39,6 +49,9 @@ def signup():
     except mysql.connector.IntegrityError:
         return jsonify({"error": "User with that email or username already exists"}), 400
 
+    except PoolExhaustedError:
+        return busy_response()
+
     except Exception as e:
         return jsonify({"error": "Database error", "details": str(e)}), 500
 
@@ -65,20 +78,51 @@ def login():
         cursor.execute("SELECT * FROM users WHERE email = %s", (email,))
         user = cursor.fetchone()
 
-        if not user:
-            return jsonify({"error": "User not found"}), 404
+    except PoolExhaustedError:
+        return busy_response()
 
-        if not check_password_hash(user["password"], password):
-            return jsonify({"error": "Invalid email or password"}), 401
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
-        # ✔ FIX: Convert identity to STRING
-        token = create_access_token(identity=str(user["id"]))
+    finally:
+        # Give the connection back before hashing: a login storm must not
+        # hold the MySQL pool while it waits for the KDF
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
 
-        return jsonify({"token": token, "username": user["username"]}), 200
+    if not user:
+        return jsonify({"error": "User not found"}), 404
+
+    try:
+        ok, new_hash = get_hasher().verify(user["password"], password)
+    except HashingBusyError:
+        return busy_response()
+
+    if not ok:
+        return jsonify({"error": "Invalid email or password"}), 401
+
+    # Stored with an older method/cost: upgrade it now we have the password
+    if new_hash:
+        rehash_password(user["id"], new_hash)
+
+    # ✔ FIX: Convert identity to STRING
+    token = create_access_token(identity=str(user["id"]))
+
+    return jsonify({"token": token, "username": user["username"]}), 200
 
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
 
+def rehash_password(user_id, new_hash):
+    """Best effort: on failure the old hash still works and is retried next login."""
+    conn = cursor = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute("UPDATE users SET password = %s WHERE id = %s", (new_hash, user_id))
+        conn.commit()
+    except Exception as e:
+        print("❌ Password rehash failed:", e)
     finally:
         if cursor:
             cursor.close()
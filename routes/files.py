@@ -1,46 +1,685 @@
 # routes/files.py
 import os
 import time
-import io
-from flask import Blueprint, request, jsonify
+import json
+import base64
+import hashlib
+import uuid
+import zipfile
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from flask import Blueprint, request, jsonify, Response, stream_with_context, url_for
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from utils.s3_helper import upload_bytes, generate_presigned_url, delete_s3_object
-from database import save_file_record, list_user_files, get_file_record, delete_file_record
+from werkzeug.http import http_date
+from config import (
+    S3_TRANSFER_CONFIG, ENCRYPT_UPLOADS, COMPRESS_UPLOADS, BATCH_UPLOAD_CONCURRENCY, MAX_BATCH_FILES,
+    ZIP_READAHEAD, MAX_PRESIGN_BATCH, LIST_PAGE_SIZE, MAX_LIST_PAGE_SIZE, USER_QUOTA_BYTES,
+    USER_QUOTA_FILES, CHANGES_PAGE_SIZE, CHANGE_TOMBSTONE_DAYS
+)
+from utils.s3_helper import (
+    upload_stream, generate_presigned_url, delete_s3_object,
+    create_multipart_upload, upload_part, complete_multipart_upload, abort_multipart_upload,
+    generate_presigned_upload_url, generate_presigned_part_urls, head_object, blob_key_for,
+    get_object_stream, delete_s3_objects
+)
+from utils.encryption_helper import encrypt_stream, decrypt_stream, decrypt_range, STREAM_ENCRYPTION
+from utils.s3_transfer import MIN_PART_SIZE, MAX_PARTS
+from utils.compression_helper import (
+    choose_codec, compress_stream, decompress_stream, CompressionStats, SAMPLE_SIZE
+)
+from utils.stream_helper import read_exact, spool_and_hash, iter_chunks, IterStream, CHUNK_SIZE
+from utils.logger import log_action
+from utils.zip_stream import stream_zip
+from db.repository import get_repository, DuplicateKeyError, LIST_COLUMNS, folder_key
 
 files_bp = Blueprint("files", __name__)
 
+# File metadata store (SQLite or shared MySQL, per METADATA_BACKEND)
+repo = get_repository()
+
+
+# -------------------------------------------------------
+# USAGE & QUOTAS
+# Totals come from the user_usage row, kept in step with every insert
+# and delete, so checks cost one primary-key read, not a scan.
+# -------------------------------------------------------
+class QuotaExceededError(Exception):
+    pass
+
+
+class _ByteBudget:
+    """
+    Bytes left for one request, shared by the files of a batch: each
+    upload takes its size once it is known (chunked bodies declare none)
+    and gives it back if it never reaches S3. None means unlimited.
+    """
+
+    def __init__(self, remaining):
+        self.remaining = remaining
+        self._lock = threading.Lock()
+
+    def take(self, size):
+        if self.remaining is None:
+            return
+        with self._lock:
+            if size > self.remaining:
+                raise QuotaExceededError()
+            self.remaining -= size
+
+    def give_back(self, size):
+        if self.remaining is None:
+            return
+        with self._lock:
+            self.remaining += size
+
+
+def _remaining_quota(user_id):
+    """(bytes, files) the user may still add; None means unlimited."""
+    if not USER_QUOTA_BYTES and not USER_QUOTA_FILES:
+        return None, None
+    usage = repo.get_user_usage(user_id)
+    remaining_bytes = USER_QUOTA_BYTES - usage["total_bytes"] if USER_QUOTA_BYTES else None
+    remaining_files = USER_QUOTA_FILES - usage["file_count"] if USER_QUOTA_FILES else None
+    return remaining_bytes, remaining_files
+
+
+def _quota_check(user_id, incoming_bytes, incoming_files=1):
+    """413 response if this would exceed the user's quota, else None."""
+    remaining_bytes, remaining_files = _remaining_quota(user_id)
+    if (remaining_files is not None and incoming_files > remaining_files) or \
+            (remaining_bytes is not None and incoming_bytes > remaining_bytes):
+        return _quota_exceeded(user_id)
+    return None
+
+
+def _quota_exceeded(user_id):
+    return jsonify(dict(_usage(user_id), error="Storage quota exceeded")), 413
+
+
+def _usage(user_id):
+    usage = repo.get_user_usage(user_id)
+    return {
+        "file_count": usage["file_count"],
+        "total_bytes": usage["total_bytes"],
+        "quota_bytes": USER_QUOTA_BYTES or None,
+        "quota_files": USER_QUOTA_FILES or None
+    }
+
+
+@files_bp.route("/usage", methods=["GET"])
+@jwt_required()
+def usage():
+    return jsonify(_usage(get_jwt_identity())), 200
+
 
 # -------------------------------------------------------
 # UPLOAD FILE
 # -------------------------------------------------------
-@files_bp.route("/upload", methods=["POST"])
+@files_bp.route("/upload", methods=["POST", "PUT"])
 @jwt_required()
 def upload_file():
     user_id = get_jwt_identity()
 
-    if "file" not in request.files:
-        return jsonify({"error": "No file uploaded"}), 400
+    # Quota check on the declared length (multipart framing included),
+    # before request.files parses the body or anything reaches S3
+    remaining_bytes, remaining_files = _remaining_quota(user_id)
+    if (remaining_files is not None and remaining_files < 1) or \
+            (remaining_bytes is not None and (request.content_length or 0) > remaining_bytes):
+        return _quota_exceeded(user_id)
 
-    file = request.files["file"]
-    if file.filename == "":
-        return jsonify({"error": "Empty filename"}), 400
+    # Raw body upload: PUT/POST the bytes directly with ?filename=...
+    # The body is read off the socket in bounded chunks (and spooled to
+    # disk for hashing, see _store_upload).
+    if not request.mimetype.startswith("multipart/"):
+        filename = os.path.basename(request.args.get("filename", ""))
+        if not filename:
+            return jsonify({"error": "No file uploaded"}), 400
+        stream = request.stream
+    else:
+        if "file" not in request.files:
+            return jsonify({"error": "No file uploaded"}), 400
 
-    filename = file.filename
+        file = request.files["file"]
+        if file.filename == "":
+            return jsonify({"error": "Empty filename"}), 400
+        if "/" in file.filename:
+            return jsonify({"error": "Filename must not contain '/'"}), 400
+
+        filename = file.filename
+        # werkzeug spools large parts to a temp file, never whole into RAM
+        stream = file.stream
+
+    # Optional ?folder=a/b (must exist; see POST /files/folders)
+    try:
+        folder = _resolve_folder(user_id, request.args.get("folder"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if folder is None:
+        return jsonify({"error": "Folder not found"}), 404
 
-    # Read file safely in memory
-    file_bytes = file.read()
-    size = len(file_bytes)
+    s3_key = _file_key(user_id, folder["id"], filename)
+    if repo.get_file_record(s3_key):
+        return jsonify({"error": "File already exists"}), 409
+
+    try:
+        record, result = _store_upload(user_id, filename, stream, _ByteBudget(remaining_bytes),
+                                       folder_id=folder["id"])
+    except QuotaExceededError:
+        return _quota_exceeded(user_id)
+    except Exception as e:
+        return jsonify({"error": f"S3 upload failed: {str(e)}"}), 500
+
+    try:
+        repo.save_file_record(**record)
+    except DuplicateKeyError:
+        _discard_upload(record)
+        return jsonify({"error": "File already exists"}), 409
+
+    return jsonify(dict(result, message="File uploaded successfully")), 200
+
+
+def _store_upload(user_id, filename, stream, budget=None, folder_id=0):
+    """
+    Run one upload through the pipeline: hash (dedup) -> compress ->
+    encrypt -> S3. Returns (record, result): the save_file_record kwargs
+    and the per-file response fields. Touches no request state, so batch
+    uploads can call it from worker threads. Raises QuotaExceededError
+    before anything is sent when the content does not fit in `budget`
+    (a _ByteBudget; covers chunked bodies, which declare no length).
+    """
+    s3_key = _file_key(user_id, folder_id, filename)
+
+    # Hash the whole body before sending any of it: the blob key is the
+    # content hash, and skipping the PUT for content we already hold needs
+    # that key up front. The tradeoff: a raw body is no longer sent to S3
+    # as it arrives. It is spooled to a temp file (disk up to the file
+    # size, memory still bounded) and the PUT starts once the client is done.
+    stream, content_hash, size = spool_and_hash(stream)
+    if budget is not None:
+        budget.take(size)
+
+    codec = None
+    if COMPRESS_UPLOADS:
+        start = stream.tell()
+        codec = choose_codec(stream.read(SAMPLE_SIZE), filename)
+        stream.seek(start)
+    encryption = STREAM_ENCRYPTION if ENCRYPT_UPLOADS else None
+
+    blob_key = blob_key_for(user_id, content_hash, codec, "enc" if encryption else None)
+    # Take the reference before skipping the PUT, so a concurrent delete
+    # can't drop the blob (and its object) before our row is saved
+    deduplicated = repo.acquire_blob(blob_key)
+    stats = None
+    if not deduplicated:
+        # plaintext -> compress -> encrypt -> S3
+        chunks = iter_chunks(stream)
+        if codec:
+            stats = CompressionStats(codec)
+            chunks = compress_stream(chunks, codec, stats)
+        if encryption:
+            chunks = encrypt_stream(chunks)
+        try:
+            upload_stream(IterStream(chunks), blob_key)
+        except Exception:
+            if budget is not None:
+                budget.give_back(size)
+            raise
+
+    if stats:
+        log_action(user_id, f"upload [{stats.codec} ratio={stats.ratio} cpu={stats.to_dict()['cpu_ms']}ms]", filename)
+
+    uploaded_at = int(time.time())
+    record = {
+        "user_id": user_id,
+        "filename": filename,
+        "s3_key": s3_key,
+        "size": size,
+        "uploaded_at": uploaded_at,
+        "blob_key": blob_key,
+        "content_hash": content_hash,
+        "encryption": encryption,
+        "codec": codec,
+        "folder_id": folder_id,
+        "blob_acquired": deduplicated
+    }
+    result = {
+        "filename": filename,
+        "file_size": size,
+        "uploaded_at": uploaded_at,
+        "s3_key": s3_key,
+        "deduplicated": deduplicated,
+        "compression": stats.to_dict() if stats else None
+    }
+    return record, result
+
+
+def _discard_upload(record):
+    """Undo _store_upload for a record whose row could not be saved."""
+    blob_key = record["blob_key"]
+    try:
+        if record["blob_acquired"]:
+            orphan = repo.release_blob(blob_key)
+        else:
+            # We uploaded it; only remove it if no other upload saved it since
+            orphan = blob_key if repo.get_blob(blob_key) is None else None
+        if orphan:
+            delete_s3_object(orphan)
+    except Exception as e:
+        print("❌ Orphaned blob left in S3:", blob_key, e)
+
+
+# -------------------------------------------------------
+# BATCH UPLOAD — many files in one multipart request
+# S3 writes run on a bounded pool; rows go in one transaction
+# -------------------------------------------------------
+@files_bp.route("/upload/batch", methods=["POST"])
+@jwt_required()
+def upload_batch():
+    user_id = get_jwt_identity()
+
+    # Bytes are checked before the body is parsed, the file count after;
+    # each file then takes its real size from the shared budget
+    remaining_bytes, remaining_files = _remaining_quota(user_id)
+    if remaining_bytes is not None and (request.content_length or 0) > remaining_bytes:
+        return _quota_exceeded(user_id)
+
+    files = [f for f in request.files.getlist("files") if f.filename]
+    if not files:
+        return jsonify({"error": "No files uploaded"}), 400
+    if len(files) > MAX_BATCH_FILES:
+        return jsonify({"error": f"At most {MAX_BATCH_FILES} files per batch"}), 400
+    if remaining_files is not None and len(files) > remaining_files:
+        return _quota_exceeded(user_id)
+    budget = _ByteBudget(remaining_bytes)
+
+    try:
+        folder = _resolve_folder(user_id, request.args.get("folder"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if folder is None:
+        return jsonify({"error": "Folder not found"}), 404
+    folder_id = folder["id"]
+
+    results = [None] * len(files)
+    pending = []
+    seen = repo.get_existing_s3_keys([_file_key(user_id, folder_id, f.filename) for f in files])
+    for i, f in enumerate(files):
+        s3_key = _file_key(user_id, folder_id, f.filename)
+        if "/" in f.filename:
+            results[i] = {"filename": f.filename, "error": "Filename must not contain '/'"}
+        elif s3_key in seen:
+            results[i] = {"filename": f.filename, "s3_key": s3_key, "error": "File already exists"}
+        else:
+            seen.add(s3_key)
+            pending.append(i)
+
+    with ThreadPoolExecutor(max_workers=BATCH_UPLOAD_CONCURRENCY) as pool:
+        futures = {i: pool.submit(_store_upload, user_id, files[i].filename, files[i].stream,
+                                  budget, folder_id=folder_id)
+                   for i in pending}
+
+    records, indexes = [], []
+    for i, future in futures.items():
+        try:
+            record, result = future.result()
+        except QuotaExceededError:
+            results[i] = {"filename": files[i].filename, "error": "Storage quota exceeded"}
+            continue
+        except Exception as e:
+            results[i] = {"filename": files[i].filename, "error": f"S3 upload failed: {str(e)}"}
+            continue
+        records.append(record)
+        indexes.append(i)
+        results[i] = result
+
+    for i, record, error in zip(indexes, records, repo.save_file_records(records)):
+        if error:
+            _discard_upload(record)
+            results[i] = {"filename": files[i].filename, "s3_key": results[i]["s3_key"],
+                          "error": "File already exists"}
+
+    uploaded = sum(1 for r in results if "error" not in r)
+    return jsonify({
+        "message": f"{uploaded} of {len(files)} files uploaded",
+        "results": results
+    }), 200 if uploaded == len(files) else 207
+
+
+# -------------------------------------------------------
+# RESUMABLE UPLOAD
+# initiate -> PUT parts (any order, retry freely) -> complete
+# -------------------------------------------------------
+MAX_RESUMABLE_PART_SIZE = 64 * 1024 * 1024
+
+
+def _get_owned_session(upload_id, user_id):
+    session = repo.get_upload_session(upload_id)
+    if not session or str(session["user_id"]) != str(user_id):
+        return None
+    return session
+
+
+def _upload_in_progress(s3_key):
+    """409 naming the resumable upload that reserves s3_key, else None."""
+    pending = repo.find_upload_session(s3_key)
+    if pending is None:
+        return None
+    # Same user (the key carries the id): resume it or DELETE it
+    return jsonify({"error": "Upload already in progress", "upload_id": pending["upload_id"]}), 409
+
+
+def _drop_session(session):
+    """Abort the S3 multipart upload and forget the session."""
+    abort_multipart_upload(session["s3_key"], session["s3_upload_id"])
+    repo.delete_upload_session(session["upload_id"])
+
+
+@files_bp.route("/uploads", methods=["POST"])
+@jwt_required()
+def initiate_upload():
+    user_id = get_jwt_identity()
+    data = request.get_json() or {}
+
+    filename = os.path.basename(data.get("filename") or "")
+    if not filename:
+        return jsonify({"error": "Missing filename"}), 400
+
+    try:
+        part_size = int(data.get("part_size") or S3_TRANSFER_CONFIG["part_size"])
+    except (TypeError, ValueError):
+        return jsonify({"error": "part_size must be an integer"}), 400
+    if not MIN_PART_SIZE <= part_size <= MAX_RESUMABLE_PART_SIZE:
+        return jsonify({
+            "error": f"part_size must be between {MIN_PART_SIZE} and {MAX_RESUMABLE_PART_SIZE} bytes"
+        }), 400
+
+    # Optional declared size; the real total is checked again at complete
+    try:
+        size = int(data.get("size") or 0)
+    except (TypeError, ValueError):
+        return jsonify({"error": "size must be an integer"}), 400
+    quota = _quota_check(user_id, size)
+    if quota:
+        return quota
 
     s3_key = f"user_{user_id}/{filename}"
+    if _key_in_use(s3_key):
+        return jsonify({"error": "File already exists"}), 409
+    pending = _upload_in_progress(s3_key)
+    if pending:
+        return pending
+
+    try:
+        s3_upload_id = create_multipart_upload(s3_key)
+    except Exception as e:
+        return jsonify({"error": f"S3 upload failed: {str(e)}"}), 500
+
+    # The session row reserves the key (unique s3_key) until complete/abort
+    upload_id = uuid.uuid4().hex
+    try:
+        repo.create_upload_session(upload_id, user_id, filename, s3_key, s3_upload_id,
+                                   part_size, time.strftime("%d %b %Y %H:%M"))
+    except DuplicateKeyError:
+        try:
+            abort_multipart_upload(s3_key, s3_upload_id)
+        except Exception as e:
+            print("❌ Multipart upload left open in S3:", s3_key, e)
+        return _upload_in_progress(s3_key) or (jsonify({"error": "Upload already in progress"}), 409)
+
+    return jsonify({
+        "upload_id": upload_id,
+        "s3_key": s3_key,
+        "part_size": part_size,
+        "max_parts": MAX_PARTS
+    }), 201
+
+
+@files_bp.route("/uploads/<upload_id>/parts/<int:part_number>", methods=["PUT"])
+@jwt_required()
+def upload_part_route(upload_id, part_number):
+    user_id = get_jwt_identity()
+    session = _get_owned_session(upload_id, user_id)
+    if not session:
+        return jsonify({"error": "Upload not found"}), 404
+
+    if not 1 <= part_number <= MAX_PARTS:
+        return jsonify({"error": f"part_number must be between 1 and {MAX_PARTS}"}), 400
+
+    # Read at most one byte past the part size so oversized parts are rejected
+    data = read_exact(request.stream, session["part_size"] + 1)
+    if not data:
+        return jsonify({"error": "Empty part"}), 400
+    if len(data) > session["part_size"]:
+        return jsonify({"error": f"Part larger than part_size ({session['part_size']} bytes)"}), 413
 
     try:
-        upload_bytes(file_bytes, s3_key)
+        etag = upload_part(session["s3_key"], session["s3_upload_id"], part_number, data)
     except Exception as e:
         return jsonify({"error": f"S3 upload failed: {str(e)}"}), 500
 
-    uploaded_at = time.strftime("%d %b %Y %H:%M")
+    repo.save_upload_part(upload_id, part_number, etag, len(data))
 
-    save_file_record(user_id, filename, s3_key, size, uploaded_at)
+    return jsonify({"part_number": part_number, "etag": etag, "size": len(data)}), 200
+
+
+@files_bp.route("/uploads/<upload_id>", methods=["GET"])
+@jwt_required()
+def upload_status(upload_id):
+    user_id = get_jwt_identity()
+    session = _get_owned_session(upload_id, user_id)
+    if not session:
+        return jsonify({"error": "Upload not found"}), 404
+
+    parts = repo.list_upload_parts(upload_id)
+    return jsonify({
+        "upload_id": upload_id,
+        "filename": session["filename"],
+        "s3_key": session["s3_key"],
+        "part_size": session["part_size"],
+        "created_at": session["created_at"],
+        "parts": parts,
+        "received_bytes": sum(p["size"] for p in parts)
+    }), 200
+
+
+@files_bp.route("/uploads/<upload_id>/complete", methods=["POST"])
+@jwt_required()
+def complete_upload(upload_id):
+    user_id = get_jwt_identity()
+    session = _get_owned_session(upload_id, user_id)
+    if not session:
+        return jsonify({"error": "Upload not found"}), 404
+
+    parts = repo.list_upload_parts(upload_id)
+    if not parts:
+        return jsonify({"error": "No parts uploaded"}), 400
+
+    missing = sorted(set(range(1, parts[-1]["part_number"] + 1)) - {p["part_number"] for p in parts})
+    if missing:
+        return jsonify({"error": "Missing parts", "missing_parts": missing}), 400
+
+    # S3 rejects parts under MIN_PART_SIZE except the last; catch it before CompleteMultipartUpload
+    short = [p["part_number"] for p in parts[:-1] if p["size"] < MIN_PART_SIZE]
+    if short:
+        return jsonify({
+            "error": f"Every part except the last must be at least {MIN_PART_SIZE} bytes",
+            "short_parts": short
+        }), 400
+
+    # A presigned upload may have taken the key since initiate; completing
+    # would overwrite its object
+    if _key_in_use(session["s3_key"]):
+        try:
+            _drop_session(session)
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+        return jsonify({"error": "File already exists"}), 409
+
+    size = sum(p["size"] for p in parts)
+    quota = _quota_check(user_id, size)
+    if quota:
+        try:
+            _drop_session(session)
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+        return quota
+
+    try:
+        complete_multipart_upload(
+            session["s3_key"],
+            session["s3_upload_id"],
+            [{"PartNumber": p["part_number"], "ETag": p["etag"]} for p in parts],
+        )
+    except Exception as e:
+        return jsonify({"error": f"S3 upload failed: {str(e)}"}), 500
+
+    uploaded_at = int(time.time())
+    try:
+        repo.save_file_record(user_id, session["filename"], session["s3_key"], size, uploaded_at)
+    except DuplicateKeyError:
+        repo.delete_upload_session(upload_id)
+        return jsonify({"error": "File already exists"}), 409
+    repo.delete_upload_session(upload_id)
+
+    return jsonify({
+        "message": "File uploaded successfully",
+        "filename": session["filename"],
+        "file_size": size,
+        "uploaded_at": uploaded_at,
+        "s3_key": session["s3_key"]
+    }), 200
+
+
+@files_bp.route("/uploads/<upload_id>", methods=["DELETE"])
+@jwt_required()
+def abort_upload(upload_id):
+    user_id = get_jwt_identity()
+    session = _get_owned_session(upload_id, user_id)
+    if not session:
+        return jsonify({"error": "Upload not found"}), 404
+
+    try:
+        _drop_session(session)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+    return jsonify({"message": "Upload aborted"}), 200
+
+
+# -------------------------------------------------------
+# DIRECT-TO-S3 UPLOAD — presigned PUT / presigned parts
+# The client sends bytes straight to S3, then confirms here.
+# -------------------------------------------------------
+@files_bp.route("/presign-upload", methods=["POST"])
+@jwt_required()
+def presign_upload():
+    user_id = get_jwt_identity()
+    data = request.get_json() or {}
+
+    filename = os.path.basename(data.get("filename") or "")
+    if not filename:
+        return jsonify({"error": "Missing filename"}), 400
+
+    try:
+        size = int(data.get("size") or 0)
+    except (TypeError, ValueError):
+        return jsonify({"error": "size must be an integer"}), 400
+
+    quota = _quota_check(user_id, size)
+    if quota:
+        return quota
+
+    s3_key = f"user_{user_id}/{filename}"
+    if _key_in_use(s3_key):
+        return jsonify({"error": "File already exists"}), 409
+    pending = _upload_in_progress(s3_key)
+    if pending:
+        return pending
+    part_size = S3_TRANSFER_CONFIG["part_size"]
+
+    try:
+        if size < S3_TRANSFER_CONFIG["multipart_threshold"]:
+            return jsonify({
+                "s3_key": s3_key,
+                "method": "PUT",
+                "url": generate_presigned_upload_url(s3_key)
+            }), 200
+
+        part_count = -(-size // part_size)
+        if part_count > MAX_PARTS:
+            return jsonify({"error": "File too large for multipart upload"}), 400
+
+        s3_upload_id = create_multipart_upload(s3_key)
+        return jsonify({
+            "s3_key": s3_key,
+            "method": "PUT",
+            "upload_id": s3_upload_id,
+            "part_size": part_size,
+            "parts": generate_presigned_part_urls(s3_key, s3_upload_id, part_count)
+        }), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@files_bp.route("/presign-upload/complete", methods=["POST"])
+@jwt_required()
+def confirm_presigned_upload():
+    user_id = get_jwt_identity()
+    data = request.get_json() or {}
+
+    s3_key = data.get("s3_key")
+    if not s3_key:
+        return jsonify({"error": "Missing s3_key"}), 400
+    if not s3_key.startswith(f"user_{user_id}/"):
+        return jsonify({"error": "Forbidden"}), 403
+    # presign-upload only hands out root keys: user_{id}/<basename>
+    filename = s3_key.split("/", 1)[1]
+    if not filename or "/" in filename:
+        return jsonify({"error": "Invalid s3_key"}), 400
+    if _key_in_use(s3_key):
+        return jsonify({"error": "File already exists"}), 409
+    pending = _upload_in_progress(s3_key)
+    if pending:
+        return pending
+
+    try:
+        # Multipart: the client reports each part's ETag from S3's response
+        if data.get("upload_id"):
+            parts = sorted(data.get("parts") or [], key=lambda p: int(p["part_number"]))
+            if not parts:
+                return jsonify({"error": "Missing parts"}), 400
+            complete_multipart_upload(
+                s3_key,
+                data["upload_id"],
+                [{"PartNumber": int(p["part_number"]), "ETag": p["etag"]} for p in parts],
+            )
+
+        meta = head_object(s3_key)
+    except (KeyError, TypeError, ValueError):
+        return jsonify({"error": "Each part needs part_number and etag"}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+    if meta is None:
+        return jsonify({"error": "Object not found in S3"}), 404
+
+    # The presign request only declared a size: charge what S3 actually holds
+    size = meta["ContentLength"]
+    quota = _quota_check(user_id, size)
+    if quota:
+        try:
+            delete_s3_object(s3_key)
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+        return quota
+
+    uploaded_at = int(time.time())
+    try:
+        repo.save_file_record(user_id, filename, s3_key, size, uploaded_at)
+    except DuplicateKeyError:
+        # A concurrent confirm of the same key won; its row owns the object
+        return jsonify({"error": "File already exists"}), 409
 
     return jsonify({
         "message": "File uploaded successfully",
@@ -54,12 +693,433 @@ def upload_file():
 # -------------------------------------------------------
 # LIST FILES
 # -------------------------------------------------------
+# Keyset pagination: ?limit=&cursor=&sort=uploaded_at|filename
+# &order=asc|desc&since=&until=&prefix=  (timestamps are epoch secs)
+# -------------------------------------------------------
+def _encode_cursor(sort, order, last):
+    raw = json.dumps([sort, order, last[0], last[1]]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_cursor(token, sort, order):
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        c_sort, c_order, value, row_id = json.loads(raw)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+    if (c_sort, c_order) != (sort, order):
+        raise ValueError("Cursor does not match sort/order")
+    # The token comes back from the client: only bind what the column holds
+    value_type = int if sort == "uploaded_at" else str
+    if type(value) is not value_type or type(row_id) is not int:
+        raise ValueError("Invalid cursor")
+    return value, row_id
+
+
+def _int_arg(name, default=None):
+    value = request.args.get(name)
+    if value in (None, ""):
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"{name} must be an integer")
+
+
 @files_bp.route("/list", methods=["GET"])
 @jwt_required()
 def list_files():
     user_id = get_jwt_identity()
-    files = list_user_files(user_id)
-    return jsonify({"files": files}), 200
+    sort = request.args.get("sort", "uploaded_at")
+    order = request.args.get("order", "desc")
+
+    try:
+        limit = min(max(_int_arg("limit", LIST_PAGE_SIZE), 1), MAX_LIST_PAGE_SIZE)
+        token = request.args.get("cursor")
+        after = _decode_cursor(token, sort, order) if token else None
+        files, last = repo.list_user_files_page(
+            user_id, limit, after=after, sort=sort, order=order,
+            since=_int_arg("since"), until=_int_arg("until"),
+            name_prefix=request.args.get("prefix"),
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    return jsonify({
+        "files": files,
+        "next_cursor": _encode_cursor(sort, order, last) if last else None
+    }), 200
+
+
+# -------------------------------------------------------
+# LIST FILES (streamed export)
+# -------------------------------------------------------
+# Whole listing in one response, serialized row by row from an open
+# cursor. Rows are compact arrays in LIST_COLUMNS order:
+#   ?format=json   -> {"columns": [...], "files": [[...], ...]}
+#   ?format=ndjson -> one array per line, columns in X-Columns
+# Same sort/order/since/until/prefix filters as /list.
+# -------------------------------------------------------
+STREAM_FLUSH_BYTES = 64 * 1024
+
+
+def _json_rows(rows, ndjson):
+    dumps = json.JSONEncoder(separators=(",", ":"), ensure_ascii=False).encode
+    buf = []
+    size = 0
+    first = True
+    for row in rows:
+        line = dumps(row)
+        if ndjson:
+            line += "\n"
+        elif not first:
+            line = "," + line
+        first = False
+        buf.append(line)
+        size += len(line)
+        # Batch small rows into fewer, larger writes
+        if size >= STREAM_FLUSH_BYTES:
+            yield "".join(buf).encode()
+            buf = []
+            size = 0
+    if buf:
+        yield "".join(buf).encode()
+
+
+def _stream_listing(rows, ndjson):
+    if ndjson:
+        yield from _json_rows(rows, ndjson=True)
+        return
+    # Header goes out before the first query batch, for a fast first byte
+    yield b'{"columns":' + json.dumps(LIST_COLUMNS, separators=(",", ":")).encode() + b',"files":['
+    yield from _json_rows(rows, ndjson=False)
+    yield b"]}"
+
+
+@files_bp.route("/list/stream", methods=["GET"])
+@jwt_required()
+def stream_list_files():
+    user_id = get_jwt_identity()
+    fmt = request.args.get("format", "json")
+    if fmt not in ("json", "ndjson"):
+        return jsonify({"error": "format must be json or ndjson"}), 400
+
+    try:
+        rows = repo.iter_user_files(
+            user_id,
+            sort=request.args.get("sort", "uploaded_at"),
+            order=request.args.get("order", "desc"),
+            since=_int_arg("since"), until=_int_arg("until"),
+            name_prefix=request.args.get("prefix"),
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    ndjson = fmt == "ndjson"
+    headers = {"Cache-Control": "no-store"}
+    if ndjson:
+        headers["X-Columns"] = ",".join(LIST_COLUMNS)
+    return Response(
+        stream_with_context(_stream_listing(rows, ndjson)),
+        mimetype="application/x-ndjson" if ndjson else "application/json",
+        headers=headers,
+    )
+
+
+# -------------------------------------------------------
+# SEARCH FILES
+# -------------------------------------------------------
+# ?q=&mode=substring|prefix|token&limit=&cursor=
+# Results are ordered by filename and paged like /list.
+# -------------------------------------------------------
+SEARCH_PAGE_SIZE = 50
+
+
+@files_bp.route("/search", methods=["GET"])
+@jwt_required()
+def search_files():
+    user_id = get_jwt_identity()
+    query = request.args.get("q", "")
+    mode = request.args.get("mode", "substring")
+
+    try:
+        limit = min(max(_int_arg("limit", SEARCH_PAGE_SIZE), 1), MAX_LIST_PAGE_SIZE)
+        token = request.args.get("cursor")
+        after = _decode_cursor(token, "search", mode) if token else None
+        files, last = repo.search_user_files(user_id, query, mode=mode, limit=limit, after=after)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    return jsonify({
+        "files": files,
+        "next_cursor": _encode_cursor("search", mode, last) if last else None
+    }), 200
+
+
+# -------------------------------------------------------
+# CHANGE FEED (delta sync)
+# GET /files/changes?since=<seq>&floor=<floor_seq>
+# Every create, delete and move of a file, and every folder_create,
+# folder_move and folder_delete, is numbered by a per-user sequence. A client keeps the last seq it applied and asks only for
+# what came after it, so a refresh costs the number of changes, not
+# the size of the account. since=0 replays the compacted log, which is
+# exactly the current files and folders. "move" entries carry
+# old_s3_key. Folder entries are keyed by the folder's key prefix
+# (user_{id}/d{folder_id}/) and carry its name and parent folder_id; a
+# folder move changes no file keys, so it is one entry.
+# Clients echo back the floor_seq of their last response as `floor`.
+# -------------------------------------------------------
+@files_bp.route("/changes", methods=["GET"])
+@jwt_required()
+def list_changes():
+    user_id = get_jwt_identity()
+
+    try:
+        since = _int_arg("since", 0)
+        limit = min(max(_int_arg("limit", CHANGES_PAGE_SIZE), 1), MAX_LIST_PAGE_SIZE)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if since < 0:
+        return jsonify({"error": "since must be >= 0"}), 400
+
+    try:
+        floor = _int_arg("floor")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    result = repo.get_changes(user_id, since, limit)
+    latest = result["latest_seq"]
+    floor_seq = result["floor_seq"]
+    changes = result["changes"]
+
+    # Deletes up to floor_seq were compacted away. A client below it is
+    # fine if it got its seq after that compaction (it is paging through
+    # the compacted log); otherwise it may hold files whose delete it
+    # will never see, and can only start over. A seq past the end is
+    # from some other log.
+    if since and ((since < floor_seq and floor != floor_seq) or since > latest):
+        return jsonify({
+            "error": "Change log no longer covers this point; resync from since=0",
+            "reset": True,
+            "latest_seq": latest
+        }), 410
+
+    if result["has_more"]:
+        next_since = changes[-1]["seq"]
+    else:
+        # Compaction leaves gaps: skip to the end so the client's seq
+        # never falls behind floor_seq
+        next_since = max([latest, since] + [c["seq"] for c in changes[-1:]])
+
+    return jsonify({
+        "changes": changes,
+        "next_since": next_since,
+        "floor_seq": floor_seq,
+        "has_more": result["has_more"]
+    }), 200
+
+
+def _tombstone_cutoff():
+    return int(time.time()) - CHANGE_TOMBSTONE_DAYS * 86400
+
+
+# -------------------------------------------------------
+# VIRTUAL FOLDERS
+# -------------------------------------------------------
+# Paths are "/"-separated folder names under the user's root ("" is the
+# root). Folders are parent_id links, so listing one touches only its
+# direct children and moving one is a single row update. Files inside a
+# folder get the key user_{id}/d{folder_id}/{name}: it names the folder
+# by id, not path, so a folder move never renames its files.
+# -------------------------------------------------------
+ROOT_FOLDER = {"id": 0, "parent_id": 0, "name": "", "created_at": None}
+FOLDER_PAGE_SIZE = 1000
+
+
+def _split_path(path):
+    parts = [p for p in (path or "").strip().split("/") if p]
+    for p in parts:
+        if p in (".", "..") or len(p) > 255:
+            raise ValueError(f"Invalid path component: {p[:40]}")
+    return parts
+
+
+def _resolve_folder(user_id, path):
+    """Folder dict for `path` (one indexed lookup per level), or None."""
+    folder = ROOT_FOLDER
+    for name in _split_path(path):
+        folder = repo.find_folder(user_id, folder["id"], name)
+        if folder is None:
+            return None
+    return folder
+
+
+def _resolve_parent(user_id, path):
+    """(parent folder or None, last name) for a destination path."""
+    parts = _split_path(path)
+    if not parts:
+        raise ValueError("Missing destination name")
+    return _resolve_folder(user_id, "/".join(parts[:-1])), parts[-1]
+
+
+def _file_key(user_id, folder_id, filename):
+    # Upload routes reject "/" in names, so a root file can never take a
+    # d{folder_id}/ key
+    if folder_id:
+        return folder_key(user_id, folder_id) + filename
+    return f"user_{user_id}/{filename}"
+
+
+def _key_in_use(s3_key):
+    # A moved file keeps its bytes at its old key (adopted as a blob), so
+    # direct-to-S3 uploads must not reuse that key either
+    return repo.get_file_record(s3_key) is not None or repo.get_blob(s3_key) is not None
+
+
+@files_bp.route("/folders", methods=["POST"])
+@jwt_required()
+def make_folder():
+    user_id = get_jwt_identity()
+    data = request.get_json() or {}
+    parents = bool(data.get("parents"))
+
+    try:
+        parts = _split_path(data.get("path"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if not parts:
+        return jsonify({"error": "Missing path"}), 400
+
+    # Like mkdir (-p with "parents": true)
+    folder = ROOT_FOLDER
+    created = False
+    for depth, name in enumerate(parts, start=1):
+        child = repo.find_folder(user_id, folder["id"], name)
+        if child is None:
+            if depth < len(parts) and not parents:
+                return jsonify({"error": "Parent folder not found"}), 404
+            try:
+                folder_id = repo.create_folder(user_id, folder["id"], name, int(time.time()))
+            except DuplicateKeyError:
+                # Created concurrently by another request
+                folder_id = repo.find_folder(user_id, folder["id"], name)["id"]
+            else:
+                created = True
+            child = {"id": folder_id}
+        elif depth == len(parts) and not parents:
+            return jsonify({"error": "Folder already exists"}), 409
+        folder = child
+
+    return jsonify({"id": folder["id"], "path": "/".join(parts)}), 201 if created else 200
+
+
+@files_bp.route("/folders", methods=["GET"])
+@jwt_required()
+def list_folder():
+    user_id = get_jwt_identity()
+    path = request.args.get("path", "")
+
+    try:
+        folder = _resolve_folder(user_id, path)
+        if folder is None:
+            return jsonify({"error": "Folder not found"}), 404
+        limit = min(max(_int_arg("limit", FOLDER_PAGE_SIZE), 1), MAX_LIST_PAGE_SIZE)
+        token = request.args.get("cursor")
+        after = _decode_cursor(token, "folder", str(folder["id"])) if token else None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    files, last = repo.list_folder_files(user_id, folder["id"], limit, after=after)
+    response = {
+        "folder": {"id": folder["id"], "path": "/".join(_split_path(path))},
+        "files": files,
+        "next_cursor": _encode_cursor("folder", str(folder["id"]), last) if last else None
+    }
+    # Subfolders come with the first page only
+    if after is None:
+        response["folders"] = [
+            {"id": f["id"], "name": f["name"], "created_at": f["created_at"]}
+            for f in repo.list_child_folders(user_id, folder["id"])
+        ]
+    return jsonify(response), 200
+
+
+@files_bp.route("/folders/size", methods=["GET"])
+@jwt_required()
+def folder_size():
+    user_id = get_jwt_identity()
+    try:
+        folder = _resolve_folder(user_id, request.args.get("path", ""))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if folder is None:
+        return jsonify({"error": "Folder not found"}), 404
+    return jsonify(dict(repo.folder_usage(user_id, folder["id"]), id=folder["id"])), 200
+
+
+@files_bp.route("/folders", methods=["DELETE"])
+@jwt_required()
+def remove_folder():
+    user_id = get_jwt_identity()
+    try:
+        folder = _resolve_folder(user_id, request.args.get("path", ""))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if folder is None:
+        return jsonify({"error": "Folder not found"}), 404
+    if not folder["id"]:
+        return jsonify({"error": "Cannot delete the root folder"}), 400
+    if not repo.delete_folder(user_id, folder["id"]):
+        return jsonify({"error": "Folder is not empty"}), 409
+    return jsonify({"message": "Folder deleted"}), 200
+
+
+# -------------------------------------------------------
+# MOVE / RENAME
+# {"path": "a/b", "to": "c/b2"}        -> folder (one write)
+# {"s3_key": "...", "to": "c/x.txt"}   -> file (one write)
+# "to" is the full destination; its parent folder must exist.
+# -------------------------------------------------------
+@files_bp.route("/move", methods=["POST"])
+@jwt_required()
+def move():
+    user_id = get_jwt_identity()
+    data = request.get_json() or {}
+
+    try:
+        parent, name = _resolve_parent(user_id, data.get("to"))
+        if parent is None:
+            return jsonify({"error": "Destination folder not found"}), 404
+
+        if data.get("s3_key"):
+            s3_key = data["s3_key"]
+            record = repo.get_file_record(s3_key)
+            if not record or str(record[1]) != str(user_id):
+                return jsonify({"error": "File not found"}), 404
+            new_s3_key = _file_key(user_id, parent["id"], name)
+            repo.move_file(user_id, s3_key, parent["id"], name, new_s3_key)
+            return jsonify({"message": "File moved", "s3_key": new_s3_key, "folder_id": parent["id"]}), 200
+
+        folder = _resolve_folder(user_id, data.get("path"))
+        if folder is None:
+            return jsonify({"error": "Folder not found"}), 404
+        if not folder["id"]:
+            return jsonify({"error": "Cannot move the root folder"}), 400
+        repo.move_folder(user_id, folder["id"], parent["id"], name)
+        return jsonify({"message": "Folder moved", "id": folder["id"], "path": "/".join(_split_path(data["to"]))}), 200
+    except DuplicateKeyError:
+        return jsonify({"error": "Destination already exists"}), 409
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+
+# -------------------------------------------------------
+# Where the bytes for a user-facing s3_key actually live
+# -------------------------------------------------------
+def _storage_key(s3_key, record):
+    if record and record[4]:
+        return record[4]
+    return s3_key
 
 
 # -------------------------------------------------------
@@ -68,32 +1128,380 @@ def list_files():
 @files_bp.route("/download", methods=["GET"])
 @jwt_required()
 def download_file():
+    user_id = get_jwt_identity()
     s3_key = request.args.get("s3_key")
     if not s3_key:
         return jsonify({"error": "Missing s3_key"}), 400
+    if not s3_key.startswith(f"user_{user_id}/"):
+        return jsonify({"error": "Forbidden"}), 403
 
     try:
-        url = generate_presigned_url(s3_key)
+        record = repo.get_file_record(s3_key)
+        if record and (record[5] or record[6]):
+            # Encrypted/compressed at rest: the API decodes while streaming
+            return jsonify({
+                "presigned_url": None,
+                "stream_url": url_for("files.stream_download", s3_key=s3_key)
+            }), 200
+
+        storage_key = _storage_key(s3_key, record)
+        filename = os.path.basename(s3_key) if storage_key != s3_key else None
+        url = generate_presigned_url(storage_key, filename=filename)
         return jsonify({"presigned_url": url}), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
+def _batch_selection(data, prefix=None):
+    """(s3_keys, prefix) of a batch request body; ValueError if malformed."""
+    if not isinstance(data, dict):
+        raise ValueError("Body must be a JSON object")
+    prefix = data.get("prefix", prefix)
+    s3_keys = data.get("s3_keys")
+    if prefix is not None and not isinstance(prefix, str):
+        raise ValueError("prefix must be a string")
+    if s3_keys is not None and not (isinstance(s3_keys, list) and all(isinstance(k, str) for k in s3_keys)):
+        raise ValueError("s3_keys must be a list of strings")
+    if prefix is None and not s3_keys:
+        raise ValueError("Provide s3_keys or prefix")
+    return s3_keys, prefix
+
+
+# -------------------------------------------------------
+# DOWNLOAD MANY — presigned URLs for up to MAX_PRESIGN_BATCH
+# keys in one call; ownership checked with a single query
+# {"s3_keys": [...]} or {"prefix": "user_1/dir/"}
+# -------------------------------------------------------
+@files_bp.route("/download/batch", methods=["POST"])
+@jwt_required()
+def download_batch():
+    user_id = get_jwt_identity()
+    data = request.get_json(silent=True) or {}
+    own_prefix = f"user_{user_id}/"
+
+    try:
+        s3_keys, prefix = _batch_selection(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if prefix is not None and not prefix.startswith(own_prefix):
+        return jsonify({"error": "Forbidden"}), 403
+    if s3_keys and len(s3_keys) > MAX_PRESIGN_BATCH:
+        return jsonify({"error": f"At most {MAX_PRESIGN_BATCH} keys per request"}), 400
+
+    try:
+        expires = int(data.get("expires") or 900)
+    except (TypeError, ValueError):
+        return jsonify({"error": "expires must be an integer"}), 400
+
+    records = repo.get_user_file_records(user_id, s3_keys=s3_keys, prefix=prefix, limit=MAX_PRESIGN_BATCH + 1)
+    truncated = len(records) > MAX_PRESIGN_BATCH
+    records = records[:MAX_PRESIGN_BATCH]
+
+    try:
+        urls = []
+        for rec in records:
+            entry = {"s3_key": rec["s3_key"], "filename": rec["filename"], "size": rec["size"]}
+            if rec["encryption"] or rec["codec"]:
+                entry["presigned_url"] = None
+                entry["stream_url"] = url_for("files.stream_download", s3_key=rec["s3_key"])
+            elif rec["blob_key"]:
+                entry["presigned_url"] = generate_presigned_url(
+                    rec["blob_key"], expires, filename=rec["filename"])
+            else:
+                entry["presigned_url"] = generate_presigned_url(rec["s3_key"], expires)
+            urls.append(entry)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+    errors = []
+    if prefix is None:
+        found = {rec["s3_key"] for rec in records}
+        errors = [{"s3_key": k, "error": "File not found"} for k in dict.fromkeys(s3_keys) if k not in found]
+
+    return jsonify({"files": urls, "errors": errors, "truncated": truncated}), 200
+
+
+# -------------------------------------------------------
+# DOWNLOAD (server-side stream) — decodes on the fly and
+# honours single-range "Range: bytes=..." requests (206).
+# Encrypted objects only fetch and decrypt the chunks that
+# cover the requested range. ETag / Last-Modified come from
+# the metadata DB, so 304s and HEADs never touch S3.
+# -------------------------------------------------------
+def _etag(storage_key, record):
+    # Blob keys embed the content hash; other keys are only rewritten
+    # together with a new uploaded_at
+    seed = f"{storage_key}:{record[2]}:{record[3]}"
+    return hashlib.sha1(seed.encode()).hexdigest()
+
+
+def _last_modified(record):
+    return record[3] or None
+
+
+def _not_modified(etag, last_modified):
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if request.if_modified_since and last_modified is not None:
+        return last_modified <= request.if_modified_since.timestamp()
+    return False
+
+
+def _range_allowed(etag, last_modified):
+    """If-Range: only honour Range when the client's validator still matches."""
+    if_range = request.if_range
+    if if_range.etag:
+        return if_range.etag == etag
+    if if_range.date:
+        return last_modified is not None and last_modified == int(if_range.date.timestamp())
+    return True
+
+
+def _requested_range(total):
+    """(start, stop) for a single satisfiable byte range, None for the
+    whole object, or False when the range cannot be satisfied."""
+    rng = request.range
+    if not rng or rng.units != "bytes" or len(rng.ranges) != 1:
+        return None
+    span = rng.range_for_length(total)
+    return span if span else False
+
+
+def _iter_body(resp):
+    return resp["Body"].iter_chunks(CHUNK_SIZE)
+
+
+def _decode(chunks, encryption, codec):
+    """Undo the upload pipeline: decrypt, then decompress."""
+    if encryption:
+        chunks = decrypt_stream(chunks)
+    if codec:
+        chunks = decompress_stream(chunks, codec)
+    return chunks
+
+
+@files_bp.route("/download/stream", methods=["GET", "HEAD"])
+@jwt_required()
+def stream_download():
+    user_id = get_jwt_identity()
+    s3_key = request.args.get("s3_key")
+    if not s3_key:
+        return jsonify({"error": "Missing s3_key"}), 400
+    if not s3_key.startswith(f"user_{user_id}/"):
+        return jsonify({"error": "Forbidden"}), 403
+
+    record = repo.get_file_record(s3_key)
+    if not record:
+        return jsonify({"error": "File not found"}), 404
+
+    storage_key = _storage_key(s3_key, record)
+    total = record[2]
+    encrypted = bool(record[5])
+    codec = record[6]
+    etag = _etag(storage_key, record)
+    last_modified = _last_modified(record)
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": f'attachment; filename="{record[0]}"',
+        "ETag": f'"{etag}"',
+        "Cache-Control": "private, no-cache"
+    }
+    if last_modified is not None:
+        headers["Last-Modified"] = http_date(last_modified)
+
+    if _not_modified(etag, last_modified):
+        return Response(status=304, headers=headers)
+
+    # Compressed streams aren't seekable; serve them whole (200)
+    span = None
+    if not codec and _range_allowed(etag, last_modified):
+        span = _requested_range(total)
+    if span is False:
+        headers["Content-Range"] = f"bytes */{total}"
+        return Response(status=416, headers=headers)
+
+    if request.method == "HEAD":
+        headers["Content-Length"] = str(span[1] - span[0] if span else total)
+        if span:
+            headers["Content-Range"] = f"bytes {span[0]}-{span[1] - 1}/{total}"
+        return Response(status=206 if span else 200, mimetype="application/octet-stream", headers=headers)
+
+    try:
+        if span:
+            start, stop = span
+            if encrypted:
+                chunks = decrypt_range(
+                    lambda r: _iter_body(get_object_stream(storage_key, r)), start, stop, total)
+            else:
+                chunks = _iter_body(get_object_stream(storage_key, (start, stop - 1)))
+            status = 206
+            headers["Content-Range"] = f"bytes {start}-{stop - 1}/{total}"
+            headers["Content-Length"] = str(stop - start)
+        else:
+            chunks = _decode(_iter_body(get_object_stream(storage_key)), record[5], codec)
+            status = 200
+            headers["Content-Length"] = str(total)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+    return Response(
+        stream_with_context(chunks),
+        status=status,
+        mimetype="application/octet-stream",
+        headers=headers
+    )
+
+
+# -------------------------------------------------------
+# DOWNLOAD MANY AS ZIP — built on the fly, never buffered
+# {"s3_keys": [...]} or {"prefix": "user_1/dir/"}
+# -------------------------------------------------------
+def _zip_members(user_id, records):
+    """
+    (name, size, date_time, chunks) per record. The next ZIP_READAHEAD
+    objects are opened on a small pool while the current one streams.
+    """
+    own_prefix = f"user_{user_id}/"
+
+    def open_body(rec):
+        return get_object_stream(rec["blob_key"] or rec["s3_key"])
+
+    with ThreadPoolExecutor(max_workers=max(1, ZIP_READAHEAD)) as pool:
+        window = deque()
+        records = iter(records)
+
+        def fill():
+            while len(window) < max(1, ZIP_READAHEAD):
+                rec = next(records, None)
+                if rec is None:
+                    return
+                window.append((rec, pool.submit(open_body, rec)))
+
+        fill()
+        while window:
+            rec, future = window.popleft()
+            fill()
+            # ZIP timestamps can't predate 1980
+            uploaded = time.localtime(max(rec["uploaded_at"], 315532800 + 86400))
+            yield (
+                rec["s3_key"][len(own_prefix):],
+                rec["size"],
+                tuple(uploaded)[:6],
+                _decode(_iter_body(future.result()), rec["encryption"], rec["codec"]),
+            )
+
+
+@files_bp.route("/download/zip", methods=["GET", "POST"])
+@jwt_required()
+def download_zip():
+    user_id = get_jwt_identity()
+    data = request.get_json(silent=True) or {}
+    own_prefix = f"user_{user_id}/"
+
+    try:
+        s3_keys, prefix = _batch_selection(data, request.args.get("prefix"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if prefix is not None and not prefix.startswith(own_prefix):
+        return jsonify({"error": "Forbidden"}), 403
+
+    records = repo.get_user_file_records(user_id, s3_keys=s3_keys, prefix=prefix)
+    if not records:
+        return jsonify({"error": "No matching files"}), 404
+
+    deflate = (data.get("compression") or request.args.get("compression")) == "deflate"
+    archive = os.path.basename((prefix or "").rstrip("/")) or "files"
+
+    return Response(
+        stream_with_context(stream_zip(
+            _zip_members(user_id, records),
+            zipfile.ZIP_DEFLATED if deflate else zipfile.ZIP_STORED,
+        )),
+        mimetype="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{archive}.zip"'}
+    )
+
+
 # -------------------------------------------------------
 # DELETE FILE
 # -------------------------------------------------------
 @files_bp.route("/delete", methods=["DELETE"])
 @jwt_required()
 def delete_file():
+    user_id = get_jwt_identity()
     s3_key = request.args.get("s3_key")
     if not s3_key:
         return jsonify({"error": "Missing s3_key"}), 400
+    if not s3_key.startswith(f"user_{user_id}/"):
+        return jsonify({"error": "Forbidden"}), 403
 
     try:
-        delete_s3_object(s3_key)
-        delete_file_record(s3_key)
+        record = repo.get_file_record(s3_key)
+        if not record:
+            # No row: the key may be the blob of a file moved elsewhere
+            return jsonify({"error": "File not found"}), 404
+        if record[4]:
+            # Shared blob: only removed from S3 with its last reference
+            orphan = repo.delete_file_record(s3_key)
+            if orphan:
+                delete_s3_object(orphan)
+        else:
+            delete_s3_object(s3_key)
+            repo.delete_file_record(s3_key)
 
         return jsonify({"message": "File deleted"}), 200
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
+
+
+# -------------------------------------------------------
+# BULK DELETE — {"s3_keys": [...]} or {"prefix": "user_1/dir/"}
+# -------------------------------------------------------
+@files_bp.route("/delete/batch", methods=["POST", "DELETE"])
+@jwt_required()
+def delete_batch():
+    user_id = get_jwt_identity()
+    data = request.get_json(silent=True) or {}
+    own_prefix = f"user_{user_id}/"
+
+    try:
+        s3_keys, prefix = _batch_selection(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if prefix is not None and not prefix.startswith(own_prefix):
+        return jsonify({"error": "Forbidden"}), 403
+
+    failed = {}
+    if prefix is None:
+        s3_keys = list(dict.fromkeys(s3_keys))
+        for k in s3_keys:
+            if not k.startswith(own_prefix):
+                failed[k] = "Forbidden"
+
+    try:
+        rows = repo.find_user_file_keys(user_id, s3_keys=s3_keys, prefix=prefix)
+        if prefix is None:
+            found = {r[0] for r in rows}
+            for k in s3_keys:
+                if k not in found and k not in failed:
+                    failed[k] = "File not found"
+
+        # Objects stored under their own key go first; rows are only
+        # dropped for keys S3 actually deleted
+        direct = [k for k, blob_key in rows if not blob_key]
+        failed.update(delete_s3_objects(direct))
+        removed = [k for k, _ in rows if k not in failed]
+
+        # Shared blobs are deleted with their last reference
+        orphans = repo.delete_file_records(removed)
+        for blob_key, err in delete_s3_objects(orphans).items():
+            print("❌ Orphaned blob left in S3:", blob_key, err)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+    return jsonify({
+        "message": f"{len(removed)} files deleted",
+        "deleted": removed,
+        "errors": [{"s3_key": k, "error": v} for k, v in failed.items()]
+    }), 200 if not failed else 207
@@ -0,0 +1,168 @@
+# tests/test_plan_compaction.py
+# Run from the repository root: python -m pytest tests
+import random
+import unittest
+
+from db.common import DELETE_OPS, plan_compaction
+
+
+class ChangeLog:
+    """A user's change log plus the true state after every seq."""
+
+    def __init__(self):
+        self.rows = []          # (seq, op, s3_key, old_s3_key, changed_at)
+        self.history = [{}]     # history[seq]: key -> seq that last wrote it
+
+    @property
+    def last_seq(self):
+        return len(self.history) - 1
+
+    def add(self, op, s3_key, old_s3_key=None):
+        seq = self.last_seq + 1
+        row = (seq, op, s3_key, old_s3_key, seq)   # changed_at == seq
+        self.rows.append(row)
+        self.history.append(apply(dict(self.history[-1]), row))
+
+    def compact(self, tombstone_before):
+        drop, floor, kept_tombstone = plan_compaction(self.rows, tombstone_before)
+        dropped = set(drop)
+        self.rows = [r for r in self.rows if r[0] not in dropped]
+        return drop, floor, kept_tombstone
+
+
+def apply(state, row):
+    """Apply one change the way a syncing client does (client/pyqt_gui.py)."""
+    seq, op, s3_key, old_s3_key, _ = row
+    if op in DELETE_OPS:
+        state.pop(s3_key, None)
+    else:
+        if old_s3_key:
+            state.pop(old_s3_key, None)
+        state[s3_key] = seq
+    return state
+
+
+class PlanCompactionTest(unittest.TestCase):
+
+    def assert_converges(self, log, start_seqs):
+        """A client synced to any of `start_seqs` ends at the current state."""
+        final = log.history[-1]
+        for since in start_seqs:
+            state = dict(log.history[since])
+            for row in log.rows:
+                if row[0] > since:
+                    apply(state, row)
+            self.assertEqual(state, final, f"replay from since={since}")
+
+    def check(self, log, tombstone_before):
+        """Replay from every seq before compaction, then from every seq the server still serves after."""
+        self.assert_converges(log, range(log.last_seq + 1))
+        drop, floor, kept_tombstone = log.compact(tombstone_before)
+
+        # since=0 replays from nothing; below floor the server answers 410
+        self.assert_converges(log, [0] + list(range(max(floor, 1), log.last_seq + 1)))
+        # Compacting again with the same cutoff has nothing left to drop
+        self.assertEqual(plan_compaction(log.rows, tombstone_before)[0], [])
+        if kept_tombstone is not None:
+            self.assertGreaterEqual(kept_tombstone, tombstone_before)
+        return drop, floor
+
+    def test_create_move_delete_chain(self):
+        log = ChangeLog()
+        log.add("create", "a")          # 1
+        log.add("move", "b", "a")       # 2  a -> b
+        log.add("create", "a")          # 3  old key re-created
+        log.add("delete", "b")          # 4
+        log.add("move", "c", "a")       # 5
+        log.add("create", "b")          # 6
+        log.add("delete", "c")          # 7
+        for tombstone_before in (0, 5, log.last_seq + 1):
+            with self.subTest(tombstone_before=tombstone_before):
+                copy = ChangeLog()
+                copy.rows, copy.history = list(log.rows), list(log.history)
+                self.check(copy, tombstone_before)
+
+    def test_move_then_recreate_old_key(self):
+        log = ChangeLog()
+        log.add("create", "a")          # 1
+        log.add("move", "b", "a")       # 2
+        log.add("create", "a")          # 3
+        drop, floor = self.check(log, log.last_seq + 1)
+        # Both keys exist: the move is still b's latest row, nothing is a tombstone
+        self.assertEqual(drop, [1])
+        self.assertEqual(floor, 0)
+        self.assertEqual([r[0] for r in log.rows], [2, 3])
+
+    def test_move_away_is_a_tombstone_for_the_old_key(self):
+        log = ChangeLog()
+        log.add("create", "a")          # 1
+        log.add("move", "b", "a")       # 2
+        log.add("move", "c", "b")       # 3
+        drop, floor = self.check(log, 0)
+        self.assertEqual(drop, [1])
+        # Row 3 is c's create and b's tombstone; row 2 a's tombstone
+        self.assertEqual([r[0] for r in log.rows], [2, 3])
+
+        log.add("create", "d")          # 4
+        drop, floor = self.check(log, log.last_seq + 1)
+        self.assertEqual(drop, [2])
+        self.assertEqual(floor, 2)
+
+    def test_delete_and_recreate(self):
+        log = ChangeLog()
+        for _ in range(3):
+            log.add("create", "x")
+            log.add("delete", "x")
+        drop, floor = self.check(log, 0)
+        self.assertEqual([r[0] for r in log.rows], [6])
+        self.assertEqual(floor, 0)
+
+        drop, floor = self.check(log, log.last_seq + 1)
+        self.assertEqual(log.rows, [])
+        self.assertEqual(floor, 6)
+
+    def test_folder_events(self):
+        log = ChangeLog()
+        log.add("folder_create", "user_1/d1/")
+        log.add("create", "user_1/d1/f")
+        log.add("folder_move", "user_1/d1/")
+        log.add("delete", "user_1/d1/f")
+        log.add("folder_delete", "user_1/d1/")
+        log.add("folder_create", "user_1/d2/")
+        drop, floor = self.check(log, 5)
+        self.assertEqual([r[0] for r in log.rows], [5, 6])
+        self.assertEqual(floor, 4)
+
+    def test_random_logs_converge_across_repeated_compactions(self):
+        keys = ["a", "b", "c", "d", "e", "user_1/d1/", "user_1/d2/"]
+        for seed in range(200):
+            rng = random.Random(seed)
+            log = ChangeLog()
+            floor = 0
+            for _ in range(4):
+                for _ in range(rng.randint(1, 25)):
+                    live = log.history[-1]
+                    key = rng.choice(keys)
+                    folder = key.endswith("/")
+                    if key not in live:
+                        if not folder and live and rng.random() < 0.4:
+                            src = rng.choice([k for k in live if not k.endswith("/")] or [None])
+                            if src:
+                                log.add("move", key, src)
+                                continue
+                        log.add("folder_create" if folder else "create", key)
+                    elif folder and rng.random() < 0.5:
+                        log.add("folder_move", key)
+                    else:
+                        log.add("folder_delete" if folder else "delete", key)
+
+                tombstone_before = rng.randint(0, log.last_seq + 1)
+                with self.subTest(seed=seed, last_seq=log.last_seq, tombstone_before=tombstone_before):
+                    self.assert_converges(log, [0] + list(range(max(floor, 1), log.last_seq + 1)))
+                    _, new_floor, _ = log.compact(tombstone_before)
+                    floor = max(floor, new_floor)
+                    self.assert_converges(log, [0] + list(range(max(floor, 1), log.last_seq + 1)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,129 @@
+# utils/compression_helper.py
+import os
+import time
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # optional: fall back to zlib
+    zstandard = None
+
+ZSTD = "zstd"
+DEFLATE = "deflate"
+DEFAULT_CODEC = ZSTD if zstandard else DEFLATE
+
+# Only compress when the sample shrinks to at most this fraction
+MIN_RATIO = 0.9
+SAMPLE_SIZE = 64 * 1024
+
+# Formats that are already compressed; not worth a CPU pass
+SKIP_EXTENSIONS = {
+    ".zip", ".gz", ".tgz", ".bz2", ".xz", ".zst", ".7z", ".rar",
+    ".jpg", ".jpeg", ".png", ".gif", ".webp", ".heic",
+    ".mp3", ".mp4", ".m4a", ".mkv", ".mov", ".avi", ".webm",
+    ".pdf", ".docx", ".xlsx", ".pptx", ".apk", ".jar",
+}
+SKIP_MAGIC = (
+    b"PK\x03\x04", b"\x1f\x8b", b"BZh", b"\xfd7zXZ", b"(\xb5/\xfd", b"7z\xbc\xaf",
+    b"Rar!", b"\xff\xd8\xff", b"\x89PNG", b"GIF8", b"%PDF",
+)
+
+
+class CompressionStats:
+    """Per-upload counters filled in while the stream is consumed."""
+
+    def __init__(self, codec):
+        self.codec = codec
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.cpu_time = 0.0
+
+    @property
+    def ratio(self):
+        return round(self.bytes_out / self.bytes_in, 4) if self.bytes_in else 1.0
+
+    def to_dict(self):
+        return {
+            "codec": self.codec,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "ratio": self.ratio,
+            "cpu_ms": round(self.cpu_time * 1000, 2)
+        }
+
+
+def choose_codec(sample: bytes, filename: str = ""):
+    """
+    Sniff the first bytes of an upload and return the codec to use, or
+    None when the content is already compressed or doesn't shrink enough.
+    """
+    if len(sample) < 512:
+        return None
+    if os.path.splitext(filename)[1].lower() in SKIP_EXTENSIONS:
+        return None
+    if sample.startswith(SKIP_MAGIC):
+        return None
+
+    # Cheap trial at the fastest level
+    if DEFAULT_CODEC == ZSTD:
+        trial = zstandard.ZstdCompressor(level=1).compress(sample)
+    else:
+        trial = zlib.compress(sample, 1)
+    if len(trial) > len(sample) * MIN_RATIO:
+        return None
+    return DEFAULT_CODEC
+
+
+def _compressor(codec):
+    if codec == ZSTD:
+        if not zstandard:
+            raise ValueError("zstandard is not installed")
+        return zstandard.ZstdCompressor(level=3).compressobj()
+    if codec == DEFLATE:
+        return zlib.compressobj(6)
+    raise ValueError(f"Unknown codec: {codec}")
+
+
+def _decompressor(codec):
+    if codec == ZSTD:
+        if not zstandard:
+            raise ValueError("zstandard is not installed")
+        return zstandard.ZstdDecompressor().decompressobj()
+    if codec == DEFLATE:
+        return zlib.decompressobj()
+    raise ValueError(f"Unknown codec: {codec}")
+
+
+def compress_stream(chunks, codec, stats=None):
+    """Generator: compress an iterable of byte strings, updating `stats`."""
+    comp = _compressor(codec)
+    for chunk in chunks:
+        started = time.thread_time()
+        out = comp.compress(chunk)
+        if stats:
+            stats.cpu_time += time.thread_time() - started
+            stats.bytes_in += len(chunk)
+            stats.bytes_out += len(out)
+        if out:
+            yield out
+
+    started = time.thread_time()
+    out = comp.flush()
+    if stats:
+        stats.cpu_time += time.thread_time() - started
+        stats.bytes_out += len(out)
+    if out:
+        yield out
+
+
+def decompress_stream(chunks, codec):
+    """Generator: decompress an iterable of byte strings."""
+    decomp = _decompressor(codec)
+    for chunk in chunks:
+        out = decomp.decompress(chunk)
+        if out:
+            yield out
+    if codec == DEFLATE:
+        out = decomp.flush()
+        if out:
+            yield out
@@ -1,6 +1,8 @@
 from Crypto.Cipher import AES
 import io
 import os
+import struct
+from utils.stream_helper import rechunk
 
 # 32-byte AES key (use .env in production)
 SECRET_KEY = os.getenv("ENCRYPTION_KEY", "my_super_secret_key_32b").encode()
@@ -32,3 +34,159 @@ def decrypt_file(encrypted_bytes):
     
     cipher = AES.new(SECRET_KEY, AES.MODE_GCM, nonce=nonce)
     return cipher.decrypt_and_verify(ciphertext, tag)
+
+
+# ---------------------------------------------------------
+# Streaming, chunk-framed AES-GCM
+#
+#   header : MAGIC (4) | chunk_size u32 (4) | nonce_prefix (8)
+#   frame i: ciphertext (chunk_size, last may be shorter) | tag (16)
+#
+# Frame i is sealed with nonce = nonce_prefix | i (u32), and the header
+# plus a final-frame flag as associated data. Swapping frames breaks the
+# nonce, dropping trailing frames leaves no frame marked final, so
+# reordering and truncation both fail authentication.
+# ---------------------------------------------------------
+STREAM_ENCRYPTION = "aes-gcm-stream-v1"
+MAGIC = b"CFE1"
+HEADER_SIZE = 16
+TAG_SIZE = 16
+DEFAULT_CHUNK_SIZE = 64 * 1024
+MAX_FRAMES = 2 ** 32
+
+
+class DecryptionError(ValueError):
+    """Ciphertext is corrupt, truncated, reordered or uses the wrong key."""
+
+
+def _frame_cipher(prefix, index, header, final):
+    if index >= MAX_FRAMES:
+        raise ValueError("Stream too long for this chunk size")
+    cipher = AES.new(SECRET_KEY, AES.MODE_GCM, nonce=prefix + struct.pack(">I", index))
+    cipher.update(header + (b"\x01" if final else b"\x00"))
+    return cipher
+
+
+def parse_header(header):
+    """Validate a stream header; returns (chunk_size, nonce_prefix)."""
+    if len(header) != HEADER_SIZE or header[:4] != MAGIC:
+        raise DecryptionError("Not an encrypted stream")
+    chunk_size = struct.unpack(">I", header[4:8])[0]
+    if chunk_size <= 0:
+        raise DecryptionError("Invalid chunk size")
+    return chunk_size, header[8:16]
+
+
+def encrypt_stream(chunks, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Generator: encrypt an iterable of plaintext byte strings into the
+    framed format. Holds one chunk of look-ahead to mark the final frame.
+    """
+    prefix = os.urandom(8)
+    header = MAGIC + struct.pack(">I", chunk_size) + prefix
+    yield header
+
+    index = 0
+    pending = None
+    for chunk in rechunk(chunks, chunk_size):
+        if pending is not None:
+            ciphertext, tag = _frame_cipher(prefix, index, header, False).encrypt_and_digest(pending)
+            yield ciphertext + tag
+            index += 1
+        pending = chunk
+
+    # Always emit a final frame, even for empty input
+    ciphertext, tag = _frame_cipher(prefix, index, header, True).encrypt_and_digest(pending or b"")
+    yield ciphertext + tag
+
+
+def decrypt_frame(header, index, frame, final):
+    """Decrypt a single frame (used for random access)."""
+    _, prefix = parse_header(header)
+    if len(frame) < TAG_SIZE:
+        raise DecryptionError("Truncated frame")
+    cipher = _frame_cipher(prefix, index, header, final)
+    try:
+        return cipher.decrypt_and_verify(frame[:-TAG_SIZE], frame[-TAG_SIZE:])
+    except ValueError:
+        raise DecryptionError(f"Authentication failed for chunk {index}")
+
+
+def decrypt_stream(chunks):
+    """
+    Generator: decrypt an iterable of ciphertext byte strings, yielding
+    plaintext one frame at a time. The first bytes come out after two
+    frames have been read, never the whole object.
+    """
+    chunks = iter(chunks)
+    header = b""
+    for chunk in chunks:
+        header += chunk
+        if len(header) >= HEADER_SIZE:
+            break
+    rest, header = header[HEADER_SIZE:], header[:HEADER_SIZE]
+    chunk_size, _ = parse_header(header)
+
+    def ciphertext():
+        if rest:
+            yield rest
+        yield from chunks
+
+    index = 0
+    pending = None
+    for frame in rechunk(ciphertext(), chunk_size + TAG_SIZE):
+        if pending is not None:
+            yield decrypt_frame(header, index, pending, False)
+            index += 1
+        pending = frame
+
+    if pending is None:
+        raise DecryptionError("Truncated stream")
+    yield decrypt_frame(header, index, pending, True)
+
+
+def encrypted_size(plain_size, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Size of the framed ciphertext for a plaintext of `plain_size` bytes."""
+    frames = max(1, -(-plain_size // chunk_size))
+    return HEADER_SIZE + plain_size + frames * TAG_SIZE
+
+
+def ciphertext_range(start, end, plain_size, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Map the plaintext byte range [start, end) to the frames that hold it.
+    Returns (first_index, c_start, c_end) where c_start..c_end is the
+    inclusive ciphertext byte range to fetch.
+    """
+    frame_size = chunk_size + TAG_SIZE
+    first = start // chunk_size
+    last = (end - 1) // chunk_size
+    c_start = HEADER_SIZE + first * frame_size
+    c_end = min(HEADER_SIZE + (last + 1) * frame_size, encrypted_size(plain_size, chunk_size)) - 1
+    return first, c_start, c_end
+
+
+def decrypt_range(fetch, start, end, plain_size):
+    """
+    Generator: plaintext bytes [start, end) of an encrypted object without
+    reading the rest of it. `fetch((a, b))` must return an iterable of the
+    ciphertext bytes a..b inclusive (e.g. an S3 ranged GET).
+    """
+    header = b"".join(fetch((0, HEADER_SIZE - 1)))
+    chunk_size, _ = parse_header(header)
+    final = max(0, -(-plain_size // chunk_size) - 1)
+
+    first, c_start, c_end = ciphertext_range(start, end, plain_size, chunk_size)
+    skip = start - first * chunk_size
+    remaining = end - start
+
+    frames = rechunk(fetch((c_start, c_end)), chunk_size + TAG_SIZE)
+    for index, frame in enumerate(frames, start=first):
+        plaintext = decrypt_frame(header, index, frame, index == final)[skip:skip + remaining]
+        skip = 0
+        remaining -= len(plaintext)
+        if plaintext:
+            yield plaintext
+        if remaining <= 0:
+            return
+
+    raise DecryptionError("Truncated stream")
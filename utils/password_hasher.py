@@ -0,0 +1,194 @@
+# utils/password_hasher.py
+import time
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from werkzeug.security import generate_password_hash, check_password_hash, DEFAULT_PBKDF2_ITERATIONS
+from config import PASSWORD_HASH_CONFIG
+
+
+class HashingBusyError(Exception):
+    """Too many password hashes already queued; shed the request (503)."""
+
+
+# ---------------- Run in the worker processes ----------------
+def _hash(password, method):
+    return generate_password_hash(password, method=method)
+
+
+def _verify(stored_hash, password, method):
+    """(matches, fresh hash when stored_hash was made with other parameters)."""
+    if not check_password_hash(stored_hash, password):
+        return False, None
+    if stored_hash.split("$", 1)[0] != method:
+        return True, generate_password_hash(password, method=method)
+    return True, None
+
+
+def _normalize_method(method):
+    """werkzeug's method string with its defaults filled in, as it writes it into hashes."""
+    name, *args = method.split(":")
+    if name == "scrypt" and not args:
+        return "scrypt:32768:8:1"
+    if name == "scrypt" and len(args) == 3:
+        n, r, p = map(int, args)
+        return f"scrypt:{n}:{r}:{p}"
+    if name == "pbkdf2" and len(args) <= 2:
+        hash_name = args[0] if args else "sha256"
+        iterations = int(args[1]) if len(args) == 2 else DEFAULT_PBKDF2_ITERATIONS
+        return f"pbkdf2:{hash_name}:{iterations}"
+    raise ValueError(f"Invalid hash method '{method}'")
+
+
+class PasswordHasher:
+    """
+    Password hashing off the request threads.
+
+    KDFs like scrypt are slow on purpose (and scrypt:32768:8:1 takes
+    32 MiB per hash); unbounded, a burst of logins (every client
+    re-authenticating after a deploy) runs one KDF per request thread at
+    once. Here at most `max_pending` hashes may be queued or running:
+    past that a caller waits up to `queue_timeout` seconds and then gets
+    HashingBusyError, so a login storm is shed with 503s. The hashes run
+    in a pool of `workers` processes, which caps how many CPUs and how
+    much memory they take at a time. That is a bound, not a speed-up:
+    hashlib.scrypt releases the GIL, so inline hashing already runs in
+    parallel (compare both with benchmarks/bench_login.py). workers=0
+    hashes inline (still bounded), e.g. for tests.
+
+    `method` is werkzeug's method string ("scrypt:32768:8:1",
+    "pbkdf2:sha256:600000", ...). verify() also returns a new hash when
+    the stored one used different parameters, so raising the cost
+    upgrades users as they log in.
+
+    Call start() at startup, while the process has a single thread: a
+    worker forked once request, group-commit or S3 threads are running
+    can inherit a lock one of them holds and hang. Without start() the
+    pool is forked on first use (fine for scripts). If a worker dies
+    later, the pool is not re-forked from the running server; hashing
+    falls back to inline, still bounded by `max_pending`.
+    """
+
+    def __init__(self, method="scrypt:32768:8:1", workers=2, max_pending=64, queue_timeout=2.0):
+        if max_pending < 1:
+            raise ValueError("max_pending must be at least 1")
+        self.workers = workers
+        self.max_pending = max_pending
+        self.queue_timeout = queue_timeout
+        self.method = _normalize_method(method)
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._pool = None
+        self._lock = threading.Lock()
+
+        self._pending = 0
+        self._hashes = 0
+        self._verifies = 0
+        self._rehashes = 0
+        self._rejected = 0
+        self._busy_time = 0.0
+
+    def start(self):
+        """Fork the worker processes now (see the class docstring)."""
+        if self.workers:
+            self._executor().submit(int).result()
+
+    def hash(self, password):
+        result = self._run(_hash, password, self.method)
+        with self._lock:
+            self._hashes += 1
+        return result
+
+    def verify(self, stored_hash, password):
+        """(matches, new hash to store or None)."""
+        ok, new_hash = self._run(_verify, stored_hash, password, self.method)
+        with self._lock:
+            self._verifies += 1
+            if new_hash:
+                self._rehashes += 1
+        return ok, new_hash
+
+    def stats(self):
+        with self._lock:
+            done = self._hashes + self._verifies
+            return {
+                "workers": self.workers,
+                "method": self.method,
+                "pending": self._pending,
+                "max_pending": self.max_pending,
+                "hashes": self._hashes,
+                "verifies": self._verifies,
+                "rehashes": self._rehashes,
+                "rejected": self._rejected,
+                "avg_ms": round(self._busy_time / done * 1000, 3) if done else 0.0
+            }
+
+    def close(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    # ---------------------------------------------------------
+    # Internals
+    # ---------------------------------------------------------
+    def _run(self, fn, *args):
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            with self._lock:
+                self._rejected += 1
+            raise HashingBusyError(f"More than {self.max_pending} password hashes pending")
+
+        started = time.monotonic()
+        with self._lock:
+            self._pending += 1
+        try:
+            if not self.workers:
+                return fn(*args)
+            pool = self._executor()
+            try:
+                return pool.submit(fn, *args).result()
+            except BrokenProcessPool:
+                # A worker died (e.g. OOM-killed); forking a new pool from
+                # this now-threaded process could hang it, so go inline
+                self._discard(pool)
+                return fn(*args)
+        finally:
+            with self._lock:
+                self._pending -= 1
+                self._busy_time += time.monotonic() - started
+            self._slots.release()
+
+    def _executor(self):
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    def _discard(self, pool):
+        with self._lock:
+            self.workers = 0
+            if self._pool is pool:
+                self._pool = None
+        print("❌ Password hashing worker died; hashing inline from now on")
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+# ---------------------------------------------------------
+# Shared hasher (auth routes)
+# ---------------------------------------------------------
+_hasher = None
+_hasher_lock = threading.Lock()
+
+
+def get_hasher():
+    global _hasher
+    if _hasher is None:
+        with _hasher_lock:
+            if _hasher is None:
+                _hasher = PasswordHasher(**PASSWORD_HASH_CONFIG)
+    return _hasher
+
+
+def hasher_stats():
+    """Stats of the shared hasher, or None if nothing has used it yet."""
+    return _hasher.stats() if _hasher is not None else None
@@ -1,37 +1,142 @@
 # utils/s3_helper.py
 import os
 import boto3
-import io
 from botocore.exceptions import ClientError
+from config import S3_TRANSFER_CONFIG
+from utils.s3_transfer import MultipartUploader
 
 AWS_REGION = os.getenv("AWS_DEFAULT_REGION", "ap-south-1")
 BUCKET_NAME = "securecloud-file-storage-sahil"
+# Deduplicated content is stored once per user under its SHA-256
+BLOB_PREFIX = "blobs/sha256/"
 
 # Create boto3 S3 client (credentials auto-read from env or ~/.aws/credentials)
 s3_client = boto3.client("s3", region_name=AWS_REGION)
 
 
+def blob_key_for(user_id, content_hash: str, *encodings):
+    """
+    S3 key of the object holding this user's content with this hash.
+    Scoped per user: a skipped upload is observable (response time, no
+    compression stats), so sharing blobs across users would tell one
+    user what another has stored. Stored encodings (e.g. "enc") are part
+    of the key so formats never mix.
+    """
+    suffix = "".join(f".{e}" for e in encodings if e)
+    return f"{BLOB_PREFIX}user_{user_id}/{content_hash[:2]}/{content_hash}{suffix}"
+
+
 # -------------------------------------------------------------
-# 1️⃣ Upload raw bytes safely
+# 1️⃣ Stream a file-like object (parallel multipart when large)
 # -------------------------------------------------------------
-def upload_bytes(data: bytes, s3_key: str):
-    """Upload raw bytes to S3 safely."""
+def get_uploader(**overrides):
+    """Multipart engine bound to our client, tuned from S3_TRANSFER_CONFIG."""
+    settings = dict(S3_TRANSFER_CONFIG, **overrides)
+    return MultipartUploader(s3_client, BUCKET_NAME, **settings)
+
+
+def upload_stream(fileobj, s3_key: str, **overrides):
+    """
+    Upload a file-like object to S3 as it is read, in bounded parts.
+    Returns the number of bytes sent so callers don't need len(data).
+    """
     try:
-        fileobj = io.BytesIO(data)
-        s3_client.upload_fileobj(fileobj, BUCKET_NAME, s3_key)
-        return True
+        return get_uploader(**overrides).upload(fileobj, s3_key)
     except ClientError as e:
         print("❌ S3 Upload Error:", e)
         raise
 
 
+# -------------------------------------------------------------
+# 1️⃣b Low-level multipart calls (resumable uploads)
+# -------------------------------------------------------------
+def create_multipart_upload(s3_key: str):
+    try:
+        resp = s3_client.create_multipart_upload(Bucket=BUCKET_NAME, Key=s3_key)
+        return resp["UploadId"]
+    except ClientError as e:
+        print("❌ S3 Multipart Create Error:", e)
+        raise
+
+
+def upload_part(s3_key: str, upload_id: str, part_number: int, data: bytes):
+    """Upload a single part (retried by the transfer engine); returns its ETag."""
+    try:
+        return get_uploader().upload_part(s3_key, upload_id, part_number, data)
+    except ClientError as e:
+        print("❌ S3 Upload Part Error:", e)
+        raise
+
+
+def complete_multipart_upload(s3_key: str, upload_id: str, parts):
+    """`parts` is a list of {"PartNumber": n, "ETag": etag} in order."""
+    try:
+        s3_client.complete_multipart_upload(
+            Bucket=BUCKET_NAME,
+            Key=s3_key,
+            UploadId=upload_id,
+            MultipartUpload={"Parts": parts},
+        )
+        return True
+    except ClientError as e:
+        print("❌ S3 Multipart Complete Error:", e)
+        raise
+
+
+def abort_multipart_upload(s3_key: str, upload_id: str):
+    try:
+        s3_client.abort_multipart_upload(Bucket=BUCKET_NAME, Key=s3_key, UploadId=upload_id)
+        return True
+    except ClientError as e:
+        print("❌ S3 Multipart Abort Error:", e)
+        raise
+
+
 # -------------------------------------------------------------
 # 2️⃣ Generate presigned URL for downloading
 # -------------------------------------------------------------
-def generate_presigned_url(s3_key: str, expires=900):
+def generate_presigned_url(s3_key: str, expires=900, filename=None):
+    """`filename` sets the download name when the key is a content-hash blob."""
+    params = {"Bucket": BUCKET_NAME, "Key": s3_key}
+    if filename:
+        params["ResponseContentDisposition"] = f'attachment; filename="{filename}"'
     try:
         return s3_client.generate_presigned_url(
             "get_object",
+            Params=params,
+            ExpiresIn=expires,
+        )
+    except ClientError as e:
+        print("❌ Presigned URL Error:", e)
+        raise
+
+
+# -------------------------------------------------------------
+# 2️⃣a Read an object as a stream (server-side downloads)
+# -------------------------------------------------------------
+def get_object_stream(s3_key: str, byte_range=None):
+    """
+    get_object response for `s3_key`; read it through resp["Body"].
+    `byte_range` is an inclusive (start, end) tuple, end may be None.
+    """
+    params = {"Bucket": BUCKET_NAME, "Key": s3_key}
+    if byte_range:
+        start, end = byte_range
+        params["Range"] = f"bytes={start}-{'' if end is None else end}"
+    try:
+        return s3_client.get_object(**params)
+    except ClientError as e:
+        print("❌ Get Object Error:", e)
+        raise
+
+
+# -------------------------------------------------------------
+# 2️⃣b Presigned URLs for direct-to-S3 uploads
+# -------------------------------------------------------------
+def generate_presigned_upload_url(s3_key: str, expires=900):
+    try:
+        return s3_client.generate_presigned_url(
+            "put_object",
             Params={"Bucket": BUCKET_NAME, "Key": s3_key},
             ExpiresIn=expires,
         )
@@ -40,6 +145,66 @@ def generate_presigned_url(s3_key: str, expires=900):
         raise
 
 
+def generate_presigned_part_urls(s3_key: str, upload_id: str, part_count: int, expires=3600):
+    """One presigned upload_part URL per part number (1..part_count)."""
+    try:
+        return [
+            {
+                "part_number": n,
+                "url": s3_client.generate_presigned_url(
+                    "upload_part",
+                    Params={"Bucket": BUCKET_NAME, "Key": s3_key,
+                            "UploadId": upload_id, "PartNumber": n},
+                    ExpiresIn=expires,
+                ),
+            }
+            for n in range(1, part_count + 1)
+        ]
+    except ClientError as e:
+        print("❌ Presigned URL Error:", e)
+        raise
+
+
+def head_object(s3_key: str):
+    """Return object metadata, or None if the key does not exist."""
+    try:
+        return s3_client.head_object(Bucket=BUCKET_NAME, Key=s3_key)
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+            return None
+        print("❌ Head Object Error:", e)
+        raise
+
+
+# -------------------------------------------------------------
+# 3️⃣b Delete many objects (DeleteObjects, 1000 keys per call)
+# -------------------------------------------------------------
+DELETE_BATCH_SIZE = 1000
+
+
+def delete_s3_objects(s3_keys):
+    """
+    Delete keys in batches of 1000. Returns {key: error message} for the
+    keys S3 refused; an empty dict means everything was deleted.
+    """
+    s3_keys = list(s3_keys)
+    failed = {}
+    for i in range(0, len(s3_keys), DELETE_BATCH_SIZE):
+        batch = s3_keys[i:i + DELETE_BATCH_SIZE]
+        try:
+            resp = s3_client.delete_objects(
+                Bucket=BUCKET_NAME,
+                Delete={"Objects": [{"Key": k} for k in batch], "Quiet": True},
+            )
+        except ClientError as e:
+            print("❌ Bulk Delete Error:", e)
+            failed.update({k: str(e) for k in batch})
+            continue
+        for err in resp.get("Errors", []):
+            failed[err["Key"]] = err.get("Message") or err.get("Code", "Delete failed")
+    return failed
+
+
 # -------------------------------------------------------------
 # 3️⃣ Delete S3 object
 # -------------------------------------------------------------
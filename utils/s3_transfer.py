@@ -0,0 +1,150 @@
+# utils/s3_transfer.py
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_EXCEPTION
+from botocore.exceptions import ClientError, BotoCoreError
+from utils.stream_helper import read_exact
+
+MIN_PART_SIZE = 5 * 1024 * 1024
+MAX_PARTS = 10000
+
+
+class MultipartUploader:
+    """
+    Parallel S3 multipart upload engine.
+
+    Parts are read sequentially from the source stream and uploaded from a
+    bounded worker pool. At most `max_concurrency` parts are in flight, so
+    memory stays around (max_concurrency + 1) * part_size regardless of
+    the object size. Failed parts are retried with exponential backoff; if
+    a part still fails the multipart upload is aborted so S3 keeps no
+    orphaned parts.
+    """
+
+    def __init__(self, client, bucket, part_size=16 * 1024 * 1024,
+                 multipart_threshold=16 * 1024 * 1024, max_concurrency=8,
+                 max_retries=3, retry_backoff=0.5):
+        if part_size < MIN_PART_SIZE:
+            raise ValueError(f"part_size must be at least {MIN_PART_SIZE} bytes")
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+        self.client = client
+        self.bucket = bucket
+        self.part_size = part_size
+        self.multipart_threshold = multipart_threshold
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+
+    # ---------------------------------------------------------
+    # Public API
+    # ---------------------------------------------------------
+    def upload(self, fileobj, s3_key, extra_args=None):
+        """
+        Upload a file-like object to `s3_key`. Small objects (below the
+        multipart threshold) go up as a single PUT. Returns bytes sent.
+        """
+        extra_args = extra_args or {}
+        head = read_exact(fileobj, max(self.multipart_threshold, 1))
+        if len(head) < self.multipart_threshold:
+            self._retry(lambda: self.client.put_object(
+                Bucket=self.bucket, Key=s3_key, Body=head, **extra_args))
+            return len(head)
+
+        resp = self.client.create_multipart_upload(Bucket=self.bucket, Key=s3_key, **extra_args)
+        upload_id = resp["UploadId"]
+        try:
+            parts, size = self._upload_parts(fileobj, head, s3_key, upload_id)
+            self.client.complete_multipart_upload(
+                Bucket=self.bucket,
+                Key=s3_key,
+                UploadId=upload_id,
+                MultipartUpload={"Parts": parts},
+            )
+            return size
+        except BaseException:
+            self.abort(s3_key, upload_id)
+            raise
+
+    def upload_part(self, s3_key, upload_id, part_number, data):
+        """Upload one part with retries; returns the part's ETag."""
+        resp = self._retry(lambda: self.client.upload_part(
+            Bucket=self.bucket,
+            Key=s3_key,
+            UploadId=upload_id,
+            PartNumber=part_number,
+            Body=data,
+        ))
+        return resp["ETag"]
+
+    def abort(self, s3_key, upload_id):
+        try:
+            self.client.abort_multipart_upload(Bucket=self.bucket, Key=s3_key, UploadId=upload_id)
+        except (ClientError, BotoCoreError) as e:
+            print("❌ S3 Abort Multipart Error:", e)
+
+    # ---------------------------------------------------------
+    # Internals
+    # ---------------------------------------------------------
+    def _iter_parts(self, fileobj, head):
+        # The threshold peek may hold more than one part's worth of data
+        view = memoryview(head)
+        while len(view) >= self.part_size:
+            yield bytes(view[:self.part_size])
+            view = view[self.part_size:]
+        pending = bytes(view)
+        while True:
+            chunk = read_exact(fileobj, self.part_size - len(pending))
+            data = pending + chunk
+            pending = b""
+            if not data:
+                return
+            yield data
+            if len(data) < self.part_size:
+                return
+
+    def _upload_parts(self, fileobj, head, s3_key, upload_id):
+        slots = threading.BoundedSemaphore(self.max_concurrency)
+        futures = {}
+        size = 0
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as pool:
+            try:
+                for part_number, data in enumerate(self._iter_parts(fileobj, head), start=1):
+                    if part_number > MAX_PARTS:
+                        raise ValueError("Object needs more than 10,000 parts; raise part_size")
+                    size += len(data)
+                    slots.acquire()
+                    # Stop reading as soon as any part has failed for good
+                    failed = [f for f in futures if f.done() and f.exception()]
+                    if failed:
+                        slots.release()
+                        raise failed[0].exception()
+                    future = pool.submit(self.upload_part, s3_key, upload_id, part_number, data)
+                    future.add_done_callback(lambda _f: slots.release())
+                    futures[future] = part_number
+
+                done, _ = wait(futures, return_when=FIRST_EXCEPTION)
+                for f in done:
+                    if f.exception():
+                        raise f.exception()
+            except BaseException:
+                for f in futures:
+                    f.cancel()
+                raise
+
+        parts = [{"PartNumber": n, "ETag": f.result()} for f, n in futures.items()]
+        parts.sort(key=lambda p: p["PartNumber"])
+        return parts, size
+
+    def _retry(self, fn):
+        attempt = 0
+        while True:
+            try:
+                return fn()
+            except (ClientError, BotoCoreError) as e:
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise
+                print(f"⚠️ S3 request failed (attempt {attempt}), retrying:", e)
+                time.sleep(self.retry_backoff * (2 ** (attempt - 1)))
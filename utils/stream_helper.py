@@ -0,0 +1,99 @@
+# utils/stream_helper.py
+import io
+import hashlib
+import tempfile
+
+# Size of each read from a request/S3 stream. Keeps per-request memory flat.
+CHUNK_SIZE = 1024 * 1024  # 1 MiB
+
+
+def iter_chunks(fileobj, chunk_size=CHUNK_SIZE):
+    """Yield successive chunks from a file-like object until EOF."""
+    while True:
+        chunk = fileobj.read(chunk_size)
+        if not chunk:
+            break
+        yield chunk
+
+
+def read_exact(fileobj, size):
+    """
+    Read up to `size` bytes, looping over short reads (sockets and
+    werkzeug streams may return less than asked). Returns fewer bytes
+    only at EOF.
+    """
+    parts = []
+    remaining = size
+    while remaining > 0:
+        chunk = fileobj.read(remaining)
+        if not chunk:
+            break
+        parts.append(chunk)
+        remaining -= len(chunk)
+    return b"".join(parts)
+
+
+def spool_and_hash(fileobj, algorithm="sha256", max_memory=CHUNK_SIZE):
+    """
+    Hash a stream in bounded chunks and return (seekable_stream, hexdigest,
+    size) with the stream rewound to where it started. Seekable inputs
+    (werkzeug already spools uploads to a temp file) are hashed in place;
+    anything else is copied to a SpooledTemporaryFile on the way through,
+    so nothing can be forwarded until the input has been read to the end.
+    """
+    h = hashlib.new(algorithm)
+    size = 0
+
+    seekable = getattr(fileobj, "seekable", None)
+    if seekable and seekable():
+        start = fileobj.tell()
+        for chunk in iter_chunks(fileobj):
+            h.update(chunk)
+            size += len(chunk)
+        fileobj.seek(start)
+        return fileobj, h.hexdigest(), size
+
+    spool = tempfile.SpooledTemporaryFile(max_size=max_memory)
+    for chunk in iter_chunks(fileobj):
+        h.update(chunk)
+        size += len(chunk)
+        spool.write(chunk)
+    spool.seek(0)
+    return spool, h.hexdigest(), size
+
+
+def rechunk(chunks, size):
+    """
+    Re-slice an iterable of byte strings into pieces of exactly `size`
+    bytes (the last one may be shorter). Holds at most one piece.
+    """
+    buf = bytearray()
+    for chunk in chunks:
+        buf += chunk
+        while len(buf) >= size:
+            yield bytes(buf[:size])
+            del buf[:size]
+    if buf:
+        yield bytes(buf)
+
+
+class IterStream(io.RawIOBase):
+    """Read-only file-like view over an iterator of byte strings."""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._leftover = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._leftover:
+            try:
+                self._leftover = next(self._chunks)
+            except StopIteration:
+                return 0
+        n = min(len(b), len(self._leftover))
+        b[:n] = self._leftover[:n]
+        self._leftover = self._leftover[n:]
+        return n
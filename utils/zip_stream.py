@@ -0,0 +1,58 @@
+# utils/zip_stream.py
+import zipfile
+
+
+class _ZipSink:
+    """
+    Write-only, non-seekable target for ZipFile. zipfile notices the
+    missing seek() and falls back to data descriptors, so entries can be
+    written without knowing their CRC up front.
+    """
+
+    def __init__(self):
+        self._buf = bytearray()
+        self._pos = 0
+
+    def write(self, data):
+        self._buf += data
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._pos
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = bytes(self._buf)
+        self._buf.clear()
+        return data
+
+
+def stream_zip(members, compression=zipfile.ZIP_STORED):
+    """
+    Generator: build a ZIP archive incrementally and yield it as bytes.
+
+    `members` is an iterable of (name, size, date_time, chunks) where
+    `chunks` yields the member's content. Only the current chunk is held
+    in memory. Zip64 records are written automatically for members over
+    4 GiB, archives over 4 GiB and more than 65,535 entries.
+    """
+    sink = _ZipSink()
+    with zipfile.ZipFile(sink, mode="w", compression=compression, allowZip64=True) as zf:
+        for name, size, date_time, chunks in members:
+            info = zipfile.ZipInfo(name, date_time=date_time)
+            info.compress_type = compression
+            # Known size lets zipfile pick the zip64 local header up front
+            info.file_size = size
+            with zf.open(info, mode="w") as dest:
+                for chunk in chunks:
+                    dest.write(chunk)
+                    data = sink.drain()
+                    if data:
+                        yield data
+            data = sink.drain()
+            if data:
+                yield data
+    yield sink.drain()